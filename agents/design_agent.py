@@ -1,4 +1,5 @@
 import concurrent.futures
+import contextvars
 import json
 import re
 from pathlib import Path
@@ -7,6 +8,10 @@ from typing import Any
 from google import genai
 from google.genai import types
 from utils.genai_retry import call_with_retry
+from utils.llm_cache import cached_generate_content, cached_image_bytes
+from utils.rate_limiter import rate_limited
+from utils.tracing import span
+from utils.usage_ledger import TokenUsage
 
 PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
 
@@ -23,25 +28,36 @@ def _repair_json_array(raw: str) -> list:
     return json.loads(text[start:end + 1])
 
 
+IMAGEN_MODEL = "imagen-4.0-ultra-generate-001"
+
+
 def _generate_one(req, client, save_dir):
-    def _call_imagen(prompt):
-        result = client.models.generate_images(
-            model="imagen-4.0-ultra-generate-001",
-            prompt=prompt,
-            config=types.GenerateImagesConfig(
-                numberOfImages=1,
-                aspectRatio="16:9",
-                outputMimeType="image/png",
-                personGeneration=types.PersonGeneration.ALLOW_ALL,
-            ),
+    config = types.GenerateImagesConfig(
+        numberOfImages=1,
+        aspectRatio="16:9",
+        outputMimeType="image/png",
+        personGeneration=types.PersonGeneration.ALLOW_ALL,
+    )
+
+    def _call_imagen(prompt) -> bytes:
+        # Shared bucket: the 4 Imagen threads of every running pipeline draw from one quota
+        result = rate_limited(
+            "imagen", IMAGEN_MODEL,
+            lambda: client.models.generate_images(model=IMAGEN_MODEL, prompt=prompt, config=config),
+            usage=lambda r: TokenUsage(images=len(r.generated_images or [])),
+            agent="design",
         )
         if not result.generated_images:
             raise RuntimeError("Imagen returned no images")
-        return result.generated_images[0]
+        return result.generated_images[0].image.image_bytes
 
     try:
         print(f"  -> Generating: {req.get('key', 'unknown')} ({req.get('style', '')})")
-        generated = call_with_retry(lambda: _call_imagen(req["prompt"]), max_retries=2)
+        image_bytes = call_with_retry(
+            lambda: cached_image_bytes("design", IMAGEN_MODEL, req["prompt"], config,
+                                       lambda: _call_imagen(req["prompt"])),
+            max_retries=2,
+        )
 
         local_path = None
         url = None
@@ -49,7 +65,10 @@ def _generate_one(req, client, save_dir):
             save_dir.mkdir(parents=True, exist_ok=True)
             img_filename = f"{req['key']}.png"
             img_dest = save_dir / img_filename
-            img_dest.write_bytes(generated.image.image_bytes)
+            # Replace rather than write in place: a re-run's img_dest may be a hard link into the blob store
+            tmp = img_dest.with_suffix(img_dest.suffix + ".tmp")
+            tmp.write_bytes(image_bytes)
+            tmp.replace(img_dest)
             local_path = str(img_dest)
             print(f"  saved -> {img_dest.name}")
 
@@ -66,6 +85,14 @@ def _generate_one(req, client, save_dir):
         return None
 
 
+def _generate_one_traced(req, client, save_dir):
+    with span("design_image", key=req.get("key", "unknown")) as s:
+        result = _generate_one(req, client, save_dir)
+        if result is None:
+            s["outcome"] = "error"
+        return result
+
+
 class DesignAgent:
     def __init__(self, client: genai.Client | None = None, api_key: str | None = None):
         if client is not None:
@@ -78,7 +105,8 @@ class DesignAgent:
 
     def run(self, prd_dict: dict, max_images: int = 4, save_dir: Path | None = None, reference_images: list[str] | None = None) -> list[dict[str, Any]]:
         prompt_template = (PROMPTS_DIR / "design_agent.txt").read_text(encoding="utf-8")
-        prd_summary = json.dumps(prd_dict, indent=2)[:3000]
+        # Without the artifact timestamp, so identical briefs make identical requests (LLM cache, cassettes)
+        prd_summary = json.dumps({k: v for k, v in prd_dict.items() if k != "created_at"}, indent=2)[:3000]
 
         text_content = f"{prompt_template}\n\nPRD:\n{prd_summary}"
 
@@ -100,13 +128,15 @@ class DesignAgent:
             contents = text_content
 
         def _call():
-            return self.client.models.generate_content(
+            return cached_generate_content(
+                self.client, "design",
                 model="gemini-2.5-flash",
                 contents=contents,
                 config={
                     "response_mime_type": "application/json",
                     "temperature": 0.7,
                 },
+                validate=_repair_json_array,
             )
 
         response = call_with_retry(_call, max_retries=2)
@@ -122,7 +152,11 @@ class DesignAgent:
         print(f"DesignAgent: Generating {len(image_requests)} images with Imagen...")
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [executor.submit(_generate_one, req, self.client, save_dir) for req in image_requests]
+            # Each image runs in a copy of this context so its spans join the design stage
+            futures = [
+                executor.submit(contextvars.copy_context().run, _generate_one_traced, req, self.client, save_dir)
+                for req in image_requests
+            ]
             results = [f.result() for f in concurrent.futures.as_completed(futures) if f.result() is not None]
 
         print(f"DesignAgent: {len(results)}/{len(image_requests)} images generated.")
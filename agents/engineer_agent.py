@@ -18,7 +18,13 @@ from pydantic import ValidationError
 
 from schemas.plan_schema import Task
 from schemas.engineering_schema import EngineeringResult, FileArtifact
+from utils.cassettes import CassetteAnthropic, cassette_mode
+from utils.fake_models import FakeAnthropic, fake_models_enabled
+from utils.llm_cache import LLMCache, cached_generate_content, get_llm_cache
 from utils.offline_engineer_scaffold import build_vite_react_ts_scaffold
+from utils.rate_limiter import estimate_tokens, rate_limited
+from utils.tracing import span
+from utils.usage_ledger import anthropic_token_usage, retry_scope
 
 PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
 
@@ -109,7 +115,8 @@ def _fix_backslashes_in_strings(candidate: str) -> str:
     return "".join(out)
 
 
-def _repair_json(raw: str) -> dict:
+def _repair_json_passes(raw: str) -> tuple[dict, int]:
+    """Parse model JSON, escalating through repair passes. Returns (data, pass number)."""
     text = raw.strip()
     text = re.sub(r"^```json\s*", "", text, flags=re.IGNORECASE)
     text = re.sub(r"^```\s*", "", text)
@@ -127,19 +134,19 @@ def _repair_json(raw: str) -> dict:
 
     # Pass 1: direct parse
     try:
-        return json.loads(candidate)
+        return json.loads(candidate), 1
     except json.JSONDecodeError:
         pass
 
     # Pass 2: regex strip invalid backslash escapes
     try:
-        return json.loads(re.sub(r'\\(?!["\\/bfnrtu])', "", candidate))
+        return json.loads(re.sub(r'\\(?!["\\/bfnrtu])', "", candidate)), 2
     except json.JSONDecodeError:
         pass
 
     # Pass 3: char-walking backslash fixer (context-aware, only inside strings)
     try:
-        return json.loads(_fix_backslashes_in_strings(candidate))
+        return json.loads(_fix_backslashes_in_strings(candidate)), 3
     except json.JSONDecodeError:
         pass
 
@@ -148,7 +155,7 @@ def _repair_json(raw: str) -> dict:
         try:
             repaired = repair_json(candidate, return_objects=True)
             if isinstance(repaired, dict):
-                return repaired
+                return repaired, 4
         except Exception:
             pass
 
@@ -157,7 +164,7 @@ def _repair_json(raw: str) -> dict:
         aggressive = candidate.replace('\\', '\\\\')
         for seq in ['\\"', '\\\\', '\\/', '\\b', '\\f', '\\n', '\\r', '\\t']:
             aggressive = aggressive.replace('\\\\' + seq[1], seq)
-        return json.loads(aggressive)
+        return json.loads(aggressive), 5
     except json.JSONDecodeError as e:
         raise RuntimeError(
             "EngineerAgent: JSON repair failed.\n\n"
@@ -166,6 +173,12 @@ def _repair_json(raw: str) -> dict:
         ) from e
 
 
+def _repair_json(raw: str) -> dict:
+    with span("json_repair", chars=len(raw)) as s:
+        data, s["pass"] = _repair_json_passes(raw)
+        return data
+
+
 _ENGINEER_MAX_RETRIES = 5
 
 _IMG_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
@@ -189,9 +202,21 @@ def _load_reference_images(kit_archetype: str) -> list[tuple[str, bytes, str]]:
     return images
 
 
-def _run_claude(contents: str, ref_images: list[tuple[str, bytes, str]] | None = None) -> EngineeringResult:
+def _anthropic_client():
+    """Claude client: simulated (MODEL_BACKEND=fake), replayed/recorded (replay/record) or live."""
+    if fake_models_enabled():
+        return FakeAnthropic()
+    mode = cassette_mode()
+    if mode == "replay":
+        return CassetteAnthropic()
     import anthropic
+
     client = anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
+    return CassetteAnthropic(client) if mode == "record" else client
+
+
+def _run_claude(contents: str, ref_images: list[tuple[str, bytes, str]] | None = None) -> EngineeringResult:
+    import anthropic
 
     # Build multimodal content if reference images provided
     message_content: list | str = contents
@@ -207,27 +232,49 @@ def _run_claude(contents: str, ref_images: list[tuple[str, bytes, str]] | None =
             message_content.append({"type": "text", "text": f"[Reference: {filename}]"})
         message_content.append({"type": "text", "text": "--- END REFERENCE SCREENSHOTS ---\nStudy these references carefully. Match the layout structure, visual density, and polish level shown above."})
 
+    cache = get_llm_cache()
+    use_cache = cache.enabled_for("engineer")
+    cache_key = LLMCache.key("engineer", "claude-opus-4-6", message_content, {"max_tokens": 64000})
+    if use_cache:
+        cached = cache.get(cache_key, "engineer")
+        if cached is not None:
+            result = EngineeringResult.model_validate(_repair_json(cached["text"]))
+            result.files = _deduplicate_files(result.files)
+            return result
+
+    client = _anthropic_client()
     last_err = None
     for attempt in range(_ENGINEER_MAX_RETRIES):
         if attempt > 0:
             wait = min(4 * (2 ** (attempt - 1)), 30)  # 4s, 8s, 16s, 30s
             print(f"EngineerAgent (Claude): retry {attempt}/{_ENGINEER_MAX_RETRIES} in {wait}s...")
-            time.sleep(wait)
+            with span("retry_backoff", attempt=attempt, seconds=wait):
+                time.sleep(wait)
         try:
-            raw = ""
-            usage = None
-            with client.messages.stream(
-                model="claude-opus-4-6",
-                max_tokens=64000,
-                messages=[{"role": "user", "content": message_content}],
-            ) as stream:
-                for text in stream.text_stream:
-                    raw += text
-                final_message = stream.get_final_message()
-                usage = final_message.usage if final_message else None
+            def _stream():
+                raw = ""
+                with client.messages.stream(
+                    model="claude-opus-4-6",
+                    max_tokens=64000,
+                    messages=[{"role": "user", "content": message_content}],
+                ) as stream:
+                    for text in stream.text_stream:
+                        raw += text
+                    final_message = stream.get_final_message()
+                return raw, (final_message.usage if final_message else None)
+
+            with retry_scope(attempt):
+                raw, usage = rate_limited(
+                    "anthropic", "claude-opus-4-6", _stream,
+                    tokens=estimate_tokens(message_content),
+                    usage=lambda r: anthropic_token_usage(r[1]),
+                    agent="engineer",
+                )
             data = _repair_json(raw)
             result = EngineeringResult.model_validate(data)
             result.files = _deduplicate_files(result.files)
+            if use_cache:
+                cache.put(cache_key, {"text": raw})
             if usage:
                 result.usage = usage
             return result
@@ -284,16 +331,19 @@ def _run_gemini(client: genai.Client, contents: str, ref_images: list[tuple[str,
                 parts.append(types.Part.from_text(text="--- END REFERENCE SCREENSHOTS ---\nStudy these references carefully. Match the layout structure, visual density, and polish level shown above."))
                 gemini_contents = parts
 
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=gemini_contents,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": EngineeringResult,
-                    "temperature": 0.7,
-                    "max_output_tokens": 65536,
-                },
-            )
+            with retry_scope(attempt):
+                response = cached_generate_content(
+                    client, "engineer",
+                    model="gemini-2.5-flash",
+                    contents=gemini_contents,
+                    config={
+                        "response_mime_type": "application/json",
+                        "response_schema": EngineeringResult,
+                        "temperature": 0.7,
+                        "max_output_tokens": 65536,
+                    },
+                    validate=lambda text: EngineeringResult.model_validate(_repair_json(text)),
+                )
 
             # Try structured output first, but validate it
             if response.parsed is not None:
@@ -323,7 +373,8 @@ def _run_gemini(client: genai.Client, contents: str, ref_images: list[tuple[str,
             if is_rate_limit or is_validation:
                 wait = 2 ** attempt  # 1s, 2s, 4s
                 print(f"EngineerAgent: attempt {attempt + 1} failed ({type(e).__name__}), retrying in {wait}s...")
-                time.sleep(wait)
+                with span("retry_backoff", attempt=attempt + 1, seconds=wait):
+                    time.sleep(wait)
                 continue
 
             # Non-retryable error — raise immediately
@@ -439,9 +490,14 @@ def _dedup_style_css(base_css: str, style_css: str) -> str:
         return style_css
 
 
+ENGINEER_MODELS = ("gemini", "claude")
+
+
 class EngineerAgent:
-    def __init__(self, client: genai.Client | None):
+    def __init__(self, client: genai.Client | None, model: str | None = None):
         self.client = client
+        # Per-run override of ENGINEER_MODEL (e.g. re-running a failed build on another model)
+        self.model = model
 
     def run(self, task: Task, user_prompt: str = None, existing_code: str = None, reference_images: list[str] | None = None) -> EngineeringResult:
         if task.execution_hint != "engineer":
@@ -560,7 +616,7 @@ class EngineerAgent:
 
         # Model selection via ENGINEER_MODEL env var
         # Options: "gemini" (default), "claude", "openai"
-        model_choice = os.getenv("ENGINEER_MODEL", "gemini").lower().strip()
+        model_choice = (self.model or os.getenv("ENGINEER_MODEL", "gemini")).lower().strip()
 
         if model_choice == "claude":
             result = _run_claude(contents, ref_images=ref_images or None)
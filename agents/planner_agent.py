@@ -6,6 +6,9 @@ from google.genai import types
 from schemas.plan_schema import Plan
 from schemas.prd_schema import PRDArtifact
 from utils.genai_retry import call_with_retry
+from utils.tracing import span
+from utils.usage_ledger import retry_scope
+from utils.llm_cache import cached_generate_content
 
 PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
 
@@ -65,7 +68,8 @@ class PlannerAgent:
             contents = text_content
 
         def _call():
-            return self.client.models.generate_content(
+            return cached_generate_content(
+                self.client, "planner",
                 model="gemini-2.5-flash",
                 contents=contents,
                 config={
@@ -76,12 +80,15 @@ class PlannerAgent:
             )
         
         for parse_attempt in range(3):
-            response = call_with_retry(_call, max_retries=2)
+            with retry_scope(parse_attempt):
+                response = call_with_retry(_call, max_retries=2)
             if response.parsed is not None:
                 return response.parsed
             if parse_attempt < 2:
                 print(f"PlannerAgent: schema parse failed, retrying (attempt {parse_attempt + 1}/3)...")
-                import time; time.sleep(1)
+                import time
+                with span("retry_backoff", attempt=parse_attempt + 1, seconds=1, reason="schema_parse"):
+                    time.sleep(1)
         raise RuntimeError("Architecture Agent could not produce a valid build plan after 3 attempts. Please try rephrasing your request.")
     
     def run_from_prd_artifact(
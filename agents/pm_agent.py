@@ -4,6 +4,9 @@ from datetime import datetime, timezone
 from google import genai
 from schemas.prd_schema import PRD, PRDArtifact
 from utils.genai_retry import call_with_retry
+from utils.tracing import span
+from utils.usage_ledger import retry_scope
+from utils.llm_cache import cached_generate_content
 
 
 def _utc_now_iso() -> str:
@@ -86,7 +89,8 @@ class PMAgent:
         contents = f"{system}\n\nUser message: {user_message}"
 
         def _call():
-            return self.client.models.generate_content(
+            return cached_generate_content(
+                self.client, "pm",
                 model="gemini-2.5-flash",
                 contents=contents,
                 config={
@@ -125,7 +129,8 @@ class PMAgent:
         contents = f"{SYSTEM_PROMPT}\n\nClient requirements:\n\n{user_requirements}"
 
         def _call():
-            return self.client.models.generate_content(
+            return cached_generate_content(
+                self.client, "pm",
                 model="gemini-2.5-flash",
                 contents=contents,
                 config={
@@ -136,7 +141,8 @@ class PMAgent:
             )
 
         for parse_attempt in range(3):
-            response = call_with_retry(_call, max_retries=2)
+            with retry_scope(parse_attempt):
+                response = call_with_retry(_call, max_retries=2)
             if response.parsed is not None:
                 prd = response.parsed
                 return PRDArtifact(
@@ -145,6 +151,8 @@ class PMAgent:
                 )
             if parse_attempt < 2:
                 print(f"PMAgent: schema parse failed, retrying (attempt {parse_attempt + 1}/3)...")
-                import time; time.sleep(1)
+                import time
+                with span("retry_backoff", attempt=parse_attempt + 1, seconds=1, reason="schema_parse"):
+                    time.sleep(1)
 
         raise RuntimeError("PM Agent could not produce a valid PRD after 3 attempts. Please try rephrasing your request.")
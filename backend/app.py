@@ -11,25 +11,52 @@ import warnings
 import re
 from pathlib import Path
 from typing import Any, Dict
+import itertools
 import threading
 import time
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
 
 # Suppress SQLAlchemy legacy Query.get() deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="sqlalchemy")
 
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import Project, Execution, User, get_session, init_db, get_next_version
+from models import (
+    Project, Execution, User, PipelineJob, ModelUsage, ChatMessage, UsageRollup, add_execution, append_chat_message,
+    bump_usage, get_next_version, get_session, record_build_output, record_factsheet, request_session,
+    save_chat_history, set_active_head,
+)
+from migrations import verify_schema
 from auth import auth_bp, init_jwt
+from checkpoints import (
+    PIPELINE_STAGES, STAGE_ARTIFACTS, completed_stages, downstream_stages,
+    invalidate_checkpoints, record_checkpoint, restore_checkpoints, resumable_stages,
+)
+from event_stream import KEEPALIVE_SECONDS, RECONNECT_MS, event_broker, format_sse
+from job_queue import (
+    ACTIVE_JOB_STATUSES, JOB_CLAIMED, JOB_QUEUED, PRIORITY_CLASSES, PRIORITY_INTERACTIVE, LeaseLost, PipelineWorkerPool,
+    admission_retry_after, enqueue_job, estimate_wait_seconds, get_job_payload, has_active_job, lease_lost,
+    queue_position,
+)
 
 # NLU Agent — sentiment + keyword analysis before pipeline routing
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from agents.nlu_agent import NLUAgent
+from utils.metrics import (
+    ACTIVE_PIPELINES, BUILDS_TOTAL, LLM_CACHE_REQUESTS, QUEUE_DEPTH, RATE_LIMIT_WAIT, REGISTRY, STAGE_DURATION,
+)
+from utils.blob_store import get_blob_store, sha256_file
+from bundles import (
+    BUNDLE_VERSION, IMMUTABLE, archive_digest, build_published_bundle, pick_variant, stream_zip, write_preview_bundle,
+)
+from utils.tracing import begin_trace, end_trace, span
+from utils.usage_ledger import begin_ledger, end_ledger, summarize
 nlu_agent = NLUAgent()
 
 app = Flask(__name__)
 
-CORS(app, origins=["http://localhost:5173", "http://localhost:3000", "http://localhost:3001", "http://localhost:3002", "http://localhost:8080"])
+CORS(app, origins=["http://localhost:5173", "http://localhost:3000", "http://localhost:3001", "http://localhost:3002", "http://localhost:8080"],
+     expose_headers=["X-Next-Cursor"])
 
 # ── Smart Request Log Filter ──────────────────────────────────
 # Suppresses noisy duplicate requests from frontend polling while
@@ -46,6 +73,7 @@ class _RequestLogFilter(_logging.Filter):
         "/api/activity",
         "/api/projects",
         "/api/execution-status",
+        "/api/metrics",
     }
     _POLL_LOG_EVERY = 999  # rely on time-based logging instead
 
@@ -88,25 +116,64 @@ _logging.getLogger("werkzeug").addFilter(_RequestLogFilter())
 
 app.register_blueprint(auth_bp)
 jwt = init_jwt(app)
+# Behind Apache/lighttpd with mod_xsendfile, let the server send bundle files instead of the worker
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE") == "1"
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 PUBLIC_DIR = REPO_ROOT / "generated"
 
 execution_state: dict = {}  # keyed by project_id (int)
+_execution_state_lock = threading.Lock()
+_last_state_sweep = 0.0
+
+# Per-project live logs are a ring buffer; the full log of a finished build
+# is persisted to execution_logs.json in its version dir
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "1000"))
+# Idle projects' in-memory state is dropped after this; status falls back to the DB
+EXECUTION_STATE_TTL_SECONDS = float(os.getenv("EXECUTION_STATE_TTL_SECONDS", "3600"))
+STATE_SWEEP_INTERVAL_SECONDS = 60
+# /chat-history returns the latest messages a page at a time
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "200"))
+CHAT_HISTORY_MAX_PAGE_SIZE = 1000
 
 def get_project_state(project_id: int) -> dict:
-    if project_id not in execution_state:
-        execution_state[project_id] = {
-            "running": False,
-            "started_at": None,
-            "current_execution_id": None,
-            "logs": [],
-            "result_ready": False,
-        }
-    return execution_state[project_id]
+    now = time.time()
+    evict_idle_project_states(now)
+    with _execution_state_lock:
+        state = execution_state.get(project_id)
+        if state is None:
+            state = execution_state[project_id] = {
+                "running": False,
+                "started_at": None,
+                "current_execution_id": None,
+                "logs": deque(maxlen=LOG_BUFFER_SIZE),
+                "result_ready": False,
+            }
+        state["touched_at"] = now
+    return state
+
+def evict_idle_project_states(now: float = None, force: bool = False) -> int:
+    """Drop state (and SSE channels) of projects not running and untouched for the TTL."""
+    global _last_state_sweep
+    now = now or time.time()
+    if not force and now - _last_state_sweep < STATE_SWEEP_INTERVAL_SECONDS:
+        return 0
+    with _execution_state_lock:
+        _last_state_sweep = now
+        idle = [
+            pid for pid, s in execution_state.items()
+            if not s.get("running") and now - s.get("touched_at", now) > EXECUTION_STATE_TTL_SECONDS
+        ]
+        for pid in idle:
+            del execution_state[pid]
+    for pid in idle:
+        event_broker.discard(pid)
+    if idle:
+        print(f"Evicted in-memory state of {len(idle)} idle project(s)")
+    return len(idle)
 
 def any_pipeline_running() -> bool:
-    return any(s.get("running") for s in execution_state.values())
+    return any(s.get("running") for s in list(execution_state.values()))
 
 
 def read_json_file(filepath: Path) -> Dict[str, Any] | None:
@@ -131,27 +198,177 @@ def write_json_file(filepath: Path, data: Dict[str, Any]) -> bool:
         return False
 
 
-_log_counter = 0
+_log_counter = itertools.count(1)
 
 def add_log(message: str, log_type: str = "info", project_id: int = None):
-    global _log_counter
-    _log_counter += 1
+    n = next(_log_counter)
     ts = int(time.time() * 1000)
     print(f"[LOG] {message}")
     if project_id is None:
         return
-    get_project_state(project_id)["logs"].append({
-        "id": f"log-{ts}-{_log_counter}",
+    entry = {
+        "id": f"log-{ts}-{n}",
         "timestamp": ts,
         "message": message,
         "type": log_type,
-    })
+    }
+    get_project_state(project_id)["logs"].append(entry)
+    event_broker.publish(project_id, "log", entry)
+
+
+def publish_status(project_id: int):
+    """Push the project's full status to SSE subscribers (build queued, started, finished)."""
+    try:
+        event_broker.publish(project_id, "status", execution_status_payload(project_id))
+    except Exception as e:
+        print(f"Failed to publish status for project {project_id}: {e}")
 
 
 def get_version_dir(project_id: int, version: int) -> Path:
     return PUBLIC_DIR / str(project_id) / f"v{version}"
 
 
+# Bump when the manifest gains fields; older manifests are rebuilt on first read
+MANIFEST_VERSION = 3
+MANIFEST_CACHE_SIZE = 512
+# Bundle manifest kept in each published site (bundles.py)
+PUBLISHED_MANIFEST = ".archon-bundle.json"
+# Entry page of a published site: its URL is stable, unlike the fingerprinted files it references
+PUBLISHED_PAGE_CACHE = "public, max-age=3600"
+_manifest_cache: OrderedDict = OrderedDict()  # manifest.json path -> (mtime_ns, manifest)
+_manifest_cache_lock = threading.Lock()
+
+
+def _manifest(version_dir: Path, files: list, assets: list, files_generated: int) -> dict:
+    """
+    Manifest of a version's layout; `files` are code dir paths with hashes and
+    sizes. Also renders the version's preview bundle (bundles.py).
+    """
+    paths = sorted(f["path"] for f in files)
+    html = [p for p in paths if p.endswith(".html")]
+    design = read_json_file(version_dir / "last_design_assets.json") or {}
+    manifest = {
+        "kind": "version_manifest",
+        "manifest_version": MANIFEST_VERSION,
+        "entry_html": "src/index.html" if "src/index.html" in html else (html[0] if html else None),
+        "stylesheets": [p for p in paths if p.endswith(".css")],
+        "scripts": [p for p in paths if p.endswith(".js")],
+        "files": sorted(files, key=lambda f: f["path"]),
+        "assets": assets,
+        "files_generated": files_generated,
+        "images_generated": len(design.get("assets", [])),
+        "total_bytes": sum(f["bytes"] for f in files) + sum(a["bytes"] for a in assets),
+    }
+    manifest["preview"] = write_preview_bundle(version_dir, manifest)
+    return manifest
+
+
+def _store_assets(version_dir: Path) -> list:
+    """Move the version's design assets into the blob store; their manifest entries."""
+    store = get_blob_store()
+    assets_dir = version_dir / "assets"
+    assets = []
+    if assets_dir.exists():
+        for f in sorted(assets_dir.rglob("*")):
+            if f.is_file() and not f.name.startswith("."):
+                assets.append({
+                    "path": f.relative_to(assets_dir).as_posix(),
+                    "sha256": store.adopt(f),
+                    "bytes": f.stat().st_size,
+                })
+    return assets
+
+
+def write_version_manifest(version_dir: Path, writes, files_generated: int) -> dict:
+    """
+    Write <version>/manifest.json when a build's files are in place: entry
+    HTML, stylesheets, scripts, assets, sizes and blob hashes
+    (utils/blob_store.py), so endpoints never rediscover the layout on disk.
+    Code entries come from the engineer's WriteRecords.
+    """
+    code_dir = (version_dir / "code").resolve()
+    files = [
+        {"path": Path(rec.path).relative_to(code_dir).as_posix(), "sha256": rec.sha256, "bytes": rec.bytes}
+        for rec in writes
+    ]
+    manifest = _manifest(version_dir, files, _store_assets(version_dir), files_generated)
+    write_json_file(version_dir / "manifest.json", manifest)
+    return manifest
+
+
+def read_manifest(path: Path, kind: str = "version_manifest", version: int = MANIFEST_VERSION) -> dict | None:
+    """A current-format manifest file, parsed at most once per modification."""
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    with _manifest_cache_lock:
+        cached = _manifest_cache.get(path)
+        if cached and cached[0] == mtime:
+            _manifest_cache.move_to_end(path)
+            return cached[1]
+    manifest = read_json_file(path)
+    if not manifest or manifest.get("kind") != kind or manifest.get("manifest_version") != version:
+        return None
+    with _manifest_cache_lock:
+        _manifest_cache[path] = (mtime, manifest)
+        if len(_manifest_cache) > MANIFEST_CACHE_SIZE:
+            _manifest_cache.popitem(last=False)
+    return manifest
+
+
+def load_version_manifest(project_id: int, version: int) -> dict | None:
+    """
+    A version's manifest, or None if it has no code. Versions built before
+    manifests existed get one from a single scan of their directory.
+    """
+    version_dir = get_version_dir(project_id, version)
+    path = version_dir / "manifest.json"
+    manifest = read_manifest(path)
+    if manifest:
+        return manifest
+
+    # Legacy version: only once its build finished, so a running build isn't captured half written
+    code_dir = version_dir / "code"
+    result = read_json_file(version_dir / "last_execution_result.json")
+    if not result or not code_dir.exists():
+        return None
+    files = [
+        {"path": f.relative_to(code_dir).as_posix(), "sha256": sha256_file(f), "bytes": f.stat().st_size}
+        for f in code_dir.rglob("*")
+        if f.is_file() and not f.name.startswith(".")
+    ]
+    files_generated = result.get("outputs", {}).get("files_generated", len(files))
+    manifest = _manifest(version_dir, files, _store_assets(version_dir), files_generated)
+    write_json_file(path, manifest)
+    return manifest
+
+
+def manifest_tree(paths) -> list:
+    """File tree (folders first, then files, by name) of a manifest's code paths."""
+    root: dict = {}
+    for path in paths:
+        parts = path.split("/")
+        if any(part.startswith(".") for part in parts):
+            continue
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = None
+
+    def nodes(tree: dict, prefix: str) -> list:
+        out = []
+        for name, child in sorted(tree.items(), key=lambda kv: (kv[1] is None, kv[0].lower())):
+            path = f"{prefix}{name}"
+            if child is None:
+                out.append({"name": name, "type": "file", "path": path})
+            else:
+                out.append({"name": name, "type": "folder", "path": path, "children": nodes(child, f"{path}/")})
+        return out
+
+    return nodes(root, "")
+
+
 def build_file_tree(root: Path, base: Path):
     nodes = []
     try:
@@ -258,7 +475,7 @@ def resolve_project_version(q_project_id=None, q_version=None):
     # Priority 2: fall back to in-memory state only if params not provided
     if not project_id:
         # Find the most recently launched project from per-project state
-        for pid, s in execution_state.items():
+        for pid, s in list(execution_state.items()):
             if s.get("current_execution_id"):
                 project_id = pid
                 break
@@ -294,15 +511,69 @@ def resolve_project_version(q_project_id=None, q_version=None):
     return project_id, version
 
 
-def run_full_pipeline_async(task_description: str, prompt_history: list = None, project_id: int = None, reference_images: list = None):
+# Factsheet label for each stage's agent
+STAGE_AGENT_LABELS = {
+    "pm": "Requirements Agent",
+    "planner": "Architecture Agent",
+    "design": "Design Agent",
+    "engineer": "Build Agent",
+}
+
+
+def models_by_stage(records) -> dict:
+    """Distinct models each stage called, in first-use order."""
+    models = {}
+    for r in records:
+        stage_models = models.setdefault(r.stage or "other", [])
+        if r.model not in stage_models:
+            stage_models.append(r.model)
+    return models
+
+
+def persist_usage(session, records, project_id=None, execution_id=None):
+    """Write ledger records to model_usage; a build's execution takes its totals from its rows."""
+    if not records:
+        return
+    session.bulk_save_objects([
+        ModelUsage(execution_id=execution_id, project_id=project_id, **r.to_dict())
+        for r in records
+    ])
+    if execution_id:
+        execution = session.get(Execution, execution_id)
+        if execution:
+            # Totals over every run of this execution (resumes and reruns pay too)
+            session.flush()
+            totals = summarize(session.query(ModelUsage).filter(ModelUsage.execution_id == execution_id).all())
+            bump_usage(session, execution.project.owner_id if execution.project else None,
+                       credits_used=totals["credits"] - (execution.credits_used or 0))
+            execution.tokens_used = totals["tokens"]
+            execution.estimated_cost = totals["cost_usd"]
+            execution.credits_used = totals["credits"]
+    else:
+        project = session.get(Project, project_id) if project_id else None
+        bump_usage(session, project.owner_id if project else None, credits_used=summarize(records)["credits"])
+    session.commit()
+
+
+def run_full_pipeline_async(task_description: str, prompt_history: list = None, project_id: int = None, reference_images: list = None, execution_id: int = None,
+                            resume: bool = False, engineer_model: str = None, job_id: int = None):
     state = get_project_state(project_id)
 
     sys.path.insert(0, str(REPO_ROOT))
 
     session = get_session()
-    execution_id = state.get("current_execution_id")
+    execution_id = execution_id or state.get("current_execution_id")
     locked_ui_archetype = None
     pipeline_start_time = time.time()
+    version = None
+    build_outcome = "success"
+    trace = begin_trace(project_id=project_id, execution_id=execution_id)
+    ledger = begin_ledger()
+
+    def check_lease():
+        # Another worker reclaimed the job: it owns the version dir and the execution row now
+        if job_id and lease_lost(job_id):
+            raise LeaseLost(f"Job {job_id} was reclaimed by another worker")
 
     try:
         if execution_id:
@@ -311,7 +582,6 @@ def run_full_pipeline_async(task_description: str, prompt_history: list = None,
                 execution.status = "running"
                 session.commit()
 
-        version = None
         if execution_id:
             execution = session.get(Execution, execution_id)
             if execution:
@@ -331,231 +601,366 @@ def run_full_pipeline_async(task_description: str, prompt_history: list = None,
         # Load existing code from nearest ancestor that has code on disk
         existing_code = None
         ancestor_version_dir = None
-        session_check = get_session()
-        try:
-            current_exec = session_check.get(Execution, execution_id)
-            ancestor_id = current_exec.parent_execution_id if current_exec else None
-            hops = 0
-            while ancestor_id and hops < 5:
-                ancestor_exec = session_check.get(Execution, ancestor_id)
-                if not ancestor_exec:
-                    break
-                ancestor_dir = get_version_dir(project_id, ancestor_exec.version) / "code"
-                candidate = ancestor_dir / "src" / "index.html"
-                if not candidate.exists():
-                    html_files = list(ancestor_dir.rglob("*.html"))
-                    candidate = html_files[0] if html_files else None
-                if candidate and Path(candidate).exists():
-                    html_content = Path(candidate).read_text(encoding="utf-8", errors="replace")
-                    css_candidate = ancestor_dir / "src" / "style.css"
-                    if css_candidate.exists():
-                        css_content = css_candidate.read_text(encoding="utf-8", errors="replace")
-                        existing_code = f"<!-- src/index.html -->\n{html_content}\n\n/* src/style.css */\n{css_content}"
-                    else:
-                        existing_code = html_content
-                    ancestor_version_dir = get_version_dir(project_id, ancestor_exec.version)
-                    add_log(f"Build Agent: Loading v{ancestor_exec.version} for context...", project_id=project_id)
-                    break
-                ancestor_id = ancestor_exec.parent_execution_id
-                hops += 1
-        finally:
-            session_check.close()
+        current_exec = session.get(Execution, execution_id)
+        ancestor_id = current_exec.parent_execution_id if current_exec else None
+        hops = 0
+        while ancestor_id and hops < 5:
+            ancestor_exec = session.get(Execution, ancestor_id)
+            if not ancestor_exec:
+                break
+            ancestor_dir = get_version_dir(project_id, ancestor_exec.version) / "code"
+            ancestor_manifest = load_version_manifest(project_id, ancestor_exec.version)
+            candidate = ancestor_manifest and ancestor_manifest["entry_html"]
+            if candidate and (ancestor_dir / candidate).exists():
+                html_content = (ancestor_dir / candidate).read_text(encoding="utf-8", errors="replace")
+                if "src/style.css" in ancestor_manifest["stylesheets"]:
+                    css_content = (ancestor_dir / "src" / "style.css").read_text(encoding="utf-8", errors="replace")
+                    existing_code = f"<!-- src/index.html -->\n{html_content}\n\n/* src/style.css */\n{css_content}"
+                else:
+                    existing_code = html_content
+                ancestor_version_dir = get_version_dir(project_id, ancestor_exec.version)
+                add_log(f"Build Agent: Loading v{ancestor_exec.version} for context...", project_id=project_id)
+                break
+            ancestor_id = ancestor_exec.parent_execution_id
+            hops += 1
+        # End the read transaction: under WAL an open reader keeps the log from
+        # being checkpointed, and the model calls below take minutes
+        session.commit()
 
         add_log("Starting pipeline...", project_id=project_id)
-        add_log("Requirements Agent: Analyzing your request...", project_id=project_id)
         sys.path.insert(0, str(REPO_ROOT))
-        from agents.pm_agent import PMAgent
-        pm_agent = PMAgent()
-
-        context_input = task_description
-        if prompt_history and len(prompt_history) > 1:
-            history_text = "\n".join(
-                f"{turn['role'].upper()}: {turn['content']}"
-                for turn in prompt_history
-            )
-            context_input = f"Full conversation history:\n{history_text}\n\nLatest request: {task_description}"
-        if existing_code:
-            # Extract app title from previous HTML to preserve it
-            import re as _re
-            title_match = _re.search(r"<title[^>]*>(.*?)</title>", existing_code, _re.IGNORECASE)
-            prev_title = title_match.group(1).strip() if title_match else None
-            title_note = f" The app is currently named \"{prev_title}\" Ã¢â‚¬â€ preserve this name unless the user explicitly asks to change it." if prev_title else ""
-            context_input += f"\n\nNOTE: This is an iteration on an existing app. The current HTML is provided to the engineer. The PRD should reflect ONLY the changes requested, not rebuild from scratch.{title_note}"
-
-        prd_artifact = pm_agent.generate_prd(context_input)
-
-        prd_dict = prd_artifact.model_dump()
-        prd_dict["_agent_sequence"] = ["pm"]
-        write_json_file(version_dir / "last_prd.json", prd_dict)
-
-        add_log("Requirements Agent: Brief created.", project_id=project_id)
-        print(f"PRD saved: {prd_artifact.prd.document_title}")
+        from utils.stage_graph import Stage, StageGraph
 
-        add_log("Architecture Agent: Planning the build...", project_id=project_id)
+        # Shared between stages. Stages only read what their dependencies wrote.
+        ctx: dict = {"design_assets": []}
 
-        from agents.planner_agent import PlannerAgent
-        from utils.genai_client import get_genai_client
+        def stage_pm():
+            add_log("Requirements Agent: Analyzing your request...", project_id=project_id)
+            from agents.pm_agent import PMAgent
+            pm_agent = PMAgent()
 
-        genai_client = get_genai_client()
-        planner = PlannerAgent(genai_client)
-        plan = planner.run_from_prd_artifact(
-            version_dir / "last_prd.json",
-            locked_ui_archetype=locked_ui_archetype,
-            is_iteration=is_iteration,
-            reference_images=reference_images or [],
-        )
+            context_input = task_description
+            if prompt_history and len(prompt_history) > 1:
+                history_text = "\n".join(
+                    f"{turn['role'].upper()}: {turn['content']}"
+                    for turn in prompt_history
+                )
+                context_input = f"Full conversation history:\n{history_text}\n\nLatest request: {task_description}"
+            if existing_code:
+                # Extract app title from previous HTML to preserve it
+                import re as _re
+                title_match = _re.search(r"<title[^>]*>(.*?)</title>", existing_code, _re.IGNORECASE)
+                prev_title = title_match.group(1).strip() if title_match else None
+                title_note = f" The app is currently named \"{prev_title}\" Ã¢â‚¬â€ preserve this name unless the user explicitly asks to change it." if prev_title else ""
+                context_input += f"\n\nNOTE: This is an iteration on an existing app. The current HTML is provided to the engineer. The PRD should reflect ONLY the changes requested, not rebuild from scratch.{title_note}"
+
+            prd_artifact = pm_agent.generate_prd(context_input)
+
+            prd_dict = prd_artifact.model_dump()
+            prd_dict["_agent_sequence"] = ["pm"]
+            write_json_file(version_dir / "last_prd.json", prd_dict)
+
+            add_log("Requirements Agent: Brief created.", project_id=project_id)
+            print(f"PRD saved: {prd_artifact.prd.document_title}")
+
+        def stage_planner():
+            add_log("Architecture Agent: Planning the build...", project_id=project_id)
+
+            from agents.planner_agent import PlannerAgent
+
+            planner = PlannerAgent(ctx["genai_client"])
+            plan = planner.run_from_prd_artifact(
+                version_dir / "last_prd.json",
+                locked_ui_archetype=locked_ui_archetype,
+                is_iteration=is_iteration,
+                reference_images=reference_images or [],
+            )
 
-        plan_dict = {
-            "kind": "plan_artifact",
-            "agent_role": "planner",
-            "plan": plan.model_dump(),
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "_agent_sequence": ["pm", "planner"],
-        }
-        flat_plan = plan.model_dump()
-        write_json_file(version_dir / "last_plan.json", flat_plan)
-        write_json_file(version_dir / "last_plan_artifact.json", plan_dict)
-
-        add_log("Architecture Agent: Build plan ready.", project_id=project_id)
-        milestone_count = len(plan.milestones)
-        task_count = sum(len(m.tasks) for m in plan.milestones)
-        print(f"Plan saved: {milestone_count} milestones, {task_count} tasks")
-
-        design_assets = []
-        if is_iteration and ancestor_version_dir:
-            ancestor_assets_file = ancestor_version_dir / "last_design_assets.json"
-            if ancestor_assets_file.exists():
-                try:
-                    ancestor_assets_data = read_json_file(ancestor_assets_file) or {}
-                    design_assets = ancestor_assets_data.get("assets", [])
-                    write_json_file(version_dir / "last_design_assets.json", {"assets": design_assets})
-                    add_log(f"Design Agent: Reusing {len(design_assets)} images from previous version.", project_id=project_id)
-                except Exception as e:
-                    print(f"Failed to load ancestor design assets (non-fatal): {e}")
-                    add_log("Design Agent: Could not load previous images, continuing...", project_id=project_id)
-            else:
-                add_log("Design Agent: No previous images found, skipping.", project_id=project_id)
-        else:
-            add_log("Design Agent: Generating visuals...", project_id=project_id)
-            try:
-                from agents.design_agent import DesignAgent
-                prd_data = read_json_file(version_dir / "last_prd.json") or {}
-                design_agent = DesignAgent()
-                assets_dir = version_dir / "assets"
-                design_assets = design_agent.run(prd_data, max_images=10, save_dir=assets_dir, reference_images=reference_images or None)
-                if design_assets:
-                    write_json_file(version_dir / "last_design_assets.json", {"assets": design_assets})
-                    add_log(f"Design Agent: {len(design_assets)} images ready.", project_id=project_id)
+            plan_dict = {
+                "kind": "plan_artifact",
+                "agent_role": "planner",
+                "plan": plan.model_dump(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "_agent_sequence": ["pm", "planner"],
+            }
+            flat_plan = plan.model_dump()
+            write_json_file(version_dir / "last_plan.json", flat_plan)
+            write_json_file(version_dir / "last_plan_artifact.json", plan_dict)
+
+            add_log("Architecture Agent: Build plan ready.", project_id=project_id)
+            milestone_count = len(plan.milestones)
+            task_count = sum(len(m.tasks) for m in plan.milestones)
+            print(f"Plan saved: {milestone_count} milestones, {task_count} tasks")
+            ctx["plan"] = plan
+
+        def stage_design():
+            # Only needs the PRD, so it runs alongside the Architecture Agent
+            design_assets = []
+            if is_iteration and ancestor_version_dir:
+                ancestor_assets_file = ancestor_version_dir / "last_design_assets.json"
+                if ancestor_assets_file.exists():
+                    try:
+                        ancestor_assets_data = read_json_file(ancestor_assets_file) or {}
+                        design_assets = ancestor_assets_data.get("assets", [])
+                        write_json_file(version_dir / "last_design_assets.json", {"assets": design_assets})
+                        add_log(f"Design Agent: Reusing {len(design_assets)} images from previous version.", project_id=project_id)
+                    except Exception as e:
+                        print(f"Failed to load ancestor design assets (non-fatal): {e}")
+                        add_log("Design Agent: Could not load previous images, continuing...", project_id=project_id)
                 else:
-                    add_log("Design Agent: No images generated, continuing...", project_id=project_id)
-            except Exception as design_err:
-                print(f"DesignAgent failed (non-fatal): {design_err}")
-                add_log("Design Agent: Skipped, continuing with build...", project_id=project_id)
-
-        add_log("Build Agent: Writing your code...", project_id=project_id)
-
-        engineer_task = None
-        fallback_task = None
-        ui_keywords = ["html", "ui", "frontend", "scaffold", "interface", "web", "page", "app", "component"]
-        for milestone in plan.milestones:
-            for task in milestone.tasks:
-                if task.execution_hint == "engineer" and task.task_type == "scaffold":
-                    desc_lower = task.description.lower()
-                    if any(kw in desc_lower for kw in ui_keywords):
-                        engineer_task = task
-                        break
-                    elif fallback_task is None:
-                        fallback_task = task
-            if engineer_task:
-                break
-        if not engineer_task:
-            engineer_task = fallback_task
-        if not engineer_task:
-            raise ValueError("No engineer tasks found in plan")
-
-        from agents.engineer_agent import EngineerAgent
-        engineer = EngineerAgent(genai_client)
-        # Inject design assets into engineer prompt if available
-        design_context = ""
-        if design_assets:
-            asset_lines = []
-            for a in design_assets:
-                # Use local served path if downloaded; fall back to Azure URL
-                # Extract actual version from local_path (may point to ancestor)
-                asset_version = version
-                if a.get("local_path"):
-                    lp = a["local_path"].replace("\\", "/")
-                    parts = lp.split("/")
-                    for i, part in enumerate(parts):
-                        if part.startswith("v") and part[1:].isdigit():
-                            asset_version = int(part[1:])
+                    add_log("Design Agent: No previous images found, skipping.", project_id=project_id)
+            else:
+                add_log("Design Agent: Generating visuals...", project_id=project_id)
+                try:
+                    from agents.design_agent import DesignAgent
+                    prd_data = read_json_file(version_dir / "last_prd.json") or {}
+                    design_agent = DesignAgent()
+                    assets_dir = version_dir / "assets"
+                    design_assets = design_agent.run(prd_data, max_images=10, save_dir=assets_dir, reference_images=reference_images or None)
+                    if design_assets:
+                        write_json_file(version_dir / "last_design_assets.json", {"assets": design_assets})
+                        add_log(f"Design Agent: {len(design_assets)} images ready.", project_id=project_id)
+                    else:
+                        add_log("Design Agent: No images generated, continuing...", project_id=project_id)
+                except Exception as design_err:
+                    print(f"DesignAgent failed (non-fatal): {design_err}")
+                    add_log("Design Agent: Skipped, continuing with build...", project_id=project_id)
+            ctx["design_assets"] = design_assets
+
+        def stage_engineer():
+            plan = ctx["plan"]
+            design_assets = ctx["design_assets"]
+            add_log("Build Agent: Writing your code...", project_id=project_id)
+
+            engineer_task = None
+            fallback_task = None
+            ui_keywords = ["html", "ui", "frontend", "scaffold", "interface", "web", "page", "app", "component"]
+            for milestone in plan.milestones:
+                for task in milestone.tasks:
+                    if task.execution_hint == "engineer" and task.task_type == "scaffold":
+                        desc_lower = task.description.lower()
+                        if any(kw in desc_lower for kw in ui_keywords):
+                            engineer_task = task
                             break
-                img_url = f"/api/assets/{project_id}/{asset_version}/{a['key']}.png" if a.get("local_path") else a["url"]
-                line = "  - " + a["key"] + " (" + a["purpose"] + "): " + img_url
-                asset_lines.append(line)
-            design_context = "\n\nDESIGN ASSETS - USE THESE IMAGE URLs IN THE HTML:\n" + "\n".join(asset_lines) + "\nIMPORTANT: Use these exact URLs in <img> tags or CSS background-image. Do not use placeholder images.\n"
-            task_description_with_assets = task_description + design_context
-        else:
-            task_description_with_assets = task_description
+                        elif fallback_task is None:
+                            fallback_task = task
+                if engineer_task:
+                    break
+            if not engineer_task:
+                engineer_task = fallback_task
+            if not engineer_task:
+                raise ValueError("No engineer tasks found in plan")
+
+            from agents.engineer_agent import EngineerAgent
+            engineer = EngineerAgent(ctx["genai_client"], model=engineer_model)
+            # Inject design assets into engineer prompt if available
+            design_context = ""
+            if design_assets:
+                asset_lines = []
+                for a in design_assets:
+                    # Use local served path if downloaded; fall back to Azure URL
+                    # Extract actual version from local_path (may point to ancestor)
+                    asset_version = version
+                    if a.get("local_path"):
+                        lp = a["local_path"].replace("\\", "/")
+                        parts = lp.split("/")
+                        for i, part in enumerate(parts):
+                            if part.startswith("v") and part[1:].isdigit():
+                                asset_version = int(part[1:])
+                                break
+                    img_url = f"/api/assets/{project_id}/{asset_version}/{a['key']}.png" if a.get("local_path") else a["url"]
+                    line = "  - " + a["key"] + " (" + a["purpose"] + "): " + img_url
+                    asset_lines.append(line)
+                design_context = "\n\nDESIGN ASSETS - USE THESE IMAGE URLs IN THE HTML:\n" + "\n".join(asset_lines) + "\nIMPORTANT: Use these exact URLs in <img> tags or CSS background-image. Do not use placeholder images.\n"
+                task_description_with_assets = task_description + design_context
+            else:
+                task_description_with_assets = task_description
+
+            result = engineer.run(engineer_task, user_prompt=task_description_with_assets, existing_code=existing_code, reference_images=reference_images or None)
+
+            from scripts.safe_write import safe_write_text, enforce_iteration_scope
+            check_lease()
+            allow_dir = version_dir / "code"
+            if allow_dir.exists():
+                # Re-run or resumed attempt: never mix files from two engineer runs
+                shutil.rmtree(allow_dir)
+                (version_dir / "manifest.json").unlink(missing_ok=True)
+            writes = []
+            if is_iteration and engineer_task.output_files:
+                enforce_iteration_scope(engineer_task.output_files, result.files)
+            with span("write_files", files=len(result.files)) as write_attrs:
+                for file_artifact in result.files:
+                    try:
+                        rec = safe_write_text(
+                            allowlist_dir=allow_dir,
+                            relative_path=file_artifact.path,
+                            content=file_artifact.content,
+                            store=get_blob_store(),
+                        )
+                        writes.append(rec)
+                        add_log(f"Build Agent: Created {file_artifact.path}", project_id=project_id)
+                    except ValueError as skip_err:
+                        # In iteration mode, fail hard to keep behavior deterministic and auditable.
+                        if is_iteration:
+                            raise
+                        print(f"Build Agent: Skipped {file_artifact.path} ({skip_err})")
+                        print(f"Skipped file: {skip_err}")
+                write_attrs["bytes"] = sum(rec.bytes for rec in writes)
+                write_version_manifest(version_dir, writes, files_generated=len(result.files))
+            add_log("Build complete.", project_id=project_id)
+
+            execution_result = {
+                "kind": "execution_result",
+                "agent_role": "engineer",
+                "status": "success",
+                "request_hash": "",
+                "request": {
+                    "kind": "execution_request",
+                    "task_id": engineer_task.id,
+                    "title": task_description,
+                    "payload": {"task_description": task_description},
+                },
+                "outputs": {
+                    "action": "engineer_execution",
+                    "task_id": engineer_task.id,
+                    "summary": result.summary,
+                    "files_generated": len(result.files),
+                    "writes": [
+                        {"path": str(rec.path), "sha256": rec.sha256, "bytes": rec.bytes}
+                        for rec in writes
+                    ],
+                },
+                "error": None,
+                "_agent_sequence": ["pm", "planner", "engineer"],
+                "logs": list(state.get("logs", [])),
+                "_meta": {
+                    "produced_at": datetime.now(timezone.utc).isoformat(),
+                    "consumer_version": "v4",
+                },
+            }
+            write_json_file(version_dir / "last_execution_result.json", execution_result)
 
-        result = engineer.run(engineer_task, user_prompt=task_description_with_assets, existing_code=existing_code, reference_images=reference_images or None)
+            print(f"Execution result saved: {len(writes)} files generated")
 
-        from scripts.safe_write import safe_write_text, enforce_iteration_scope
-        allow_dir = version_dir / "code"
-        writes = []
-        if is_iteration and engineer_task.output_files:
-            enforce_iteration_scope(engineer_task.output_files, result.files)
-        for file_artifact in result.files:
+            if execution_id:
+                execution = session.get(Execution, execution_id)
+                if execution:
+                    # Status is set once the whole graph has run (see below)
+                    # Build metrics
+                    record_build_output(session, execution, round(time.time() - pipeline_start_time, 2), writes)
+                    # Tokens, cost and credits are set from the usage ledger when the run ends
+                    engineer_models = models_by_stage(ledger.snapshot()).get("engineer")
+                    if engineer_models:
+                        execution.model_used = ", ".join(engineer_models)
+                    project = execution.project
+                    if (
+                        execution.version == 1
+                        and project
+                        and not project.locked_ui_archetype
+                    ):
+                        locked = get_plan_ui_archetype(plan)
+                        if locked:
+                            project.locked_ui_archetype = locked
+                    session.commit()
+
+        def stage_governance():
+            # Governance Agent — generate AI Factsheet
             try:
-                rec = safe_write_text(
-                    allowlist_dir=allow_dir,
-                    relative_path=file_artifact.path,
-                    content=file_artifact.content,
+                from agents.governance_agent import GovernanceAgent
+                gov_agent = GovernanceAgent()
+
+                manifest = load_version_manifest(project_id, version) or {}
+                files_count = manifest.get("files_generated", 0)
+                images_count = manifest.get("images_generated", 0)
+
+                exec_for_gov = session.get(Execution, execution_id)
+                project = exec_for_gov.project if exec_for_gov else None
+                prompt_text = task_description
+                usage_records = ledger.snapshot()
+                usage = summarize(usage_records)
+
+                factsheet = gov_agent.generate_factsheet(
+                    project_id=project_id,
+                    project_name=project.name if project else "Unknown",
+                    version=version,
+                    execution_id=execution_id,
+                    prompt=prompt_text,
+                    ui_archetype=project.locked_ui_archetype if project else None,
+                    models_used={
+                        label: " + ".join(models_by_stage(usage_records).get(stage, [])) or "cached / not run"
+                        for stage, label in STAGE_AGENT_LABELS.items()
+                    },
+                    tokens_used=usage["tokens"],
+                    estimated_cost=usage["cost_usd"],
+                    credits_used=usage["credits"],
+                    duration_seconds=exec_for_gov.duration_seconds if exec_for_gov else None,
+                    files_generated=files_count,
+                    images_generated=images_count,
+                    agent_sequence=["pm", "planner", "design", "engineer"],
+                    status="success",
                 )
-                writes.append(rec)
-                add_log(f"Build Agent: Created {file_artifact.path}", project_id=project_id)
-            except ValueError as skip_err:
-                # In iteration mode, fail hard to keep behavior deterministic and auditable.
-                if is_iteration:
-                    raise
-                print(f"Build Agent: Skipped {file_artifact.path} ({skip_err})")
-                print(f"Skipped file: {skip_err}")
-        add_log("Build complete.", project_id=project_id)
-        state["result_ready"] = True
 
-        execution_result = {
-            "kind": "execution_result",
-            "agent_role": "engineer",
-            "status": "success",
-            "request_hash": "",
-            "request": {
-                "kind": "execution_request",
-                "task_id": engineer_task.id,
-                "title": task_description,
-                "payload": {"task_description": task_description},
-            },
-            "outputs": {
-                "action": "engineer_execution",
-                "task_id": engineer_task.id,
-                "summary": result.summary,
-                "files_generated": len(result.files),
-                "writes": [
-                    {"path": str(rec.path), "sha256": rec.sha256, "bytes": rec.bytes}
-                    for rec in writes
-                ],
-            },
-            "error": None,
-            "_agent_sequence": ["pm", "planner", "engineer"],
-            "logs": list(state.get("logs", [])),
-            "_meta": {
-                "produced_at": datetime.now(timezone.utc).isoformat(),
-                "consumer_version": "v4",
-            },
-        }
-        write_json_file(version_dir / "last_execution_result.json", execution_result)
+                write_json_file(version_dir / "last_factsheet.json", factsheet)
 
-        print(f"Execution result saved: {len(writes)} files generated")
+                exec_for_gov = session.get(Execution, execution_id)
+                if exec_for_gov:
+                    record_factsheet(exec_for_gov, factsheet)
+                    session.commit()
+
+                add_log("Governance Agent: Factsheet recorded.", project_id=project_id)
+            except Exception as gov_err:
+                print(f"GovernanceAgent failed (non-fatal): {gov_err}")
+
+        def _traced(name, fn):
+            def run():
+                with span(f"stage.{name}", metric=STAGE_DURATION, stage=name):
+                    return fn()
+            return run
+
+        def _stage_started(name):
+            check_lease()
+            state.setdefault("stages", {})[name] = "running"
+            event_broker.publish(project_id, "stage", {"stage": name, "status": "running"})
+
+        def _stage_finished(name, err):
+            state.setdefault("stages", {})[name] = "failed" if err else "done"
+            event_broker.publish(project_id, "stage", {"stage": name, "status": "failed" if err else "done"})
+            if job_id and lease_lost(job_id):
+                return  # the checkpoints belong to the new owner's run
+            record_checkpoint(
+                version_dir, name, "failed" if err else "done",
+                STAGE_ARTIFACTS[name], error=str(err) if err else None,
+            )
 
+        # Resume at the first incomplete stage, reloading what the completed ones produced
+        skip = resumable_stages(version_dir) if resume else []
+        if not resume:
+            invalidate_checkpoints(version_dir, list(PIPELINE_STAGES))
+        if skip:
+            add_log(f"Resuming build: reusing {', '.join(skip)} from the previous attempt.", project_id=project_id)
+            if "planner" in skip:
+                from schemas.plan_schema import Plan
+                ctx["plan"] = Plan.model_validate(read_json_file(version_dir / "last_plan.json"))
+            if "design" in skip:
+                ctx["design_assets"] = (read_json_file(version_dir / "last_design_assets.json") or {}).get("assets", [])
+
+        # Created here rather than in stage_planner: a resume that skips the planner still runs the engineer
+        from utils.genai_client import get_genai_client
+        ctx["genai_client"] = get_genai_client()
+
+        # pm -> (planner || design) -> engineer -> governance
+        state["stages"] = {name: "skipped" for name in skip}
+        StageGraph([
+            Stage("pm", _traced("pm", stage_pm)),
+            Stage("planner", _traced("planner", stage_planner), depends_on=PIPELINE_STAGES["planner"]),
+            Stage("design", _traced("design", stage_design), depends_on=PIPELINE_STAGES["design"], required=False),
+            Stage("engineer", _traced("engineer", stage_engineer), depends_on=PIPELINE_STAGES["engineer"]),
+            Stage("governance", _traced("governance", stage_governance), depends_on=PIPELINE_STAGES["governance"],
+                  required=False),
+        ]).run(skip=skip, on_start=_stage_started, on_finish=_stage_finished)
+
+        # After the graph rather than in stage_engineer: a resume or rerun may have skipped the engineer
+        check_lease()
         if execution_id:
             execution = session.get(Execution, execution_id)
             if execution:
@@ -563,85 +968,22 @@ def run_full_pipeline_async(task_description: str, prompt_history: list = None,
                 execution.result_path = str(version_dir / "last_execution_result.json")
                 execution.prd_path = str(version_dir / "last_prd.json")
                 execution.plan_path = str(version_dir / "last_plan.json")
-                # Build metrics
-                execution.duration_seconds = round(time.time() - pipeline_start_time, 2)
-                execution.model_used = "Claude Opus 4.6"
-                if hasattr(result, "usage") and result.usage:
-                    input_tokens = getattr(result.usage, "input_tokens", 0) or 0
-                    output_tokens = getattr(result.usage, "output_tokens", 0) or 0
-                    execution.tokens_used = input_tokens + output_tokens
-                    if execution.tokens_used:
-                        # Gemini 2.5 Flash pricing: $0.15/M input, $0.60/M output (under 200k context)
-                        execution.estimated_cost = round(
-                            (input_tokens * 0.00000015) + (output_tokens * 0.0000006), 4
-                        )
-                    # 1 credit = 2500 tokens, minimum 1
-                    execution.credits_used = max(1, round(execution.tokens_used / 2500))
-                if (
-                    execution.version == 1
-                    and not project.locked_ui_archetype
-                ):
-                    locked = get_plan_ui_archetype(plan)
-                    if locked:
-                        project.locked_ui_archetype = locked
-                session.commit()
                 project = execution.project
                 if project:
                     project.status = "completed"
                     project.updated_at = datetime.now(timezone.utc)
-                    session.commit()
-
-        # Governance Agent — generate AI Factsheet
-        try:
-            from agents.governance_agent import GovernanceAgent
-            gov_agent = GovernanceAgent()
-
-            result_data = read_json_file(version_dir / "last_execution_result.json") or {}
-            files_count = result_data.get("outputs", {}).get("files_generated", 0)
-            assets_data = read_json_file(version_dir / "last_design_assets.json") or {}
-            images_count = len(assets_data.get("assets", []))
-
-            exec_for_gov = session.get(Execution, execution_id)
-            prompt_text = task_description
-
-            factsheet = gov_agent.generate_factsheet(
-                project_id=project_id,
-                project_name=project.name if project else "Unknown",
-                version=version,
-                execution_id=execution_id,
-                prompt=prompt_text,
-                ui_archetype=project.locked_ui_archetype if project else None,
-                models_used={
-                    "Requirements Agent": "Gemini 2.5 Flash",
-                    "Architecture Agent": "Gemini 2.5 Flash",
-                    "Design Agent": "Imagen 3.0 + Gemini 2.5 Flash",
-                    "Build Agent": "Gemini 2.5 Flash",
-                },
-                tokens_used=exec_for_gov.tokens_used if exec_for_gov else None,
-                estimated_cost=exec_for_gov.estimated_cost if exec_for_gov else None,
-                credits_used=exec_for_gov.credits_used if exec_for_gov else None,
-                duration_seconds=exec_for_gov.duration_seconds if exec_for_gov else None,
-                files_generated=files_count,
-                images_generated=images_count,
-                agent_sequence=["pm", "planner", "design", "engineer"],
-                status="success",
-            )
-
-            write_json_file(version_dir / "last_factsheet.json", factsheet)
-
-            exec_for_gov = session.get(Execution, execution_id)
-            if exec_for_gov:
-                exec_for_gov.governance_log = json.dumps(factsheet)
-                readiness = factsheet.get("readiness", {})
-                exec_for_gov.readiness_score = readiness.get("combined_score")
-                exec_for_gov.quality_tier = readiness.get("quality_tier")
                 session.commit()
+        state["result_ready"] = True
 
-            add_log("Governance Agent: Factsheet recorded.", project_id=project_id)
-        except Exception as gov_err:
-            print(f"GovernanceAgent failed (non-fatal): {gov_err}")
+    except LeaseLost as e:
+        # Leave the execution, its result and its logs to the worker that owns the job now
+        build_outcome = "lease_lost"
+        add_log("Build moved to another worker.", project_id=project_id)
+        print(f"Pipeline aborted: {e}")
+        raise
 
     except Exception as e:
+        build_outcome = "error"
         error_msg = str(e)
         short_msg = error_msg.split("\n")[0][:200]
         add_log(f"Something went wrong: {short_msg}", project_id=project_id)
@@ -674,11 +1016,123 @@ def run_full_pipeline_async(task_description: str, prompt_history: list = None,
             })
 
     finally:
+        trace_data = end_trace(trace)
+        BUILDS_TOTAL.inc(outcome=build_outcome)
+        try:
+            persist_usage(session, end_ledger(ledger), project_id=project_id, execution_id=execution_id)
+        except Exception as usage_err:
+            session.rollback()
+            print(f"Usage ledger not saved (non-fatal): {usage_err}")
+        if project_id and version and build_outcome != "lease_lost":
+            write_json_file(get_version_dir(project_id, version) / "execution_logs.json", list(state["logs"]))
+            write_json_file(get_version_dir(project_id, version) / "last_trace.json", {
+                **trace_data, "version": version, "outcome": build_outcome,
+            })
         state["running"] = False
         session.close()
+        if project_id:
+            publish_status(project_id)
         print("Pipeline complete")
 
 
+# ============================================================================
+# PIPELINE WORKER POOL
+# ============================================================================
+
+def run_pipeline_job(job: PipelineJob):
+    """Worker handler (embedded pool or worker.py): rehydrate per-project state and run the pipeline."""
+    payload = json.loads(job.payload)
+    state = get_project_state(job.project_id)
+    if state.get("current_execution_id") != job.execution_id:
+        # Job was re-queued after a restart -- nothing in memory yet
+        state["logs"].clear()
+    state["running"] = True
+    state["started_at"] = time.time()
+    state["current_execution_id"] = job.execution_id
+    state["result_ready"] = False
+    publish_status(job.project_id)
+    run_full_pipeline_async(
+        payload["task_description"],
+        payload.get("prompt_history"),
+        job.project_id,
+        payload.get("reference_images") or [],
+        execution_id=job.execution_id,
+        # A reclaimed job picks up after the last checkpoint its dead worker recorded
+        resume=bool(payload.get("resume")) or job.attempts > 1,
+        engineer_model=payload.get("engineer_model"),
+        job_id=job.id,
+    )
+
+
+pipeline_workers = PipelineWorkerPool(run_pipeline_job)
+_pipeline_workers_lock = threading.Lock()
+_pipeline_workers_started = False
+
+
+def ensure_pipeline_workers():
+    """
+    Start the embedded worker pool once per process. PIPELINE_WORKERS=0 turns
+    this process into a pure web tier; run backend/worker.py elsewhere.
+    """
+    global _pipeline_workers_started
+    if _pipeline_workers_started:
+        return
+    with _pipeline_workers_lock:
+        if not _pipeline_workers_started:
+            pipeline_workers.start()
+            _pipeline_workers_started = True
+
+
+@app.before_request
+def _start_pipeline_workers():
+    ensure_pipeline_workers()
+
+
+@app.teardown_appcontext
+def _remove_request_session(exc):
+    """Endpoints share one session per request (request_session()); release it here."""
+    if exc is not None:
+        request_session.rollback()
+    request_session.remove()
+
+
+def request_priority() -> int:
+    """Scheduling lane for a new build: X-Build-Priority header ("batch" from the eval harness)."""
+    name = (request.headers.get("X-Build-Priority") or "interactive").strip().lower()
+    return PRIORITY_CLASSES.get(name, PRIORITY_INTERACTIVE)
+
+
+def queue_full_response(retry_after: int):
+    resp = jsonify({
+        "error": "Too many builds queued right now. Please try again shortly.",
+        "retry_after": retry_after,
+    })
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp
+
+
+def submit_pipeline_job(session, execution: Execution, task_description: str, prompt_history: list,
+                        reference_images: list = None, resume: bool = False, engineer_model: str = None,
+                        priority: int = PRIORITY_INTERACTIVE):
+    """Persist a queued job for `execution` and wake the worker pool."""
+    payload = {
+        "task_description": task_description,
+        "prompt_history": prompt_history,
+        "reference_images": reference_images or [],
+    }
+    if resume:
+        payload["resume"] = True
+    if engineer_model:
+        payload["engineer_model"] = engineer_model
+    project = session.get(Project, execution.project_id)
+    enqueue_job(session, execution, payload, priority=priority, owner_id=project.owner_id if project else None)
+    session.commit()
+    publish_status(execution.project_id)
+    ensure_pipeline_workers()
+    pipeline_workers.notify()
+
+
 # ============================================================================
 # PROJECT ENDPOINTS
 # ============================================================================
@@ -686,171 +1140,137 @@ def run_full_pipeline_async(task_description: str, prompt_history: list = None,
 @app.route("/api/projects", methods=["GET"])
 @jwt_required(optional=True)
 def list_projects():
-    session = get_session()
-    try:
-        uid = get_jwt_identity()
-        query = session.query(Project).order_by(Project.updated_at.desc())
-        if uid:
-            query = query.filter(Project.owner_id == int(uid))
-        projects = query.all()
-        return jsonify([p.to_dict() for p in projects]), 200
-    finally:
-        session.close()
+    session = request_session()
+    uid = get_jwt_identity()
+    query = session.query(Project).order_by(Project.updated_at.desc())
+    if uid:
+        query = query.filter(Project.owner_id == int(uid))
+    projects = query.all()
+    return jsonify([p.to_dict() for p in projects]), 200
 
 
 @app.route("/api/stats", methods=["GET"])
 @jwt_required(optional=True)
 def get_stats():
-    from sqlalchemy import func
+    from sqlalchemy import case, func
     uid = get_jwt_identity()
-    session = get_session()
-    try:
-        base_q = session.query(Execution.project_id, func.max(Execution.version))
-        if uid:
-            base_q = base_q.join(Project).filter(Project.owner_id == int(uid))
-        version_counts = base_q.group_by(Execution.project_id).all()
-        versions_shipped = sum(v for _, v in version_counts)
-
-        # avg_build_time_seconds from completed executions that have duration
-        avg_q = session.query(func.avg(Execution.duration_seconds)).filter(
-            Execution.status == "success", Execution.duration_seconds.isnot(None)
-        )
-        if uid:
-            avg_q = avg_q.join(Project).filter(Project.owner_id == int(uid))
-        avg_row = avg_q.scalar()
-        avg_build_time_seconds = round(avg_row, 1) if avg_row else None
-
-        # lines_generated: walk all version code dirs and count lines
-        total_lines = 0
-        lines_q = session.query(Execution.project_id, Execution.version).filter(Execution.status == "success")
-        if uid:
-            lines_q = lines_q.join(Project).filter(Project.owner_id == int(uid))
-        all_execs = lines_q.all()
-        for pid, ver in all_execs:
-            code_dir = get_version_dir(pid, ver) / "code"
-            if code_dir.exists():
-                for f in code_dir.rglob("*"):
-                    if f.is_file() and f.suffix in (".html", ".css", ".js", ".ts", ".tsx", ".jsx", ".py", ".json"):
-                        try:
-                            total_lines += f.read_text(encoding="utf-8", errors="ignore").count("\n") + 1
-                        except Exception:
-                            pass
-
-        # pipelines_today: executions created today
-        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        today_q = session.query(func.count(Execution.id)).filter(Execution.created_at >= today_start)
-        if uid:
-            today_q = today_q.join(Project).filter(Project.owner_id == int(uid))
-        pipelines_today = today_q.scalar() or 0
+    session = request_session()
+    base_q = session.query(func.coalesce(func.sum(Project.version_count), 0))
+    if uid:
+        base_q = base_q.filter(Project.owner_id == int(uid))
+    versions_shipped = base_q.scalar()
+
+    # Build time, code size and today's pipelines come from the daily usage rollups
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    rollup_q = session.query(
+        func.coalesce(func.sum(UsageRollup.builds), 0),
+        func.coalesce(func.sum(UsageRollup.build_seconds), 0),
+        func.coalesce(func.sum(UsageRollup.lines_generated), 0),
+        func.coalesce(func.sum(UsageRollup.bytes_generated), 0),
+        func.coalesce(func.sum(case((UsageRollup.day == today, UsageRollup.pipelines), else_=0)), 0),
+    )
+    if uid:
+        rollup_q = rollup_q.filter(UsageRollup.owner_id == int(uid))
+    builds, build_seconds, total_lines, total_bytes, pipelines_today = rollup_q.one()
+    avg_build_time_seconds = round(build_seconds / builds, 1) if builds and build_seconds else None
 
-        return jsonify({
-            "versions_shipped": versions_shipped,
-            "avg_build_time_seconds": avg_build_time_seconds,
-            "lines_generated": total_lines,
-            "pipelines_today": pipelines_today,
-        }), 200
-    finally:
-        session.close()
+    return jsonify({
+        "versions_shipped": versions_shipped,
+        "avg_build_time_seconds": avg_build_time_seconds,
+        "lines_generated": total_lines,
+        "bytes_generated": total_bytes,
+        "pipelines_today": pipelines_today,
+    }), 200
 
 
 @app.route("/api/activity", methods=["GET"])
 @jwt_required(optional=True)
 def get_activity():
-    session = get_session()
-    try:
-        uid = get_jwt_identity()
-        query = session.query(Execution).order_by(Execution.created_at.desc())
-        if uid:
-            query = query.join(Project).filter(Project.owner_id == int(uid))
-        recent = query.limit(6).all()
-        items = []
-        for e in recent:
-            project = session.get(Project, e.project_id)
-            items.append({
-                "project_name": project.name if project else "Unknown",
-                "project_id": e.project_id,
-                "status": e.status,
-                "version": e.version,
-                "created_at": e.created_at.isoformat() if e.created_at else None,
-            })
-        return jsonify(items), 200
-    finally:
-        session.close()
+    session = request_session()
+    uid = get_jwt_identity()
+    query = (
+        session.query(Execution, Project.name)
+        .outerjoin(Project, Project.id == Execution.project_id)
+        .order_by(Execution.created_at.desc())
+    )
+    if uid:
+        query = query.filter(Project.owner_id == int(uid))
+    recent = query.limit(6).all()
+    items = []
+    for e, project_name in recent:
+        items.append({
+            "project_name": project_name or "Unknown",
+            "project_id": e.project_id,
+            "status": e.status,
+            "version": e.version,
+            "created_at": e.created_at.isoformat() if e.created_at else None,
+        })
+    return jsonify(items), 200
 
 
 @app.route("/api/projects", methods=["POST"])
 @jwt_required(optional=True)
 def create_project():
-    session = get_session()
-    try:
-        data = request.get_json()
-        if not data or not data.get("name"):
-            return jsonify({"error": "Project name is required"}), 400
-        uid = get_jwt_identity()
-        project = Project(
-            name=data["name"],
-            description=data.get("description", ""),
-            status="pending",
-            owner_id=int(uid) if uid else None,
-        )
-        session.add(project)
-        session.commit()
-        session.refresh(project)
-        return jsonify(project.to_dict()), 201
-    finally:
-        session.close()
+    session = request_session()
+    data = request.get_json()
+    if not data or not data.get("name"):
+        return jsonify({"error": "Project name is required"}), 400
+    uid = get_jwt_identity()
+    project = Project(
+        name=data["name"],
+        description=data.get("description", ""),
+        status="pending",
+        owner_id=int(uid) if uid else None,
+    )
+    session.add(project)
+    session.commit()
+    session.refresh(project)
+    return jsonify(project.to_dict()), 201
 
 
 @app.route("/api/projects/<int:project_id>", methods=["GET"])
 def get_project(project_id: int):
-    session = get_session()
-    try:
-        project = session.get(Project, project_id)
-        if not project:
-            return jsonify({"error": "Project not found"}), 404
-        project_dict = project.to_dict()
-        project_dict["executions"] = [e.to_dict() for e in project.executions]
-        return jsonify(project_dict), 200
-    finally:
-        session.close()
+    session = request_session()
+    project = session.get(Project, project_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+    project_dict = project.to_dict()
+    project_dict["executions"] = [e.to_dict() for e in project.executions]
+    return jsonify(project_dict), 200
 
 
 @app.route("/api/projects/<int:project_id>", methods=["DELETE"])
 def delete_project(project_id: int):
-    session = get_session()
+    session = request_session()
+    project = session.get(Project, project_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+    session.delete(project)
+    session.commit()
+    # Clean up generated files on disk
+    project_dir = PUBLIC_DIR / str(project_id)
     try:
-        project = session.get(Project, project_id)
-        if not project:
-            return jsonify({"error": "Project not found"}), 404
-        session.delete(project)
-        session.commit()
-        # Clean up generated files on disk
-        project_dir = PUBLIC_DIR / str(project_id)
-        try:
-            import shutil as _shutil
-            _shutil.rmtree(project_dir)
-        except FileNotFoundError:
-            pass
-        return jsonify({"message": "Project deleted"}), 200
-    finally:
-        session.close()
+        import shutil as _shutil
+        _shutil.rmtree(project_dir)
+    except FileNotFoundError:
+        pass
+    # Drop blobs only this project's versions linked to
+    threading.Thread(target=get_blob_store().prune, daemon=True, name="blob-prune").start()
+    return jsonify({"message": "Project deleted"}), 200
 
 
 @app.route("/api/projects/<int:project_id>/reset-build", methods=["POST"])
 def reset_build(project_id):
-    db = get_session()
-    try:
-        stuck = db.query(Execution).filter(
-            Execution.project_id == project_id,
-            Execution.status == "running"
-        ).first()
-        if stuck:
-            stuck.status = "failed"
-            db.commit()
-            return jsonify({"reset": True, "execution_id": stuck.id})
-        return jsonify({"reset": False, "message": "No running execution found"})
-    finally:
-        db.close()
+    db = request_session()
+    stuck = db.query(Execution).filter(
+        Execution.project_id == project_id,
+        Execution.status == "running"
+    ).first()
+    if stuck:
+        stuck.status = "failed"
+        db.commit()
+        return jsonify({"reset": True, "execution_id": stuck.id})
+    return jsonify({"reset": False, "message": "No running execution found"})
 
 
 # ============================================================================
@@ -859,79 +1279,70 @@ def reset_build(project_id):
 
 @app.route("/api/projects/<int:project_id>/versions", methods=["GET"])
 def get_versions(project_id: int):
-    session = get_session()
-    try:
-        project = session.get(Project, project_id)
-        if not project:
-            return jsonify({"error": "Project not found"}), 404
-        executions = (
-            session.query(Execution)
-            .filter(Execution.project_id == project_id)
-            .order_by(Execution.version.desc())
-            .all()
-        )
-        versions_list = []
-        for e in executions:
-            e_dict = e.to_dict()
-            if project_id and e.version:
-                result_path = get_version_dir(project_id, e.version) / "last_execution_result.json"
-                result_data = read_json_file(result_path)
-                if result_data:
-                    e_dict["files_generated"] = result_data.get("outputs", {}).get("files_generated", 0)
-                assets_path = get_version_dir(project_id, e.version) / "last_design_assets.json"
-                assets_data = read_json_file(assets_path)
-                e_dict["images_generated"] = len(assets_data.get("assets", [])) if assets_data else 0
-            versions_list.append(e_dict)
-        return jsonify({
-            "project_id": project_id,
-            "project_name": project.name,
-            "versions": versions_list,
-        }), 200
-    finally:
-        session.close()
+    session = request_session()
+    project = session.get(Project, project_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+    executions = (
+        session.query(Execution)
+        .filter(Execution.project_id == project_id)
+        .order_by(Execution.version.desc())
+        .all()
+    )
+    versions_list = []
+    for e in executions:
+        e_dict = e.to_dict()
+        if project_id and e.version:
+            manifest = load_version_manifest(project_id, e.version)
+            if manifest:
+                e_dict["files_generated"] = manifest["files_generated"]
+            e_dict["images_generated"] = manifest["images_generated"] if manifest else 0
+            e_dict["preview_etag"] = manifest["preview"]["etag"] if manifest and manifest["preview"] else None
+        versions_list.append(e_dict)
+    return jsonify({
+        "project_id": project_id,
+        "project_name": project.name,
+        "versions": versions_list,
+    }), 200
+
+
+def read_persisted_logs(project_id: int, version: int) -> list:
+    """Logs of a finished build: the full log file, else the snapshot in the execution result."""
+    version_dir = get_version_dir(project_id, version)
+    logs_data = read_json_file(version_dir / "execution_logs.json")
+    if logs_data and isinstance(logs_data, list):
+        return logs_data
+    result_data = read_json_file(version_dir / "last_execution_result.json")
+    if result_data and isinstance(result_data.get("logs"), list):
+        return result_data["logs"]
+    return []
 
 
 @app.route("/api/projects/<int:project_id>/versions/<int:version>/logs", methods=["GET"])
 def get_version_logs(project_id: int, version: int):
-    session = get_session()
-    try:
-        execution = (
-            session.query(Execution)
-            .filter(Execution.project_id == project_id, Execution.version == version)
-            .first()
-        )
-        if not execution:
-            return jsonify({"error": "Version not found"}), 404
-
-        logs = []
+    session = request_session()
+    execution = (
+        session.query(Execution)
+        .filter(Execution.project_id == project_id, Execution.version == version)
+        .first()
+    )
+    if not execution:
+        return jsonify({"error": "Version not found"}), 404
 
-        # Try to read logs from the execution result JSON
-        result_path = get_version_dir(project_id, version) / "last_execution_result.json"
-        result_data = read_json_file(result_path)
-        if result_data and "logs" in result_data and isinstance(result_data["logs"], list):
-            logs = result_data["logs"]
+    logs = read_persisted_logs(project_id, version)
 
-        # If no logs in result, check for a dedicated logs file
+    # For failed executions with no logs, synthesize a failure entry
+    if execution.status in ("error", "failed"):
         if not logs:
-            logs_path = get_version_dir(project_id, version) / "execution_logs.json"
-            logs_data = read_json_file(logs_path)
-            if logs_data and isinstance(logs_data, list):
-                logs = logs_data
-
-        # For failed executions with no logs, synthesize a failure entry
-        if execution.status in ("error", "failed"):
-            if not logs:
-                logs = [{"timestamp": int(execution.created_at.timestamp() * 1000) if execution.created_at else None,
-                         "message": "Pipeline started."}]
-            logs.append({
-                "timestamp": int(execution.created_at.timestamp() * 1000) if execution.created_at else None,
-                "message": f"Pipeline failed: {execution.error_message or 'Unknown error'}",
-                "type": "error",
-            })
+            logs = [{"timestamp": int(execution.created_at.timestamp() * 1000) if execution.created_at else None,
+                     "message": "Pipeline started."}]
+        logs.append({
+            "timestamp": int(execution.created_at.timestamp() * 1000) if execution.created_at else None,
+            "message": f"Pipeline failed: {execution.error_message or 'Unknown error'}",
+            "type": "error",
+        })
 
-        return jsonify(logs), 200
-    finally:
-        session.close()
+    return jsonify(logs), 200
 
 
 @app.route("/api/projects/<int:project_id>/iterate", methods=["POST"])
@@ -941,8 +1352,11 @@ def iterate_project(project_id: int):
     if state["running"]:
         return jsonify({"error": "A pipeline is already running for this project"}), 409
 
-    session = get_session()
+    session = request_session()
     try:
+        if has_active_job(session, project_id):
+            return jsonify({"error": "A pipeline is already running for this project"}), 409
+
         # Accept either JSON or multipart/form-data (for file uploads)
         if request.content_type and "multipart/form-data" in request.content_type:
             data = {"prompt": request.form.get("prompt", "").strip()}
@@ -962,6 +1376,11 @@ def iterate_project(project_id: int):
         if not project:
             return jsonify({"error": f"Project {project_id} not found"}), 404
 
+        priority = request_priority()
+        retry_after = admission_retry_after(session, project.owner_id, project_id, priority)
+        if retry_after:
+            return queue_full_response(retry_after)
+
         prompt = data["prompt"]
         prompt_history = data.get("prompt_history", [])
         if not prompt_history:
@@ -1003,7 +1422,7 @@ def iterate_project(project_id: int):
             is_active_head=True,
             parent_execution_id=current_head.id if current_head else None,
         )
-        session.add(execution)
+        add_execution(session, project, execution)
 
         project.status = "in_progress"
         project.updated_at = datetime.now(timezone.utc)
@@ -1011,24 +1430,17 @@ def iterate_project(project_id: int):
         session.refresh(execution)
 
         # Immediately persist the user message to chat_messages
-        existing_msgs = []
-        if execution.chat_messages:
-            try:
-                existing_msgs = json.loads(execution.chat_messages)
-            except Exception:
-                existing_msgs = []
-        existing_msgs.append({
+        append_chat_message(session, execution.id, {
             "role": "user",
             "content": prompt,
             "timestamp": datetime.now(timezone.utc).isoformat(),
         })
-        execution.chat_messages = json.dumps(existing_msgs)
         session.commit()
 
-        state["running"] = True
+        # "running" stays False until a worker in this process claims the job
         state["started_at"] = time.time()
         state["current_execution_id"] = execution.id
-        state["logs"] = []
+        state["logs"].clear()
         state["result_ready"] = False
 
         # Save uploaded reference images (if any)
@@ -1046,13 +1458,8 @@ def iterate_project(project_id: int):
             if reference_images:
                 print(f"Saved {len(reference_images)} reference image(s) for project {project_id} v{next_version}")
 
-        print(f"Starting iteration v{next_version} for project {project_id}: {prompt}")
-        thread = threading.Thread(
-            target=run_full_pipeline_async,
-            args=(prompt, prompt_history, project_id, reference_images),
-            daemon=True,
-        )
-        thread.start()
+        print(f"Queueing iteration v{next_version} for project {project_id}: {prompt}")
+        submit_pipeline_job(session, execution, prompt, prompt_history, reference_images, priority=priority)
 
         return jsonify({
             "status": "started",
@@ -1065,25 +1472,18 @@ def iterate_project(project_id: int):
         state["running"] = False
         print(f"Error in iterate_project: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
 
 
 @app.route("/api/executions/<int:execution_id>/restore", methods=["POST"])
 def restore_execution(execution_id: int):
-    session = get_session()
+    session = request_session()
     try:
         execution = session.get(Execution, execution_id)
         if not execution:
             return jsonify({"error": "Execution not found"}), 404
 
         project_id = execution.project_id
-
-        session.query(Execution).filter(
-            Execution.project_id == project_id
-        ).update({"is_active_head": False})
-
-        execution.is_active_head = True
+        set_active_head(session, execution)
 
         project = session.get(Project, project_id)
         if project:
@@ -1103,8 +1503,138 @@ def restore_execution(execution_id: int):
         session.rollback()
         print(f"Error in restore_execution: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
+
+
+@app.route("/api/executions/<int:execution_id>/trace", methods=["GET"])
+def get_execution_trace(execution_id):
+    """Timing spans of the execution's last pipeline run (stages, model calls, retries, writes)."""
+    session = request_session()
+    execution = session.get(Execution, execution_id)
+    if not execution:
+        return jsonify({"error": "Execution not found"}), 404
+    data = read_json_file(get_version_dir(execution.project_id, execution.version) / "last_trace.json")
+    if data is None:
+        return jsonify({"error": "No trace recorded for this execution"}), 404
+    return jsonify(data), 200
+
+
+@app.route("/api/executions/<int:execution_id>/usage", methods=["GET"])
+def get_execution_usage(execution_id):
+    """Ledger of the execution's model calls (all runs, including reruns) with totals by stage and model."""
+    session = request_session()
+    if not session.get(Execution, execution_id):
+        return jsonify({"error": "Execution not found"}), 404
+    rows = (
+        session.query(ModelUsage)
+        .filter(ModelUsage.execution_id == execution_id)
+        .order_by(ModelUsage.id)
+        .all()
+    )
+    calls = [
+        {
+            "stage": r.stage, "agent": r.agent, "provider": r.provider, "model": r.model,
+            "input_tokens": r.input_tokens, "output_tokens": r.output_tokens, "images": r.images,
+            "latency_seconds": r.latency_seconds, "retry": r.retry, "outcome": r.outcome,
+            "cost_usd": r.cost_usd, "created_at": r.created_at.isoformat() if r.created_at else None,
+        }
+        for r in rows
+    ]
+    return jsonify({"execution_id": execution_id, **summarize(rows), "calls": calls}), 200
+
+
+@app.route("/api/executions/<int:execution_id>/rerun", methods=["POST"])
+def rerun_execution(execution_id: int):
+    """
+    Re-run one pipeline stage (and everything downstream of it) against the
+    upstream artifacts already on disk for this version, e.g.
+    {"stage": "engineer", "engineer_model": "claude"}. Without a stage the
+    build resumes at its first incomplete stage.
+    """
+    from agents.engineer_agent import ENGINEER_MODELS
+
+    session = request_session()
+    try:
+        execution = session.get(Execution, execution_id)
+        if not execution:
+            return jsonify({"error": "Execution not found"}), 404
+
+        req_data = request.get_json(silent=True) or {}
+        stage = req_data.get("stage")
+        engineer_model = req_data.get("engineer_model")
+        if stage and stage not in PIPELINE_STAGES:
+            return jsonify({"error": f"Unknown stage '{stage}'", "stages": list(PIPELINE_STAGES)}), 400
+        if engineer_model and engineer_model not in ENGINEER_MODELS:
+            return jsonify({"error": f"Unknown engineer_model '{engineer_model}'", "models": list(ENGINEER_MODELS)}), 400
+
+        project_id = execution.project_id
+        if has_active_job(session, project_id) or get_project_state(project_id).get("running"):
+            return jsonify({"error": "A build is already in progress for this project"}), 409
+
+        project = session.get(Project, project_id)
+        priority = request_priority()
+        retry_after = admission_retry_after(session, project.owner_id if project else None, project_id, priority)
+        if retry_after:
+            return queue_full_response(retry_after)
+
+        version_dir = get_version_dir(project_id, execution.version)
+        if stage:
+            missing = [d for d in PIPELINE_STAGES[stage] if d not in completed_stages(version_dir)]
+            if missing:
+                return jsonify({
+                    "error": f"Cannot re-run '{stage}': upstream stages not completed",
+                    "missing": missing,
+                }), 409
+
+        payload = get_job_payload(session, execution_id)
+        if payload is None:
+            # Execution predates the job queue: rebuild the request from its history
+            history = json.loads(execution.prompt_history or "[]")
+            user_turns = [t["content"] for t in history if t.get("role") == "user"]
+            if not user_turns:
+                return jsonify({"error": "Execution has no prompt to re-run"}), 409
+            payload = {"task_description": user_turns[-1], "prompt_history": history}
+
+        execution.status = "pending"
+        execution.error_message = None
+        if project:
+            project.status = "in_progress"
+            project.updated_at = datetime.now(timezone.utc)
+
+        state = get_project_state(project_id)
+        state["started_at"] = time.time()
+        state["current_execution_id"] = execution.id
+        state["result_ready"] = False
+
+        print(f"Queueing re-run of v{execution.version} for project {project_id} from {stage or 'last checkpoint'}")
+        # Last, after every refusal above, so a refused re-run leaves the version resumable
+        invalidated = invalidate_checkpoints(version_dir, downstream_stages(stage)) if stage else {}
+        try:
+            submit_pipeline_job(
+                session, execution,
+                payload["task_description"],
+                payload.get("prompt_history"),
+                payload.get("reference_images"),
+                resume=True,
+                engineer_model=engineer_model,
+                priority=priority,
+            )
+        except Exception:
+            restore_checkpoints(version_dir, invalidated)
+            raise
+
+        return jsonify({
+            "status": "started",
+            "project_id": project_id,
+            "execution_id": execution.id,
+            "version": execution.version,
+            "rerun_stages": downstream_stages(stage) if stage else None,
+            "reused_stages": resumable_stages(version_dir),
+        }), 200
+
+    except Exception as e:
+        session.rollback()
+        print(f"Error in rerun_execution: {e}")
+        return jsonify({"error": str(e)}), 500
 
 
 # ============================================================================
@@ -1113,13 +1643,18 @@ def restore_execution(execution_id: int):
 
 @app.route("/api/execute-task", methods=["POST"])
 def execute_task():
-    session = get_session()
+    session = request_session()
     try:
         req_data = request.get_json()
         if not req_data:
             return jsonify({"error": "No JSON payload provided"}), 400
 
         project_id = req_data.get("project_id")
+        existing = session.get(Project, project_id) if project_id else None
+        priority = request_priority()
+        retry_after = admission_retry_after(session, existing.owner_id if existing else None, project_id, priority)
+        if retry_after:
+            return queue_full_response(retry_after)
 
         if not project_id:
             project = Project(name="Untitled Project", description="", status="in_progress")
@@ -1160,24 +1695,18 @@ def execute_task():
             is_active_head=True,
             parent_execution_id=None,
         )
-        session.add(execution)
+        add_execution(session, project, execution)
         session.commit()
         session.refresh(execution)
 
         state = get_project_state(project_id)
-        state["running"] = True
         state["started_at"] = time.time()
         state["current_execution_id"] = execution.id
-        state["logs"] = []
+        state["logs"].clear()
         state["result_ready"] = False
 
-        print(f"Starting v{next_version} for project {project_id}: {task_description}")
-        thread = threading.Thread(
-            target=run_full_pipeline_async,
-            args=(task_description, initial_history, project_id),
-            daemon=True,
-        )
-        thread.start()
+        print(f"Queueing v{next_version} for project {project_id}: {task_description}")
+        submit_pipeline_job(session, execution, task_description, initial_history, priority=priority)
 
         return jsonify({
             "status": "started",
@@ -1191,8 +1720,6 @@ def execute_task():
             get_project_state(project_id)["running"] = False
         print(f"Error in execute_task: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
 
 
 @app.route("/api/execution-status", methods=["GET"])
@@ -1210,10 +1737,66 @@ def execution_status():
             "execution_id": None,
         }), 200
 
+    return jsonify(execution_status_payload(project_id, since=request.args.get("since"))), 200
+
+
+def _log_position(log_id) -> tuple | None:
+    """Order of a log id "log-<ms>-<n>": by time first, so ids survive a restart."""
+    try:
+        _, ts, n = str(log_id).split("-")
+        return int(ts), int(n)
+    except ValueError:
+        return None
+
+
+def execution_status_payload(project_id: int, since: str = None) -> dict:
+    """
+    Status of the project's current build; shared by polling and the SSE
+    stream. With `since` (a log id), "logs" holds only newer entries.
+    "log_cursor" is the id to pass as `since` next time.
+    """
+    payload = _execution_status(project_id)
+    logs = list(payload.get("logs") or [])
+    payload["log_cursor"] = logs[-1].get("id") if logs else since
+    cursor = _log_position(since) if since else None
+    if cursor:
+        logs = [entry for entry in logs if (_log_position(entry.get("id")) or (0, 0)) > cursor]
+    payload["logs"] = logs
+    return payload
+
+
+def _execution_status(project_id: int) -> dict:
     state = get_project_state(project_id)
     version = None
     execution_id = state.get("current_execution_id")
 
+    if not execution_id:
+        # Nothing in memory (web tier restarted, or the build was enqueued by
+        # another process) -- pick up an in-flight job from the queue table
+        session = get_session()
+        try:
+            active_job = (
+                session.query(PipelineJob)
+                .filter(PipelineJob.project_id == project_id, PipelineJob.status.in_(ACTIVE_JOB_STATUSES))
+                .order_by(PipelineJob.id.desc())
+                .first()
+            )
+            if active_job:
+                execution_id = active_job.execution_id
+            else:
+                # In-memory state was evicted (or never existed): report the latest
+                # finished build. Pending rows without a job are orphans, not builds.
+                latest = (
+                    session.query(Execution.id)
+                    .filter(Execution.project_id == project_id, Execution.status.notin_(("pending", "running")))
+                    .order_by(Execution.id.desc())
+                    .first()
+                )
+                if latest:
+                    execution_id = latest.id
+        finally:
+            session.close()
+
     if execution_id:
         session = get_session()
         try:
@@ -1223,24 +1806,44 @@ def execution_status():
                 # 7C.2: DB is ground truth when pipeline not actively running
                 if not state["running"] and execution.status in ("success", "error"):
                     db_status = "COMPLETED" if execution.status == "success" else "FAILED"
-                    return jsonify({
+                    logs = state.get("logs") or []
+                    if not logs:
+                        # Built by another worker process, or state evicted -- logs were persisted
+                        logs = read_persisted_logs(project_id, version)
+                    return {
                         "status": db_status,
                         "currentStage": "engineer",
+                        "logs": logs,
+                        "engineerTasks": [],
+                        "project_id": project_id,
+                        "execution_id": execution_id,
+                    }
+                # Queued, or leased by a worker on another node: DB status is authoritative
+                if not state["running"] and execution.status in ("pending", "running"):
+                    response = {
+                        "status": "RUNNING",
+                        "currentStage": "pm",
                         "logs": state.get("logs", []),
                         "engineerTasks": [],
                         "project_id": project_id,
                         "execution_id": execution_id,
-                    }), 200
+                    }
+                    job = session.query(PipelineJob).filter_by(execution_id=execution_id).first()
+                    position = queue_position(session, job) if job else None
+                    if position:
+                        response["queue_position"] = position
+                        response["estimated_wait_seconds"] = estimate_wait_seconds(session, position)
+                    return response
                 # Crash recovery: in-memory says RUNNING but DB was cleaned up on restart
                 if state["running"] and execution.status in ("failed", "error"):
-                    return jsonify({
+                    return {
                         "status": "FAILED",
                         "currentStage": "engineer",
                         "logs": state.get("logs", []),
                         "engineerTasks": [],
                         "project_id": project_id,
                         "execution_id": execution_id,
-                    }), 200
+                    }
         finally:
             session.close()
 
@@ -1272,33 +1875,80 @@ def execution_status():
     if data is not None and state.get("result_ready", True):
         raw_status = str(data.get("status", "success")).lower()
         frontend_status = STATUS_MAP.get(raw_status, "COMPLETED")
-        return jsonify({
+        return {
             "status": frontend_status,
             "currentStage": "engineer",
             "logs": logs,
             "engineerTasks": [],
             "project_id": project_id,
             "execution_id": execution_id,
-        }), 200
+        }
 
     if state["running"]:
-        return jsonify({
+        return {
             "status": "RUNNING",
             "currentStage": current_stage,
+            "stages": dict(state.get("stages") or {}),
             "logs": logs,
             "engineerTasks": [],
             "project_id": project_id,
             "execution_id": execution_id,
-        }), 200
+        }
 
-    return jsonify({
+    return {
         "status": "FAILED",
         "currentStage": "complete",
         "logs": logs,
         "engineerTasks": [],
         "project_id": project_id,
         "execution_id": execution_id,
-    }), 200
+    }
+
+
+@app.route("/api/projects/<int:project_id>/events", methods=["GET"])
+def project_events(project_id):
+    """
+    Server-Sent Events stream of a project's build progress: "log" entries,
+    "stage" transitions and full "status" payloads (same shape as
+    /api/execution-status). A fresh connection starts with a status snapshot;
+    a reconnect with Last-Event-ID (header or ?last_event_id=) replays only
+    the events it missed.
+    """
+    cursor = event_broker.parse_event_id(request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+
+    def stream():
+        nonlocal cursor
+        yield f"retry: {RECONNECT_MS}\n\n"
+        pending = event_broker.replay(project_id, cursor) if cursor is not None else None
+        last_status = None
+        while True:
+            if pending is None:
+                # New client, restarted server or overflowed buffer: resync from a snapshot
+                cursor = event_broker.last_seq(project_id)
+                snapshot = execution_status_payload(project_id)
+                last_status = snapshot["status"]
+                yield format_sse(event_broker.event_id(cursor), "status", snapshot)
+                pending = []
+            for seq, event, data in pending:
+                cursor = seq
+                if event == "status":
+                    last_status = data.get("status")
+                yield format_sse(event_broker.event_id(seq), event, data)
+            pending = event_broker.wait(project_id, cursor, KEEPALIVE_SECONDS)
+            if pending == []:
+                # Builds running in a separate worker process never reach this broker
+                if last_status == "RUNNING" and not get_project_state(project_id)["running"]:
+                    snapshot = execution_status_payload(project_id)
+                    if snapshot["status"] != last_status:
+                        last_status = snapshot["status"]
+                        yield format_sse(event_broker.event_id(cursor), "status", snapshot)
+                        continue
+                yield ": keepalive\n\n"
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 
 @app.route("/api/code", methods=["GET"])
@@ -1368,6 +2018,8 @@ def get_prd():
 @app.route("/api/projects/<int:project_id>/versions/<int:version>/files", methods=["GET"])
 def get_version_files(project_id: int, version: int):
     code_dir = get_version_dir(project_id, version) / "code"
+    # None while the build is still writing files: those are read from disk
+    manifest = load_version_manifest(project_id, version)
 
     file_path = request.args.get("path")
     if file_path:
@@ -1376,7 +2028,10 @@ def get_version_files(project_id: int, version: int):
             target.resolve().relative_to(code_dir.resolve())
         except ValueError:
             return jsonify({"error": "Invalid path"}), 400
-        if not target.exists() or not target.is_file():
+        if manifest:
+            if file_path not in {f["path"] for f in manifest["files"]}:
+                return jsonify({"error": "File not found"}), 404
+        elif not target.is_file():
             return jsonify({"error": "File not found"}), 404
         try:
             content = target.read_text(encoding="utf-8", errors="replace")
@@ -1385,6 +2040,10 @@ def get_version_files(project_id: int, version: int):
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    if manifest:
+        tree = manifest_tree(f["path"] for f in manifest["files"])
+        return jsonify({"tree": tree, "code_dir": str(code_dir)}), 200
+
     if not code_dir.exists():
         return jsonify({"tree": [], "message": "No files generated yet"}), 200
 
@@ -1426,59 +2085,62 @@ PREVIEW_PLACEHOLDER = """<!DOCTYPE html>
 </html>"""
 
 
+def send_precompressed(path: Path, etag: str, mimetype: str, cache_control: str) -> Response:
+    """
+    Send a bundle file (bundles.py) as the best precompressed variant the
+    client accepts, or 304 if its ETag matches. send_file hands the open
+    file to the server's wsgi.file_wrapper (sendfile), or to the proxy when
+    USE_X_SENDFILE is set.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        variant, encoding = pick_variant(path, request.accept_encodings)
+        response = send_file(variant, mimetype=mimetype, conditional=False, etag=False, max_age=None)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
 @app.route("/api/preview/<int:project_id>/<int:version>", methods=["GET"])
 def get_preview(project_id: int, version: int):
-    code_dir = get_version_dir(project_id, version) / "code"
-    html_file = code_dir / "src" / "index.html"
-
-    target = None
-    if html_file.exists():
-        target = html_file
-    elif code_dir.exists():
-        html_files = list(code_dir.rglob("*.html"))
-        if html_files:
-            target = html_files[0]
-
-    if target:
-        html = target.read_text(encoding="utf-8", errors="replace")
-        src_dir = code_dir / "src"
-        if src_dir.exists():
-            for css_path in sorted(src_dir.glob("*.css")):
-                css = css_path.read_text(encoding="utf-8", errors="replace")
-                link_tag = f'<link rel="stylesheet" href="./{css_path.name}">'
-                if link_tag in html:
-                    html = html.replace(link_tag, f"<style>{css}</style>")
-                elif "</head>" in html:
-                    html = html.replace("</head>", f"<style>{css}</style>\n</head>")
-            for js_path in sorted(src_dir.glob("*.js")):
-                js = js_path.read_text(encoding="utf-8", errors="replace")
-                script_tag = f'<script src="./{js_path.name}">'
-                if script_tag in html:
-                    html = html.replace(f'{script_tag}</script>', f"<script>{js}</script>")
-                elif "</body>" in html:
-                    html = html.replace("</body>", f"<script>{js}</script>\n</body>")
-        return Response(html, mimetype="text/html")
-
-    return Response(PREVIEW_PLACEHOLDER, mimetype="text/html", status=200)
+    """
+    Serves the preview rendered at build completion. A URL carrying the
+    page's ETag as ?h= is cached as immutable; otherwise clients revalidate
+    and get a 304 while the version is unchanged.
+    """
+    manifest = load_version_manifest(project_id, version)
+    preview = manifest and manifest["preview"]
+    if not preview:
+        response = Response(PREVIEW_PLACEHOLDER, mimetype="text/html", status=200)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    etag = preview["etag"]
+    return send_precompressed(
+        get_version_dir(project_id, version) / preview["path"], etag, "text/html",
+        IMMUTABLE if request.args.get("h") == etag else "no-cache",
+    )
 
 
 @app.route("/api/projects/<int:project_id>/versions/<int:version>/debug-files", methods=["GET"])
 def debug_version_files(project_id: int, version: int):
     version_dir = get_version_dir(project_id, version)
+    manifest = load_version_manifest(project_id, version) or {}
     result = {}
-    for subdir in ["code", "assets"]:
-        d = version_dir / subdir
-        result[subdir] = {"exists": d.exists(), "files": []}
-        if d.exists():
-            for f in sorted(d.rglob("*")):
-                if f.is_file():
-                    result[subdir]["files"].append({
-                        "path": str(f.relative_to(d)).replace("\\", "/"),
-                        "size": f.stat().st_size
-                    })
+    for subdir, key in (("code", "files"), ("assets", "assets")):
+        entries = manifest.get(key, [])
+        result[subdir] = {
+            "exists": bool(entries) or (version_dir / subdir).exists(),
+            "files": [{"path": e["path"], "size": e["bytes"], "sha256": e["sha256"]} for e in entries],
+        }
     return jsonify({
         "version_dir": str(version_dir),
         "exists": version_dir.exists(),
+        "manifest": bool(manifest),
         "subdirs": result
     }), 200
 
@@ -1486,47 +2148,40 @@ def debug_version_files(project_id: int, version: int):
 @app.route("/api/projects/<int:project_id>/head", methods=["GET"])
 def get_project_head(project_id: int):
     """Returns the active head execution for a project."""
-    session = get_session()
-    try:
+    session = request_session()
+    head = (
+        session.query(Execution)
+        .filter(
+            Execution.project_id == project_id,
+            Execution.is_active_head == True,
+        )
+        .first()
+    )
+    if not head:
+        # Fallback: latest version
         head = (
             session.query(Execution)
-            .filter(
-                Execution.project_id == project_id,
-                Execution.is_active_head == True,
-            )
+            .filter(Execution.project_id == project_id)
+            .order_by(Execution.version.desc())
             .first()
         )
-        if not head:
-            # Fallback: latest version
-            head = (
-                session.query(Execution)
-                .filter(Execution.project_id == project_id)
-                .order_by(Execution.version.desc())
-                .first()
-            )
-        if not head:
-            return jsonify({"error": "No executions found"}), 404
-        return jsonify({"project_id": project_id, "version": head.version, "execution_id": head.id}), 200
-    finally:
-        session.close()
+    if not head:
+        return jsonify({"error": "No executions found"}), 404
+    return jsonify({"project_id": project_id, "version": head.version, "execution_id": head.id}), 200
 @app.route("/api/credits/balance", methods=["GET"])
 def get_credits_balance():
     plan_credits = 500  # Pro plan (pre-auth mock)
     from sqlalchemy import func
-    session = get_session()
-    try:
-        used = session.query(func.sum(Execution.credits_used)).filter(
-            Execution.credits_used.isnot(None)
-        ).scalar() or 0
-        balance = max(0, plan_credits - int(used))
-        return jsonify({
-            "plan": "Pro",
-            "plan_credits": plan_credits,
-            "credits_used": int(used),
-            "credits_remaining": balance
-        })
-    finally:
-        session.close()
+    session = request_session()
+    # Build and non-build model usage is rolled up as it is billed (see persist_usage)
+    used = session.query(func.coalesce(func.sum(UsageRollup.credits_used), 0)).scalar()
+    balance = max(0, plan_credits - int(used))
+    return jsonify({
+        "plan": "Pro",
+        "plan_credits": plan_credits,
+        "credits_used": int(used),
+        "credits_remaining": balance
+    })
 
 
 @app.route("/api/projects/<int:project_id>/versions/<int:version>/factsheet", methods=["GET"])
@@ -1536,18 +2191,15 @@ def get_factsheet(project_id: int, version: int):
     data = read_json_file(factsheet_path)
     if data:
         return jsonify(data), 200
-    session = get_session()
-    try:
-        execution = (
-            session.query(Execution)
-            .filter(Execution.project_id == project_id, Execution.version == version)
-            .first()
-        )
-        if execution and execution.governance_log:
-            return jsonify(json.loads(execution.governance_log)), 200
-        return jsonify({"error": "Factsheet not available for this version"}), 404
-    finally:
-        session.close()
+    session = request_session()
+    execution = (
+        session.query(Execution)
+        .filter(Execution.project_id == project_id, Execution.version == version)
+        .first()
+    )
+    if execution and execution.governance_log:
+        return jsonify(json.loads(execution.governance_log)), 200
+    return jsonify({"error": "Factsheet not available for this version"}), 404
 
 
 @app.route("/api/health", methods=["GET"])
@@ -1555,6 +2207,36 @@ def health():
     return jsonify({"status": "ok"}), 200
 
 
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text format: stage/model latency histograms, build outcomes, queue and cache state."""
+    from sqlalchemy import func
+    from utils.llm_cache import get_llm_cache
+    from utils.rate_limiter import get_rate_limiter
+
+    session = request_session()
+    lanes = {name: 0 for name in PRIORITY_CLASSES}
+    lane_names = {v: k for k, v in PRIORITY_CLASSES.items()}
+    queued = (
+        session.query(PipelineJob.priority, func.count(PipelineJob.id))
+        .filter(PipelineJob.status == JOB_QUEUED)
+        .group_by(PipelineJob.priority)
+        .all()
+    )
+    for priority, count in queued:
+        lanes[lane_names.get(priority, str(priority))] = count
+    claimed = session.query(func.count(PipelineJob.id)).filter(PipelineJob.status == JOB_CLAIMED).scalar() or 0
+    for lane, count in lanes.items():
+        QUEUE_DEPTH.set(count, lane=lane)
+    ACTIVE_PIPELINES.set(claimed, scope="cluster")
+    ACTIVE_PIPELINES.set(sum(1 for st in list(execution_state.values()) if st.get("running")), scope="process")
+    for agent, counts in get_llm_cache().stats()["agents"].items():
+        LLM_CACHE_REQUESTS.set(counts["hits"], agent=agent, result="hit")
+        LLM_CACHE_REQUESTS.set(counts["misses"], agent=agent, result="miss")
+    RATE_LIMIT_WAIT.set(round(get_rate_limiter().seconds_waited, 3))
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/assets/<int:project_id>/<int:version>/<filename>", methods=["GET"])
 def get_asset(project_id: int, version: int, filename: str):
     asset_path = get_version_dir(project_id, version) / "assets" / filename
@@ -1572,56 +2254,47 @@ def project_chat(project_id: int):
         requested_archetype = detect_requested_archetype(data["message"])
         # Load PRD from active head version for context-aware replies
         project_context = None
-        db = get_session()
-        try:
-            project = db.get(Project, project_id)
-            if (
-                project
-                and project.locked_ui_archetype
-                and requested_archetype
-                and requested_archetype != project.locked_ui_archetype
-            ):
-                return jsonify({
-                    "response_type": "chat",
-                    "message": (
-                        f"That would change the app type from {project.locked_ui_archetype} to "
-                        f"{requested_archetype}. To switch app types, please start a new project."
-                    ),
-                }), 200
+        db = request_session()
+        project = db.get(Project, project_id)
+        if (
+            project
+            and project.locked_ui_archetype
+            and requested_archetype
+            and requested_archetype != project.locked_ui_archetype
+        ):
+            return jsonify({
+                "response_type": "chat",
+                "message": (
+                    f"That would change the app type from {project.locked_ui_archetype} to "
+                    f"{requested_archetype}. To switch app types, please start a new project."
+                ),
+            }), 200
 
-            head = (
-                db.query(Execution)
-                .filter(Execution.project_id == project_id, Execution.is_active_head == True)
-                .first()
-            )
-            # Immediately persist the user message to chat_messages
-            if head:
-                existing_msgs = []
-                if head.chat_messages:
-                    try:
-                        existing_msgs = json.loads(head.chat_messages)
-                    except Exception:
-                        existing_msgs = []
-                existing_msgs.append({
-                    "role": "user",
-                    "content": data["message"],
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                })
-                head.chat_messages = json.dumps(existing_msgs)
-                db.commit()
+        head = (
+            db.query(Execution)
+            .filter(Execution.project_id == project_id, Execution.is_active_head == True)
+            .first()
+        )
+        # Immediately persist the user message to chat_messages
+        if head:
+            append_chat_message(db, head.id, {
+                "role": "user",
+                "content": data["message"],
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            })
+            db.commit()
 
-            if head:
-                prd_path = get_version_dir(project_id, head.version) / "last_prd.json"
-                prd_data = read_json_file(prd_path)
-                if prd_data:
-                    prd = prd_data.get("prd", prd_data)
-                    title = prd.get("document_title", "Unknown")
-                    overview = prd.get("overview", "")
-                    features = ", ".join(prd.get("core_features_mvp", []))
-                    stack = ", ".join(prd.get("technical_stack_recommendation", []))
-                    project_context = f"Project: {title}\nOverview: {overview}\nFeatures: {features}\nStack: {stack}"
-        finally:
-            db.close()
+        if head:
+            prd_path = get_version_dir(project_id, head.version) / "last_prd.json"
+            prd_data = read_json_file(prd_path)
+            if prd_data:
+                prd = prd_data.get("prd", prd_data)
+                title = prd.get("document_title", "Unknown")
+                overview = prd.get("overview", "")
+                features = ", ".join(prd.get("core_features_mvp", []))
+                stack = ", ".join(prd.get("technical_stack_recommendation", []))
+                project_context = f"Project: {title}\nOverview: {overview}\nFeatures: {features}\nStack: {stack}"
+        db.close()  # don't hold a pooled connection through the model calls below
 
         sys.path.insert(0, str(REPO_ROOT))
 
@@ -1642,7 +2315,15 @@ def project_chat(project_id: int):
 
         from agents.pm_agent import PMAgent
         pm = PMAgent()
-        intent = pm.classify_intent(data["message"], project_context=project_context)
+        ledger = begin_ledger(stage="classify_intent")
+        try:
+            intent = pm.classify_intent(data["message"], project_context=project_context)
+        finally:
+            try:
+                persist_usage(db, end_ledger(ledger), project_id=project_id)
+            except Exception as usage_err:
+                db.rollback()
+                print(f"Usage ledger not saved (non-fatal): {usage_err}")
         if intent.get("type") == "chat":
             return jsonify({"response_type": "chat", "message": intent["message"]}), 200
         return jsonify({"response_type": "build"}), 200
@@ -1661,59 +2342,66 @@ def project_chat(project_id: int):
 
 @app.route("/api/projects/<int:project_id>/chat-history", methods=["GET"])
 def get_chat_history(project_id: int):
-    """Returns saved chat messages for the active head execution."""
-    db = get_session()
-    try:
+    """
+    Returns saved chat messages for the active head execution, oldest first:
+    the latest `limit` (default CHAT_HISTORY_PAGE_SIZE) messages, or those
+    before seq `before`. X-Next-Cursor holds the `before` value for the
+    previous page and is absent once the first message is included.
+    """
+    limit = min(max(request.args.get("limit", CHAT_HISTORY_PAGE_SIZE, type=int), 1), CHAT_HISTORY_MAX_PAGE_SIZE)
+    before = request.args.get("before", type=int)
+    db = request_session()
+    head = (
+        db.query(Execution)
+        .filter(Execution.project_id == project_id, Execution.is_active_head == True)
+        .first()
+    )
+    if not head:
         head = (
             db.query(Execution)
-            .filter(Execution.project_id == project_id, Execution.is_active_head == True)
+            .filter(Execution.project_id == project_id)
+            .order_by(Execution.id.desc())
             .first()
         )
-        if not head:
-            head = (
-                db.query(Execution)
-                .filter(Execution.project_id == project_id)
-                .order_by(Execution.id.desc())
-                .first()
-            )
-        if not head or not head.chat_messages:
-            return jsonify([]), 200
-        try:
-            messages = json.loads(head.chat_messages)
-        except Exception:
-            messages = []
-        return jsonify(messages), 200
-    finally:
-        db.close()
+    if not head:
+        return jsonify([]), 200
+    query = db.query(ChatMessage).filter(ChatMessage.execution_id == head.id)
+    if before is not None:
+        query = query.filter(ChatMessage.seq < before)
+    rows = query.order_by(ChatMessage.seq.desc()).limit(limit + 1).all()
+    page = rows[:limit][::-1]
+    response = jsonify([m.to_dict() for m in page])
+    if len(rows) > limit:
+        response.headers["X-Next-Cursor"] = str(page[0].seq)
+    return response, 200
 
 
 @app.route("/api/projects/<int:project_id>/chat-messages", methods=["POST"])
 def save_chat_messages(project_id: int):
-    """Saves full chat message array to the active head execution."""
+    """Saves full chat message array to the active head execution (appending only new messages)."""
     data = request.get_json()
     if not data or "messages" not in data:
         return jsonify({"error": "messages array required"}), 400
-    db = get_session()
-    try:
+    db = request_session()
+    head = (
+        db.query(Execution)
+        .filter(Execution.project_id == project_id, Execution.is_active_head == True)
+        .first()
+    )
+    if not head:
         head = (
             db.query(Execution)
-            .filter(Execution.project_id == project_id, Execution.is_active_head == True)
+            .filter(Execution.project_id == project_id)
+            .order_by(Execution.id.desc())
             .first()
         )
-        if not head:
-            head = (
-                db.query(Execution)
-                .filter(Execution.project_id == project_id)
-                .order_by(Execution.id.desc())
-                .first()
-            )
-        if not head:
-            return jsonify({"error": "No execution found for this project"}), 404
-        head.chat_messages = json.dumps(data["messages"])
-        db.commit()
-        return jsonify({"saved": len(data["messages"])}), 200
-    finally:
-        db.close()
+    if not head:
+        return jsonify({"error": "No execution found for this project"}), 404
+    if not isinstance(data["messages"], list):
+        return jsonify({"error": "messages array required"}), 400
+    written = save_chat_history(db, head.id, data["messages"])
+    db.commit()
+    return jsonify({"saved": len(data["messages"]), "written": written}), 200
 
 
 # ============================================================================
@@ -1731,7 +2419,7 @@ def generate_slug(project_name: str, version: int) -> str:
 
 @app.route("/api/projects/<int:project_id>/versions/<int:version>/publish", methods=["POST"])
 def publish_version(project_id: int, version: int):
-    session = get_session()
+    session = request_session()
     try:
         execution = (
             session.query(Execution)
@@ -1747,14 +2435,9 @@ def publish_version(project_id: int, version: int):
             project = session.get(Project, project_id)
             slug = generate_slug(project.name if project else "app", version)
 
-            code_dir = get_version_dir(project_id, version) / "code"
-            if not code_dir.exists():
+            if not publish_bundle(project_id, version, slug):
                 return jsonify({"error": "No code generated for this version"}), 404
 
-            published_dir = REPO_ROOT / "published" / slug
-            published_dir.mkdir(parents=True, exist_ok=True)
-            shutil.copytree(code_dir, published_dir, dirs_exist_ok=True)
-
             execution.published_slug = slug
             session.commit()
 
@@ -1762,37 +2445,98 @@ def publish_version(project_id: int, version: int):
     except Exception as e:
         print(f"Publish error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
 
 
-@app.route("/published/<slug>", methods=["GET"])
-def serve_published(slug: str):
-    if not all(c.isalnum() or c in "-_" for c in slug):
-        return "Invalid slug", 400
+_publish_locks: dict[str, threading.RLock] = {}
+_publish_locks_lock = threading.Lock()
 
-    published_dir = REPO_ROOT / "published" / slug
-    html_file = published_dir / "src" / "index.html"
 
-    if not html_file.exists():
-        html_files = list(published_dir.rglob("*.html"))
-        html_file = html_files[0] if html_files else None
+def _publish_lock(slug: str) -> threading.RLock:
+    with _publish_locks_lock:
+        return _publish_locks.setdefault(slug, threading.RLock())
 
-    if not html_file:
-        return "Published app not found", 404
 
-    html = Path(html_file).read_text(encoding="utf-8", errors="replace")
-    src_dir = Path(html_file).parent
-    for css_path in sorted(src_dir.glob("*.css")):
-        css = css_path.read_text(encoding="utf-8", errors="replace")
-        link_tag = f'<link rel="stylesheet" href="./{css_path.name}">'
-        if link_tag in html:
-            html = html.replace(link_tag, f"<style>{css}</style>")
-        elif "</head>" in html:
-            html = html.replace("</head>", f"<style>{css}</style>\n</head>")
-    return Response(html, mimetype="text/html")
+def publish_bundle(project_id: int, version: int, slug: str) -> dict | None:
+    """
+    Build the optimized static bundle of a version (bundles.py) and swap it
+    in as published/<slug>. Returns the bundle manifest, or None if the
+    version has no entry page.
+    """
+    manifest = load_version_manifest(project_id, version)
+    if not manifest or not manifest["entry_html"]:
+        return None
+
+    def asset_path(asset_project_id: int, asset_version: int, filename: str):
+        # Only this project's design assets (possibly an ancestor version's) go into its bundle
+        if asset_project_id != project_id:
+            return None
+        path = get_version_dir(asset_project_id, asset_version) / "assets" / filename
+        return path if path.is_file() else None
+
+    published_root = REPO_ROOT / "published"
+    published_root.mkdir(parents=True, exist_ok=True)
+    staging = published_root / f".{slug}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _publish_lock(slug):
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            bundle = build_published_bundle(
+                get_version_dir(project_id, version) / "code", manifest, staging, f"/published/{slug}", asset_path,
+            )
+            write_json_file(staging / PUBLISHED_MANIFEST, bundle)
+            published_dir = published_root / slug
+            if published_dir.exists():
+                retired = published_root / f".{slug}.{os.getpid()}.{threading.get_ident()}.old"
+                published_dir.rename(retired)
+                staging.rename(published_dir)
+                shutil.rmtree(retired, ignore_errors=True)
+            else:
+                staging.rename(published_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return bundle
+
+
+def published_bundle(slug: str) -> dict | None:
+    """Bundle manifest of a published site; sites published before bundles are rebuilt once."""
+    manifest_path = REPO_ROOT / "published" / slug / PUBLISHED_MANIFEST
+    bundle = read_manifest(manifest_path, "published_bundle", BUNDLE_VERSION)
+    if bundle:
+        return bundle
+    session = request_session()
+    execution = session.query(Execution).filter(Execution.published_slug == slug).first()
+    if not execution:
+        return None
+    with _publish_lock(slug):
+        # Concurrent first visits queue here; only the first one rebuilds
+        bundle = read_manifest(manifest_path, "published_bundle", BUNDLE_VERSION)
+        if bundle:
+            return bundle
+        try:
+            return publish_bundle(execution.project_id, execution.version, slug)
+        except OSError:
+            # Another process swapped its rebuild in first; serve that one
+            bundle = read_manifest(manifest_path, "published_bundle", BUNDLE_VERSION)
+            if bundle:
+                return bundle
+            raise
+
 
+@app.route("/published/<slug>", methods=["GET"])
+@app.route("/published/<slug>/<path:filename>", methods=["GET"])
+def serve_published(slug: str, filename: str = "index.html"):
+    if not all(c.isalnum() or c in "-_" for c in slug):
+        return "Invalid slug", 400
 
+    bundle = published_bundle(slug)
+    # Only paths the bundle lists are served, so nothing outside it is reachable
+    entry = bundle and bundle["files"].get(filename)
+    if not entry:
+        return "Published app not found", 404
+
+    cache_control = PUBLISHED_PAGE_CACHE if filename == bundle["entry"] else IMMUTABLE
+    return send_precompressed(
+        REPO_ROOT / "published" / slug / filename, entry["etag"], entry["mimetype"], cache_control,
+    )
 
 
 # ============================================================================
@@ -1851,39 +2595,46 @@ def watson_stt():
 # DOWNLOAD ENDPOINT (zip code folder)
 # ============================================================================
 
+# Asset URLs in downloaded HTML/CSS point at the archive's assets/ folder instead
+DOWNLOAD_ASSET_URL = re.compile(r"/api/assets/[0-9]+/[0-9]+/([^ \"\'>]+)")
+
+
 @app.route("/api/projects/<int:project_id>/versions/<int:version>/download", methods=["GET"])
 def download_version(project_id: int, version: int):
-    import zipfile, io
-    code_dir = get_version_dir(project_id, version) / "code"
-    if not code_dir.exists():
+    """
+    ZIP of the version's code and assets. The first download streams the
+    archive while caching it under download/<manifest digest>.zip; later
+    ones send that file.
+    """
+    version_dir = get_version_dir(project_id, version)
+    manifest = load_version_manifest(project_id, version)
+    if not manifest:
         return jsonify({"error": "No code found for this version"}), 404
 
-    assets_dir = get_version_dir(project_id, version) / "assets"
-
-    import re as _re
-
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for file_path in code_dir.rglob("*"):
-            if file_path.is_file():
-                if file_path.suffix.lower() in (".html", ".css"):
-                    raw = file_path.read_text(encoding="utf-8", errors="replace")
-                    fixed = _re.sub(
-                        r"/api/assets/[0-9]+/[0-9]+/([^ \"\'>]+)",
-                        r"../assets/\1",
-                        raw
-                    )
-                    zf.writestr(str(file_path.relative_to(code_dir)).replace("\\", "/"), fixed)
-                else:
-                    zf.write(file_path, file_path.relative_to(code_dir))
-        if assets_dir.exists():
-            for file_path in assets_dir.rglob("*"):
-                if file_path.is_file():
-                    zf.write(file_path, Path("assets") / file_path.relative_to(assets_dir))
-    buf.seek(0)
-
     filename = f"project-{project_id}-v{version}.zip"
-    return send_file(buf, mimetype="application/zip", as_attachment=True, download_name=filename)
+    digest = archive_digest(manifest)
+    cached = version_dir / "download" / f"{digest}.zip"
+    if cached.exists():
+        return send_file(cached, mimetype="application/zip", as_attachment=True, download_name=filename, etag=digest)
+
+    if cached.parent.exists():
+        for stale in cached.parent.glob("*.zip"):
+            stale.unlink(missing_ok=True)
+
+    def local_assets(raw: str) -> str:
+        return DOWNLOAD_ASSET_URL.sub(r"../assets/\1", raw)
+
+    code_dir = version_dir / "code"
+    entries = [
+        (f["path"], code_dir / f["path"], local_assets if f["path"].endswith((".html", ".css")) else None)
+        for f in manifest["files"]
+    ]
+    entries += [("assets/" + a["path"], version_dir / "assets" / a["path"], None) for a in manifest["assets"]]
+    response = Response(stream_zip(entries, cached), mimetype="application/zip")
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 # ============================================================================
 # WATSON TEXT TO SPEECH ENDPOINT (Phase 10.2)
 # ============================================================================
@@ -1919,41 +2670,25 @@ def watson_tts():
 @jwt_required(optional=True)
 def dashboard_stats():
     """Return average governance scores for the logged-in user's builds."""
+    from sqlalchemy import case, func
     uid = get_jwt_identity()
-    session = get_session()
-    try:
-        q = session.query(Execution)
-        if uid:
-            q = q.join(Project).filter(Project.owner_id == int(uid))
-        executions = q.all()
-        prompt_scores = []
-        build_scores = []
-
-        for ex in executions:
-            if not ex.governance_log:
-                continue
-            try:
-                factsheet = json.loads(ex.governance_log)
-                scoring = factsheet.get("scoring", {})
-                ps = scoring.get("prompt_quality", {}).get("score")
-                bs = scoring.get("build_confidence", {}).get("score")
-                if ps is not None:
-                    prompt_scores.append(ps)
-                if bs is not None:
-                    build_scores.append(bs)
-            except Exception:
-                continue
-
-        avg_prompt = round(sum(prompt_scores) / len(prompt_scores)) if prompt_scores else None
-        avg_build = round(sum(build_scores) / len(build_scores)) if build_scores else None
+    session = request_session()
+    q = session.query(
+        func.avg(Execution.prompt_quality_score),
+        func.avg(Execution.build_confidence_score),
+        func.count(Execution.prompt_quality_score),
+        func.count(case((Execution.human_review_required == True, 1))),  # noqa: E712
+    )
+    if uid:
+        q = q.join(Project).filter(Project.owner_id == int(uid))
+    avg_prompt, avg_build, scored, review = q.one()
 
-        return jsonify({
-            "avg_prompt_score": avg_prompt,
-            "avg_build_score": avg_build,
-            "scored_builds": len(prompt_scores),
-        })
-    finally:
-        session.close()
+    return jsonify({
+        "avg_prompt_score": round(avg_prompt) if avg_prompt is not None else None,
+        "avg_build_score": round(avg_build) if avg_build is not None else None,
+        "scored_builds": scored,
+        "human_review_builds": review,
+    })
 
 
 @app.route("/api/projects/<int:project_id>/versions/<int:version>/factsheet/pdf", methods=["GET"])
@@ -1969,15 +2704,11 @@ def download_factsheet_pdf(project_id: int, version: int):
     factsheet_path = get_version_dir(project_id, version) / "last_factsheet.json"
     factsheet = read_json_file(factsheet_path)
     if not factsheet:
-        session = get_session()
-        try:
-            execution = session.query(Execution).filter(
-                Execution.project_id == project_id, Execution.version == version
-            ).first()
-            if execution and execution.governance_log:
-                factsheet = json.loads(execution.governance_log)
-        finally:
-            session.close()
+        execution = request_session().query(Execution).filter(
+            Execution.project_id == project_id, Execution.version == version
+        ).first()
+        if execution and execution.governance_log:
+            factsheet = json.loads(execution.governance_log)
     if not factsheet:
         return jsonify({"error": "Factsheet not available"}), 404
 
@@ -2577,7 +3308,10 @@ def download_factsheet_pdf(project_id: int, version: int):
 
 
 if __name__ == "__main__":
-    init_db()
+    verify_schema()
+    # Only the reloader child serves requests -- don't run workers in the watcher process
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        ensure_pipeline_workers()
     print(f"Flask server starting...")
     print(f"REPO_ROOT: {REPO_ROOT}")
     print(f"PUBLIC_DIR: {PUBLIC_DIR}")
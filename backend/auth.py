@@ -13,7 +13,7 @@ from datetime import datetime, timedelta, timezone
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 
-from models import User, Project, TokenBlocklist, get_session
+from models import User, Project, TokenBlocklist, request_session
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/api/auth")
 
@@ -30,12 +30,8 @@ def init_jwt(app):
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
         jti = jwt_payload["jti"]
-        db = get_session()
-        try:
-            token = db.query(TokenBlocklist).filter(TokenBlocklist.jti == jti).first()
-            return token is not None
-        finally:
-            db.close()
+        token = request_session().query(TokenBlocklist).filter(TokenBlocklist.jti == jti).first()
+        return token is not None
 
     return jwt
 
@@ -46,13 +42,10 @@ def init_jwt(app):
 @jwt_required()
 def logout():
     jti = get_jwt()["jti"]
-    db = get_session()
-    try:
-        db.add(TokenBlocklist(jti=jti))
-        db.commit()
-        return jsonify({"message": "Logged out"}), 200
-    finally:
-        db.close()
+    db = request_session()
+    db.add(TokenBlocklist(jti=jti))
+    db.commit()
+    return jsonify({"message": "Logged out"}), 200
 
 
 # ── Register ──────────────────────────────────────────────────────────────────
@@ -72,25 +65,22 @@ def register():
     if len(password) < 6:
         return jsonify({"error": "Password must be at least 6 characters"}), 400
 
-    db = get_session()
-    try:
-        existing = db.query(User).filter(User.email == email).first()
-        if existing:
-            return jsonify({"error": "An account with this email already exists"}), 409
+    db = request_session()
+    existing = db.query(User).filter(User.email == email).first()
+    if existing:
+        return jsonify({"error": "An account with this email already exists"}), 409
 
-        pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-        user = User(email=email, name=name or email.split("@")[0], password_hash=pw_hash)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+    pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    user = User(email=email, name=name or email.split("@")[0], password_hash=pw_hash)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
 
-        token = create_access_token(identity=str(user.id))
-        return jsonify({
-            "token": token,
-            "user": {"id": user.id, "email": user.email, "name": user.name},
-        }), 201
-    finally:
-        db.close()
+    token = create_access_token(identity=str(user.id))
+    return jsonify({
+        "token": token,
+        "user": {"id": user.id, "email": user.email, "name": user.name},
+    }), 201
 
 
 # ── Login ─────────────────────────────────────────────────────────────────────
@@ -107,22 +97,19 @@ def login():
     if not email or not password:
         return jsonify({"error": "Email and password are required"}), 400
 
-    db = get_session()
-    try:
-        user = db.query(User).filter(User.email == email).first()
-        if not user or not user.password_hash:
-            return jsonify({"error": "Invalid email or password"}), 401
+    db = request_session()
+    user = db.query(User).filter(User.email == email).first()
+    if not user or not user.password_hash:
+        return jsonify({"error": "Invalid email or password"}), 401
 
-        if not bcrypt.checkpw(password.encode("utf-8"), user.password_hash.encode("utf-8")):
-            return jsonify({"error": "Invalid email or password"}), 401
+    if not bcrypt.checkpw(password.encode("utf-8"), user.password_hash.encode("utf-8")):
+        return jsonify({"error": "Invalid email or password"}), 401
 
-        token = create_access_token(identity=str(user.id))
-        return jsonify({
-            "token": token,
-            "user": {"id": user.id, "email": user.email, "name": user.name},
-        }), 200
-    finally:
-        db.close()
+    token = create_access_token(identity=str(user.id))
+    return jsonify({
+        "token": token,
+        "user": {"id": user.id, "email": user.email, "name": user.name},
+    }), 200
 
 
 # ── Google OAuth ─────────────────────────────────────────────────────────────
@@ -147,22 +134,19 @@ def google_login():
     if not email:
         return jsonify({"error": "Google account has no email"}), 400
 
-    db = get_session()
-    try:
-        user = db.query(User).filter(User.email == email).first()
-        if not user:
-            user = User(email=email, name=name, password_hash=None)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-
-        token = create_access_token(identity=str(user.id))
-        return jsonify({
-            "access_token": token,
-            "user": {"id": user.id, "email": user.email, "name": user.name},
-        }), 200
-    finally:
-        db.close()
+    db = request_session()
+    user = db.query(User).filter(User.email == email).first()
+    if not user:
+        user = User(email=email, name=name, password_hash=None)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+
+    token = create_access_token(identity=str(user.id))
+    return jsonify({
+        "access_token": token,
+        "user": {"id": user.id, "email": user.email, "name": user.name},
+    }), 200
 
 
 # ── Me (current user) ─────────────────────────────────────────────────────────
@@ -171,14 +155,11 @@ def google_login():
 @jwt_required()
 def me():
     user_id = int(get_jwt_identity())
-    db = get_session()
-    try:
-        user = db.get(User, user_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-        return jsonify({"id": user.id, "email": user.email, "name": user.name}), 200
-    finally:
-        db.close()
+    db = request_session()
+    user = db.get(User, user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"id": user.id, "email": user.email, "name": user.name}), 200
 
 
 # ── Forgot Password ───────────────────────────────────────────────────────────
@@ -190,24 +171,21 @@ def forgot_password():
     if not email:
         return jsonify({"error": "Email is required"}), 400
 
-    db = get_session()
-    try:
-        user = db.query(User).filter(User.email == email).first()
-        # Always return success (don't leak whether email exists)
-        if user:
-            token = secrets.token_urlsafe(32)
-            user.reset_token = token
-            user.reset_token_expires = datetime.now(timezone.utc) + timedelta(hours=1)
-            db.commit()
-            # In production: send email. For now, return token in response (dev mode)
-            print(f"[DEV] Password reset token for {email}: {token}")
-            return jsonify({
-                "message": "If that email exists, a reset link has been sent.",
-                "_dev_token": token,  # Remove in production
-            }), 200
-        return jsonify({"message": "If that email exists, a reset link has been sent."}), 200
-    finally:
-        db.close()
+    db = request_session()
+    user = db.query(User).filter(User.email == email).first()
+    # Always return success (don't leak whether email exists)
+    if user:
+        token = secrets.token_urlsafe(32)
+        user.reset_token = token
+        user.reset_token_expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        db.commit()
+        # In production: send email. For now, return token in response (dev mode)
+        print(f"[DEV] Password reset token for {email}: {token}")
+        return jsonify({
+            "message": "If that email exists, a reset link has been sent.",
+            "_dev_token": token,  # Remove in production
+        }), 200
+    return jsonify({"message": "If that email exists, a reset link has been sent."}), 200
 
 
 # ── Reset Password ────────────────────────────────────────────────────────────
@@ -226,20 +204,17 @@ def reset_password():
     if len(password) < 6:
         return jsonify({"error": "Password must be at least 6 characters"}), 400
 
-    db = get_session()
-    try:
-        user = db.query(User).filter(User.reset_token == token).first()
-        if not user:
-            return jsonify({"error": "Invalid or expired reset token"}), 400
-        if user.reset_token_expires and datetime.now(timezone.utc) > user.reset_token_expires.replace(tzinfo=timezone.utc):
-            return jsonify({"error": "Reset token has expired"}), 400
-
-        pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-        user.password_hash = pw_hash
-        user.reset_token = None
-        user.reset_token_expires = None
-        db.commit()
+    db = request_session()
+    user = db.query(User).filter(User.reset_token == token).first()
+    if not user:
+        return jsonify({"error": "Invalid or expired reset token"}), 400
+    if user.reset_token_expires and datetime.now(timezone.utc) > user.reset_token_expires.replace(tzinfo=timezone.utc):
+        return jsonify({"error": "Reset token has expired"}), 400
+
+    pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    user.password_hash = pw_hash
+    user.reset_token = None
+    user.reset_token_expires = None
+    db.commit()
 
-        return jsonify({"message": "Password reset successfully. You can now log in."}), 200
-    finally:
-        db.close()
+    return jsonify({"message": "Password reset successfully. You can now log in."}), 200
@@ -0,0 +1,373 @@
+"""
+Pre-rendered, precompressed bundles for finished versions.
+
+A version's preview (its entry page with sibling stylesheets and scripts
+inlined) is rendered once, when the version manifest is written, into
+<version>/preview/index.html next to .gz and .br variants. The preview
+endpoint only picks a variant and sends the file; its strong ETag is the
+sha256 of the uncompressed page, recorded in the manifest.
+
+Published sites and ZIP downloads are built once the same way; see their
+sections below.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import uuid
+import zipfile
+from pathlib import Path
+
+from utils.blob_store import link_or_copy, sha256_file
+
+try:
+    import brotli
+except ImportError:  # gzip alone still covers every browser
+    brotli = None
+
+# (Content-Encoding, file suffix), in order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")] if brotli else [("gzip", ".gz")]
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def inline_siblings(html: str, code_dir: Path, manifest: dict, entry_dir: str, scripts: bool = True) -> str:
+    """Inline the stylesheets (and scripts) that sit in entry_dir next to the page."""
+    def siblings(paths):
+        return [p for p in paths if p.rpartition("/")[0] == entry_dir]
+
+    for rel in siblings(manifest["stylesheets"]):
+        css = (code_dir / rel).read_text(encoding="utf-8", errors="replace")
+        link_tag = f'<link rel="stylesheet" href="./{Path(rel).name}">'
+        if link_tag in html:
+            html = html.replace(link_tag, f"<style>{css}</style>")
+        elif "</head>" in html:
+            html = html.replace("</head>", f"<style>{css}</style>\n</head>")
+    if scripts:
+        for rel in siblings(manifest["scripts"]):
+            js = (code_dir / rel).read_text(encoding="utf-8", errors="replace")
+            script_tag = f'<script src="./{Path(rel).name}">'
+            if script_tag in html:
+                html = html.replace(f'{script_tag}</script>', f"<script>{js}</script>")
+            elif "</body>" in html:
+                html = html.replace("</body>", f"<script>{js}</script>\n</body>")
+    return html
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output (and so any hash of it) reproducible
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def write_precompressed(path: Path, data: bytes) -> None:
+    """Write data to path plus one precompressed sibling per supported encoding."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for encoding, suffix in ENCODINGS:
+        _write_atomic(path.with_name(path.name + suffix), compress(data, encoding))
+    _write_atomic(path, data)
+
+
+def pick_variant(path: Path, accept_encodings) -> tuple[Path, str | None]:
+    """The best precompressed variant of path the client accepts, and its encoding."""
+    for encoding, suffix in ENCODINGS:
+        variant = path.with_name(path.name + suffix)
+        if accept_encodings[encoding] and variant.exists():
+            return variant, encoding
+    return path, None
+
+
+def write_preview_bundle(version_dir: Path, manifest: dict) -> dict | None:
+    """Render the version's preview page; its manifest entry, or None without an entry page."""
+    entry = manifest["entry_html"]
+    if not entry:
+        return None
+    code_dir = version_dir / "code"
+    html = (code_dir / entry).read_text(encoding="utf-8", errors="replace")
+    data = inline_siblings(html, code_dir, manifest, "src").encode("utf-8")
+    write_precompressed(version_dir / "preview" / "index.html", data)
+    return {"path": "preview/index.html", "etag": hashlib.sha256(data).hexdigest(), "bytes": len(data)}
+
+
+# ── Published sites ─────────────────────────────────────────────────────────
+# publish renders a version once into a static bundle: minified HTML/CSS/JS,
+# code files and design assets under content-hashed names, every
+# /api/assets/... URL pointing into the bundle, and .br/.gz variants of the
+# text files. Serving is then a file send per request.
+
+BUNDLE_VERSION = 1
+COMPRESSIBLE = {".html", ".css", ".js", ".mjs", ".json", ".svg", ".txt", ".xml"}
+MIMETYPES = {".mjs": "text/javascript", ".js": "text/javascript", ".svg": "image/svg+xml"}
+
+_ASSET_URL = re.compile(r"(?:https?://[^/\"'\s()]+)?/api/assets/(\d+)/(\d+)/([A-Za-z0-9._-]+)")
+_ATTR_URL = re.compile(r"""\b(href|src)=(["'])([^"'#?]+)\2""", re.I)
+_CSS_URL = re.compile(r"""url\(\s*(["']?)([^"')#?]+)\1\s*\)""")
+_CSS_SKIP = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/""", re.S)
+_HTML_RAW = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)", re.S | re.I)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_SCRIPT_TYPE = re.compile(r"""\btype=(["']?)([^"'\s>]+)\1""", re.I)
+
+
+def minify_css(css: str) -> str:
+    """Drop comments and collapse whitespace; string literals are left untouched."""
+    out, pos = [], 0
+
+    def squeeze(chunk: str) -> str:
+        chunk = re.sub(r"\s+", " ", chunk)
+        # Only the space after ":" goes: the one before may be a descendant combinator ("a :hover")
+        return re.sub(r" ?([{};,>]) ?", r"\1", chunk).replace(": ", ":").replace(";}", "}")
+
+    for m in _CSS_SKIP.finditer(css):
+        out.append(squeeze(css[pos:m.start()]))
+        if m.group(1):
+            out.append(m.group(1))
+        pos = m.end()
+    out.append(squeeze(css[pos:]))
+    return "".join(out).strip()
+
+
+def minify_js(js: str) -> str:
+    """
+    Whitespace-only: strips indentation, trailing spaces and blank lines.
+    Newlines stay, so automatic semicolon insertion and comments behave as written.
+    """
+    return "\n".join(line.strip() for line in js.splitlines() if line.strip())
+
+
+def minify_html(html: str) -> str:
+    """
+    Drop comments and collapse whitespace runs that contain a newline; inline
+    <style>/<script> are minified, <pre>/<textarea> kept verbatim.
+    """
+    def markup(chunk: str) -> str:
+        chunk = _HTML_COMMENT.sub("", chunk)
+        return re.sub(r"[ \t\r]*\n\s*", "\n", chunk)
+
+    out, pos = [], 0
+    for m in _HTML_RAW.finditer(html):
+        out.append(markup(html[pos:m.start()]))
+        tag, body = m.group(2).lower(), m.group(3)
+        if tag == "style":
+            body = minify_css(body)
+        elif tag == "script":
+            script_type = _SCRIPT_TYPE.search(m.group(1))
+            if not script_type or script_type.group(2).lower() in ("module", "text/javascript", "application/javascript"):
+                body = minify_js(body)
+        out.append(m.group(1) + body + m.group(4))
+        pos = m.end()
+    out.append(markup(html[pos:]))
+    return "".join(out).strip()
+
+
+def _fingerprinted(name: str, sha256: str) -> str:
+    stem, dot, suffix = name.rpartition(".")
+    return f"{stem}.{sha256[:12]}.{suffix}" if dot else f"{name}.{sha256[:12]}"
+
+
+class _BundleWriter:
+    def __init__(self, code_dir: Path, manifest: dict, out_dir: Path, url_prefix: str, asset_path):
+        self.code_dir = code_dir
+        self.code_files = {f["path"] for f in manifest["files"]}
+        self.out_dir = out_dir
+        self.url_prefix = url_prefix
+        self.asset_path = asset_path
+        self.files: dict = {}
+        self._urls: dict = {}
+
+    def _record(self, rel: str, sha256: str, size: int) -> str:
+        suffix = Path(rel).suffix.lower()
+        self.files[rel] = {
+            "etag": sha256,
+            "bytes": size,
+            "mimetype": MIMETYPES.get(suffix) or mimetypes.guess_type(rel)[0] or "application/octet-stream",
+        }
+        return f"{self.url_prefix}/{rel}"
+
+    def write(self, rel: str, data: bytes) -> str:
+        path = self.out_dir / rel
+        if Path(rel).suffix.lower() in COMPRESSIBLE:
+            write_precompressed(path, data)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(path, data)
+        return self._record(rel, hashlib.sha256(data).hexdigest(), len(data))
+
+    def asset_url(self, m: re.Match) -> str:
+        """Bundle URL for an /api/assets/<pid>/<version>/<file> match; unchanged if unresolvable."""
+        key = m.group(0)
+        if key not in self._urls:
+            src = self.asset_path(int(m.group(1)), int(m.group(2)), m.group(3))
+            if not src:
+                return key
+            sha256 = sha256_file(src)
+            rel = f"assets/{_fingerprinted(m.group(3), sha256)}"
+            (self.out_dir / "assets").mkdir(parents=True, exist_ok=True)
+            if not (self.out_dir / rel).exists():
+                link_or_copy(src, self.out_dir / rel)
+            self._urls[key] = self._record(rel, sha256, src.stat().st_size)
+        return self._urls[key]
+
+    def code_url(self, rel: str) -> str:
+        """Bundle URL of a code file, written (minified, fingerprinted) on first use."""
+        if rel not in self._urls:
+            self._urls[rel] = None  # guards @import cycles
+            data = (self.code_dir / rel).read_bytes()
+            suffix = Path(rel).suffix.lower()
+            if suffix == ".css":
+                css = self.rewrite_css(data.decode("utf-8", errors="replace"), posixpath.dirname(rel))
+                data = minify_css(css).encode("utf-8")
+            elif suffix in (".js", ".mjs"):
+                js = _ASSET_URL.sub(self.asset_url, data.decode("utf-8", errors="replace"))
+                data = minify_js(js).encode("utf-8")
+            name = _fingerprinted(Path(rel).name, hashlib.sha256(data).hexdigest())
+            self._urls[rel] = self.write(f"static/{name}", data)
+        return self._urls[rel]
+
+    def resolve(self, url: str, base_dir: str) -> str | None:
+        """The manifest path a relative URL points at, if any."""
+        if url.startswith(("/", "data:")) or "://" in url:
+            return None
+        rel = posixpath.normpath(posixpath.join(base_dir, url))
+        return rel if rel in self.code_files else None
+
+    def rewrite_css(self, css: str, base_dir: str) -> str:
+        def url(m: re.Match) -> str:
+            rel = self.resolve(m.group(2).strip(), base_dir)
+            target = rel and self.code_url(rel)
+            return f"url({target})" if target else m.group(0)
+        return _CSS_URL.sub(url, _ASSET_URL.sub(self.asset_url, css))
+
+    def rewrite_html(self, html: str, entry_dir: str, stylesheets: list) -> str:
+        linked = set()
+
+        def attr(m: re.Match) -> str:
+            rel = self.resolve(m.group(3), entry_dir)
+            target = rel and self.code_url(rel)
+            if not target:
+                return m.group(0)
+            linked.add(rel)
+            return f"{m.group(1)}={m.group(2)}{target}{m.group(2)}"
+
+        # rewrite_css also covers url() in inline <style> blocks and style attributes
+        html = _ATTR_URL.sub(attr, self.rewrite_css(html, entry_dir))
+        # Stylesheets next to the page that it never links were inlined before bundles: link them
+        extra = "".join(
+            f'<link rel="stylesheet" href="{self.code_url(rel)}">'
+            for rel in stylesheets
+            if rel.rpartition("/")[0] == entry_dir and rel not in linked
+        )
+        if extra and "</head>" in html:
+            html = html.replace("</head>", f"{extra}\n</head>", 1)
+        return html
+
+
+def build_published_bundle(code_dir: Path, manifest: dict, out_dir: Path, url_prefix: str, asset_path) -> dict:
+    """
+    Write the optimized bundle of a version (see above) into out_dir, which
+    is served under url_prefix. asset_path(project_id, version, filename)
+    returns the file behind an /api/assets URL, or None to leave the URL
+    alone. Returns the bundle manifest: entry page and, per served path,
+    ETag, size and mimetype.
+    """
+    entry = manifest["entry_html"]
+    writer = _BundleWriter(code_dir, manifest, out_dir, url_prefix, asset_path)
+    entry_dir = entry.rpartition("/")[0]
+    html = (code_dir / entry).read_text(encoding="utf-8", errors="replace")
+    html = minify_html(writer.rewrite_html(html, entry_dir, manifest["stylesheets"]))
+    writer.write("index.html", html.encode("utf-8"))
+    return {
+        "kind": "published_bundle",
+        "manifest_version": BUNDLE_VERSION,
+        "entry": "index.html",
+        "files": writer.files,
+    }
+
+
+# ── Version downloads ───────────────────────────────────────────────────────
+# A version's ZIP is streamed to the client while the same bytes are written
+# to a cache file named by the manifest digest, so the next download of the
+# unchanged version is a single file send.
+
+# Bump when the archive layout or the rewriting of its files changes
+ARCHIVE_VERSION = 1
+# Formats that are already compressed: deflating them again only costs CPU
+STORED_SUFFIXES = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".ico", ".woff", ".woff2",
+    ".zip", ".gz", ".br", ".mp3", ".mp4", ".webm", ".pdf",
+}
+ZIP_CHUNK = 1024 * 1024
+
+
+def archive_digest(manifest: dict) -> str:
+    """Cache key of a version's ZIP: its files' contents and the archive format."""
+    content = [(f["path"], f["sha256"]) for f in manifest["files"]]
+    content += [("assets/" + a["path"], a["sha256"]) for a in manifest["assets"]]
+    return hashlib.sha256(json.dumps([ARCHIVE_VERSION, content]).encode("utf-8")).hexdigest()
+
+
+class _Spool:
+    """Write-only, unseekable ZipFile target: keeps the bytes for the cache file and the response."""
+
+    def __init__(self, f):
+        self.f = f
+        self.pending: list = []
+        self.offset = 0
+
+    def write(self, data) -> int:
+        self.f.write(data)
+        self.pending.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.offset
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return data
+
+
+def stream_zip(entries, cache_path: Path):
+    """
+    Yield a ZIP of entries, (arcname, source path, transform or None), as it
+    is built; transform rewrites a text file's contents. The archive lands at
+    cache_path only once complete, so an aborted download leaves nothing behind.
+    """
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_name(f".{cache_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    complete = False
+    try:
+        with open(tmp, "wb") as f:
+            out = _Spool(f)
+            with zipfile.ZipFile(out, "w") as zf:
+                for arcname, src, transform in entries:
+                    info = zipfile.ZipInfo.from_file(src, arcname, strict_timestamps=False)
+                    stored = src.suffix.lower() in STORED_SUFFIXES
+                    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                    if transform:
+                        zf.writestr(info, transform(src.read_text(encoding="utf-8", errors="replace")))
+                    else:
+                        with open(src, "rb") as source, zf.open(info, "w") as dest:
+                            for chunk in iter(lambda: source.read(ZIP_CHUNK), b""):
+                                dest.write(chunk)
+                                yield out.drain()
+                    yield out.drain()
+            yield out.drain()  # central directory
+        os.replace(tmp, cache_path)
+        complete = True
+    finally:
+        if not complete:
+            tmp.unlink(missing_ok=True)
@@ -0,0 +1,108 @@
+"""
+Stage checkpoints for the build pipeline.
+
+Every stage of run_full_pipeline_async records its outcome in
+<version_dir>/last_checkpoints.json once it finishes. A resumed run (a job
+reclaimed from a dead worker, or POST /api/executions/<id>/rerun) skips the
+completed prefix of the graph and reloads those stages' artifacts from disk
+instead of calling the models again. Re-running one stage invalidates it and
+everything downstream of it.
+"""
+import json
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict
+
+# Pipeline stage -> stages whose artifacts it consumes (topological order)
+PIPELINE_STAGES = {
+    "pm": (),
+    "planner": ("pm",),
+    "design": ("pm",),
+    "engineer": ("planner", "design"),
+    "governance": ("engineer",),
+}
+
+# Files in the version dir each stage leaves behind for its dependents
+STAGE_ARTIFACTS = {
+    "pm": ["last_prd.json"],
+    "planner": ["last_plan.json", "last_plan_artifact.json"],
+    "design": ["last_design_assets.json"],
+    "engineer": ["last_execution_result.json"],
+    "governance": ["last_factsheet.json"],
+}
+
+CHECKPOINT_FILE = "last_checkpoints.json"
+_checkpoint_lock = threading.Lock()
+
+
+def read_checkpoints(version_dir: Path) -> Dict[str, Any]:
+    path = version_dir / CHECKPOINT_FILE
+    try:
+        return json.loads(path.read_text(encoding="utf-8")).get("stages", {}) if path.exists() else {}
+    except Exception as e:
+        print(f"Error reading {path}: {e}")
+        return {}
+
+
+def _write_checkpoints(version_dir: Path, stages: Dict[str, Any]) -> None:
+    version_dir.mkdir(parents=True, exist_ok=True)
+    path = version_dir / CHECKPOINT_FILE
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps({"stages": stages}, indent=2) + "\n", encoding="utf-8")
+    tmp.replace(path)
+
+
+def record_checkpoint(version_dir: Path, stage: str, status: str, artifacts: list = None, error: str = None):
+    """Record a stage outcome. Planner and design finish concurrently, hence the lock."""
+    with _checkpoint_lock:
+        stages = read_checkpoints(version_dir)
+        stages[stage] = {
+            "status": status,
+            "artifacts": [a for a in (artifacts or []) if (version_dir / a).exists()],
+            "error": error,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        _write_checkpoints(version_dir, stages)
+
+
+def invalidate_checkpoints(version_dir: Path, stages: list) -> Dict[str, Any]:
+    """Forget `stages`' checkpoints; returns the removed ones for restore_checkpoints()."""
+    with _checkpoint_lock:
+        current = read_checkpoints(version_dir)
+        removed = {k: v for k, v in current.items() if k in stages}
+        _write_checkpoints(version_dir, {k: v for k, v in current.items() if k not in stages})
+        return removed
+
+
+def restore_checkpoints(version_dir: Path, checkpoints: Dict[str, Any]) -> None:
+    """Put back checkpoints invalidated for a re-run that was never queued."""
+    with _checkpoint_lock:
+        _write_checkpoints(version_dir, {**read_checkpoints(version_dir), **checkpoints})
+
+
+def completed_stages(version_dir: Path) -> set:
+    """Stages checkpointed as done whose artifacts are still on disk."""
+    return {
+        name for name, cp in read_checkpoints(version_dir).items()
+        if cp.get("status") == "done" and all((version_dir / a).exists() for a in cp.get("artifacts", []))
+    }
+
+
+def resumable_stages(version_dir: Path) -> list:
+    """The completed prefix of the graph: done stages whose upstream is all done too."""
+    done = completed_stages(version_dir)
+    skip = []
+    for name, deps in PIPELINE_STAGES.items():
+        if name in done and all(d in skip for d in deps):
+            skip.append(name)
+    return skip
+
+
+def downstream_stages(stage: str) -> list:
+    """`stage` plus every stage that (transitively) consumes its output."""
+    affected = [stage]
+    for name, deps in PIPELINE_STAGES.items():
+        if any(d in affected for d in deps) and name not in affected:
+            affected.append(name)
+    return affected
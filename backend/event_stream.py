@@ -0,0 +1,119 @@
+"""
+In-process pub/sub for pipeline progress, served as Server-Sent Events.
+
+add_log(), stage transitions and status changes publish to a per-project
+channel. Each channel keeps its last MAX_BUFFERED events, so a client that
+reconnects with Last-Event-ID receives exactly what it missed. Event ids are
+"<epoch>-<seq>", with one sequence shared by all channels. The epoch changes
+when the process restarts, which marks an old cursor as stale; the endpoint
+then sends a fresh snapshot instead. Channels of idle projects are dropped
+with the rest of their in-memory state (discard()); a cursor from before the
+drop also gets a snapshot.
+
+Builds run by worker.py in another process publish to that process's broker,
+not the web tier's. For those builds the SSE endpoint re-reads the status from
+the DB on each keepalive.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+MAX_BUFFERED = 2000
+KEEPALIVE_SECONDS = 15.0
+# Client reconnect delay sent in the stream's "retry:" field
+RECONNECT_MS = 3000
+
+
+class _Channel:
+    def __init__(self, lock: threading.Lock, max_buffered: int, base: int):
+        # Events up to `base` were published before this channel existed or
+        # have fallen out of the buffer
+        self.base = base
+        self.events: deque = deque(maxlen=max_buffered)  # (seq, event, data)
+        self.cond = threading.Condition(lock)
+        self.waiters = 0
+
+    @property
+    def last_seq(self) -> int:
+        return self.events[-1][0] if self.events else self.base
+
+
+class EventBroker:
+    def __init__(self, max_buffered: int = MAX_BUFFERED):
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.max_buffered = max_buffered
+        self._lock = threading.Lock()
+        self._channels: dict[int, _Channel] = {}
+        self._seq = 0
+
+    def _channel(self, project_id: int) -> _Channel:
+        # Caller holds self._lock
+        channel = self._channels.get(project_id)
+        if channel is None:
+            channel = self._channels[project_id] = _Channel(self._lock, self.max_buffered, self._seq)
+        return channel
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def parse_event_id(self, value: str | None) -> int | None:
+        """Sequence number of an id issued by this process, else None."""
+        if not value:
+            return None
+        epoch, _, seq = value.strip().rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, project_id: int, event: str, data: dict) -> int:
+        with self._lock:
+            channel = self._channel(project_id)
+            self._seq += 1
+            if len(channel.events) == channel.events.maxlen:
+                channel.base = channel.events[0][0]
+            channel.events.append((self._seq, event, data))
+            channel.cond.notify_all()
+            return self._seq
+
+    def last_seq(self, project_id: int) -> int:
+        with self._lock:
+            return self._channel(project_id).last_seq
+
+    def _since(self, channel: _Channel, after_seq: int) -> list | None:
+        if after_seq > self._seq or after_seq < channel.base:
+            return None  # not issued by us, or no longer buffered
+        return [e for e in channel.events if e[0] > after_seq]
+
+    def replay(self, project_id: int, after_seq: int) -> list | None:
+        """Events after `after_seq`, or None if they are no longer all buffered."""
+        with self._lock:
+            return self._since(self._channel(project_id), after_seq)
+
+    def wait(self, project_id: int, after_seq: int, timeout: float) -> list | None:
+        """Block until there are events after `after_seq` (or `timeout`); [] on timeout."""
+        with self._lock:
+            channel = self._channel(project_id)
+            channel.waiters += 1
+            try:
+                channel.cond.wait_for(lambda: channel.last_seq > after_seq, timeout=timeout)
+            finally:
+                channel.waiters -= 1
+            return self._since(channel, after_seq)
+
+    def discard(self, project_id: int) -> bool:
+        """Drop a project's channel unless a stream is waiting on it."""
+        with self._lock:
+            channel = self._channels.get(project_id)
+            if channel is None or channel.waiters:
+                return False
+            del self._channels[project_id]
+            return True
+
+
+def format_sse(event_id: str, event: str, data: dict) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+
+event_broker = EventBroker()
@@ -0,0 +1,555 @@
+"""
+Durable pipeline job queue + bounded worker pool.
+
+Endpoints enqueue one PipelineJob per Execution instead of spawning a thread
+per request. A fixed-size pool of worker threads claims queued jobs and hands
+them to the pipeline runner, so at most PIPELINE_WORKERS pipelines hit the
+model APIs at once.
+
+Scheduling: jobs sit in a priority lane (interactive, or batch for eval
+traffic). Workers pick the lane that is furthest below its weighted share of
+recent claims (PIPELINE_BATCH_WEIGHT, default 1 batch claim per 4
+interactive), then, within the lane, the oldest job of the tenant (project
+owner) with the fewest running builds. A tenant never runs more than
+PIPELINE_MAX_RUNNING_PER_USER builds at once. admission_retry_after() turns
+new builds away while a lane or a tenant's backlog is full.
+
+Jobs live in the pipeline_jobs table, so nothing is lost when the process
+dies. Workers may run on several hosts (see worker.py): a claim is a lease of
+PIPELINE_LEASE_SECONDS that the owning pool renews with heartbeats. Any pool
+re-queues jobs whose lease has expired -- i.e. whose worker died -- or fails
+them once they have used up PIPELINE_JOB_MAX_ATTEMPTS. Healthy builds on other
+nodes keep their lease and are never touched.
+"""
+import json
+import math
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import func
+
+from models import Execution, PipelineJob, Project, get_session
+
+JOB_QUEUED = "queued"
+JOB_CLAIMED = "claimed"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ACTIVE_JOB_STATUSES = (JOB_QUEUED, JOB_CLAIMED)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_LEASE_SECONDS = 30
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_CLASSES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+DEFAULT_INTERACTIVE_WEIGHT = 4
+DEFAULT_BATCH_WEIGHT = 1
+DEFAULT_MAX_RUNNING_PER_USER = 2
+DEFAULT_MAX_ACTIVE_PER_USER = 5
+DEFAULT_MAX_QUEUED = {PRIORITY_INTERACTIVE: 100, PRIORITY_BATCH: 20}
+DEFAULT_BUILD_SECONDS = 90
+# Window of recent claims the lane weights are measured over
+FAIR_SHARE_WINDOW = timedelta(minutes=15)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def enqueue_job(session, execution: Execution, payload: dict,
+                priority: int = PRIORITY_INTERACTIVE, owner_id: int | None = None) -> PipelineJob:
+    """
+    Add a queued job for `execution`, or re-queue its finished job (stage
+    re-runs reuse the row: one job per execution). Caller owns the commit and
+    must make sure the execution has no active job.
+    """
+    job = session.query(PipelineJob).filter(PipelineJob.execution_id == execution.id).first()
+    if job is None:
+        job = PipelineJob(execution_id=execution.id, project_id=execution.project_id)
+        session.add(job)
+    job.status = JOB_QUEUED
+    job.payload = json.dumps(payload)
+    job.priority = priority
+    job.owner_id = owner_id
+    job.attempts = 0
+    job.claimed_by = None
+    job.claimed_at = None
+    job.heartbeat_at = None
+    job.lease_expires_at = None
+    job.finished_at = None
+    job.error_message = None
+    return job
+
+
+def get_job_payload(session, execution_id: int) -> dict | None:
+    job = session.query(PipelineJob).filter(PipelineJob.execution_id == execution_id).first()
+    return json.loads(job.payload) if job and job.payload else None
+
+
+def has_active_job(session, project_id: int) -> bool:
+    return (
+        session.query(PipelineJob.id)
+        .filter(PipelineJob.project_id == project_id, PipelineJob.status.in_(ACTIVE_JOB_STATUSES))
+        .first()
+        is not None
+    )
+
+
+def queue_depth(session) -> int:
+    return session.query(PipelineJob).filter(PipelineJob.status == JOB_QUEUED).count()
+
+
+def lease_seconds() -> int:
+    return max(3, _env_int("PIPELINE_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+
+
+def _lane_weight(priority: int) -> int:
+    if priority == PRIORITY_BATCH:
+        return max(1, _env_int("PIPELINE_BATCH_WEIGHT", DEFAULT_BATCH_WEIGHT))
+    return max(1, _env_int("PIPELINE_INTERACTIVE_WEIGHT", DEFAULT_INTERACTIVE_WEIGHT))
+
+
+def _tenant(owner_id: int | None, project_id: int):
+    # Anonymous projects are their own tenant
+    return ("user", owner_id) if owner_id is not None else ("project", project_id)
+
+
+def _pick_next_job(session) -> int | None:
+    """Weighted fair choice of the next queued job id (see module docstring)."""
+    queued = (
+        session.query(PipelineJob.id, PipelineJob.priority, PipelineJob.owner_id, PipelineJob.project_id)
+        .filter(PipelineJob.status == JOB_QUEUED)
+        .order_by(PipelineJob.id)
+        .limit(500)
+        .all()
+    )
+    if not queued:
+        return None
+
+    running = Counter(
+        _tenant(owner_id, project_id)
+        for owner_id, project_id in session.query(PipelineJob.owner_id, PipelineJob.project_id)
+        .filter(PipelineJob.status == JOB_CLAIMED)
+        .all()
+    )
+    cap = max(1, _env_int("PIPELINE_MAX_RUNNING_PER_USER", DEFAULT_MAX_RUNNING_PER_USER))
+    eligible = [j for j in queued if running[_tenant(j.owner_id, j.project_id)] < cap]
+    if not eligible:
+        return None
+
+    since = datetime.utcnow() - FAIR_SHARE_WINDOW
+    recent = dict(
+        session.query(PipelineJob.priority, func.count(PipelineJob.id))
+        .filter(PipelineJob.claimed_at != None, PipelineJob.claimed_at >= since)  # noqa: E711
+        .group_by(PipelineJob.priority)
+        .all()
+    )
+    lanes = {j.priority for j in eligible}
+    lane = min(lanes, key=lambda p: ((recent.get(p, 0) + 1) / _lane_weight(p), p))
+    in_lane = [j for j in eligible if j.priority == lane]
+    return min(in_lane, key=lambda j: (running[_tenant(j.owner_id, j.project_id)], j.id)).id
+
+
+def claim_next_job(worker_id: str, lease: int | None = None) -> PipelineJob | None:
+    """
+    Atomically move the next queued job (by lane weight and tenant fair
+    share) to "claimed" under a fresh lease. The conditional UPDATE makes
+    concurrent claimers safe (across threads and hosts): only one of them
+    sees rowcount == 1 for a given job.
+    """
+    lease = lease or lease_seconds()
+    session = get_session()
+    try:
+        while True:
+            candidate_id = _pick_next_job(session)
+            if candidate_id is None:
+                return None
+            now = datetime.utcnow()
+            claimed = (
+                session.query(PipelineJob)
+                .filter(PipelineJob.id == candidate_id, PipelineJob.status == JOB_QUEUED)
+                .update({
+                    "status": JOB_CLAIMED,
+                    "claimed_by": worker_id,
+                    "claimed_at": now,
+                    "heartbeat_at": now,
+                    "lease_expires_at": now + timedelta(seconds=lease),
+                    "attempts": PipelineJob.attempts + 1,
+                }, synchronize_session=False)
+            )
+            session.commit()
+            if claimed:
+                job = session.get(PipelineJob, candidate_id)
+                session.expunge(job)
+                return job
+    finally:
+        session.close()
+
+
+def queue_position(session, job: PipelineJob) -> int | None:
+    """
+    1-based position of a queued job: queued jobs in more urgent lanes plus
+    older ones in its own lane. An estimate -- fair share may reorder tenants.
+    """
+    if job.status != JOB_QUEUED:
+        return None
+    ahead = (
+        session.query(func.count(PipelineJob.id))
+        .filter(
+            PipelineJob.status == JOB_QUEUED,
+            (PipelineJob.priority < job.priority)
+            | ((PipelineJob.priority == job.priority) & (PipelineJob.id < job.id)),
+        )
+        .scalar()
+    )
+    return (ahead or 0) + 1
+
+
+def estimate_wait_seconds(session, position: int) -> int:
+    """Rough wait for `position` jobs ahead, from recent build durations and the pool size."""
+    avg = (
+        session.query(func.avg(Execution.duration_seconds))
+        .filter(Execution.status == "success", Execution.duration_seconds.isnot(None))
+        .scalar()
+    ) or DEFAULT_BUILD_SECONDS
+    workers = max(1, _env_int("PIPELINE_WORKERS", DEFAULT_WORKERS))
+    return max(1, int(math.ceil(position / workers) * avg))
+
+
+def admission_retry_after(session, owner_id: int | None, project_id: int, priority: int) -> int | None:
+    """
+    Backpressure for new builds. Returns None to admit, or the number of
+    seconds the client should wait (Retry-After) when the lane's queue or
+    the tenant's backlog is full.
+    """
+    lane_depth = (
+        session.query(func.count(PipelineJob.id))
+        .filter(PipelineJob.status == JOB_QUEUED, PipelineJob.priority == priority)
+        .scalar()
+    ) or 0
+    env_name = "PIPELINE_MAX_QUEUED_BATCH" if priority == PRIORITY_BATCH else "PIPELINE_MAX_QUEUED"
+    lane_cap = _env_int(env_name, DEFAULT_MAX_QUEUED.get(priority, DEFAULT_MAX_QUEUED[PRIORITY_INTERACTIVE]))
+    if lane_depth >= lane_cap:
+        return estimate_wait_seconds(session, lane_depth - lane_cap + 1)
+
+    tenant = session.query(func.count(PipelineJob.id)).filter(PipelineJob.status.in_(ACTIVE_JOB_STATUSES))
+    if owner_id is not None:
+        tenant = tenant.filter(PipelineJob.owner_id == owner_id)
+    else:
+        tenant = tenant.filter(PipelineJob.owner_id == None, PipelineJob.project_id == project_id)  # noqa: E711
+    active = tenant.scalar() or 0
+    user_cap = _env_int("PIPELINE_MAX_ACTIVE_PER_USER", DEFAULT_MAX_ACTIVE_PER_USER)
+    if active >= user_cap:
+        return estimate_wait_seconds(session, active - user_cap + 1)
+    return None
+
+
+def heartbeat_jobs(worker_ids: dict[int, str], lease: int | None = None) -> list[int]:
+    """
+    Renew the lease on every job in `worker_ids` ({job_id: worker_id}) that is
+    still owned by that worker. Returns the job ids whose lease was lost
+    (reclaimed by another node after we missed our heartbeats).
+    """
+    if not worker_ids:
+        return []
+    lease = lease or lease_seconds()
+    now = datetime.utcnow()
+    lost = []
+    session = get_session()
+    try:
+        for job_id, worker_id in worker_ids.items():
+            renewed = (
+                session.query(PipelineJob)
+                .filter(
+                    PipelineJob.id == job_id,
+                    PipelineJob.status == JOB_CLAIMED,
+                    PipelineJob.claimed_by == worker_id,
+                )
+                .update({
+                    "heartbeat_at": now,
+                    "lease_expires_at": now + timedelta(seconds=lease),
+                }, synchronize_session=False)
+            )
+            if not renewed:
+                lost.append(job_id)
+        session.commit()
+    finally:
+        session.close()
+    return lost
+
+
+class LeaseLost(Exception):
+    """Raised by a job handler that found its lease reclaimed: another worker now owns the build."""
+
+
+# Jobs of this process whose lease was reclaimed while their handler still runs
+_lost_leases: set[int] = set()
+_lost_leases_lock = threading.Lock()
+
+
+def lease_lost(job_id: int) -> bool:
+    """True once another worker has taken over job_id; its handler should stop writing and return."""
+    with _lost_leases_lock:
+        return job_id in _lost_leases
+
+
+def _mark_lease_lost(job_id: int) -> None:
+    with _lost_leases_lock:
+        _lost_leases.add(job_id)
+
+
+def release_jobs(worker_ids: dict[int, str]) -> int:
+    """
+    Hand jobs still claimed by these workers back to the queue (graceful
+    shutdown); the attempt doesn't count. Returns the number released.
+    """
+    if not worker_ids:
+        return 0
+    session = get_session()
+    released = 0
+    try:
+        for job_id, worker_id in worker_ids.items():
+            job = (
+                session.query(PipelineJob)
+                .filter(
+                    PipelineJob.id == job_id,
+                    PipelineJob.status == JOB_CLAIMED,
+                    PipelineJob.claimed_by == worker_id,
+                )
+                .first()
+            )
+            if not job:
+                continue
+            job.status = JOB_QUEUED
+            job.claimed_by = None
+            job.claimed_at = None
+            job.lease_expires_at = None
+            job.attempts = max(0, job.attempts - 1)
+            execution = session.get(Execution, job.execution_id)
+            if execution:
+                execution.status = "pending"
+            released += 1
+        session.commit()
+    finally:
+        session.close()
+    return released
+
+
+def finish_job(job_id: int, worker_id: str, error: str | None = None) -> bool:
+    """Record the outcome, unless the job was reclaimed from `worker_id` meanwhile."""
+    session = get_session()
+    try:
+        finished = (
+            session.query(PipelineJob)
+            .filter(
+                PipelineJob.id == job_id,
+                PipelineJob.status == JOB_CLAIMED,
+                PipelineJob.claimed_by == worker_id,
+            )
+            .update({
+                "status": JOB_FAILED if error else JOB_DONE,
+                "error_message": error,
+                "finished_at": datetime.utcnow(),
+                "lease_expires_at": None,
+            }, synchronize_session=False)
+        )
+        session.commit()
+        return bool(finished)
+    finally:
+        session.close()
+
+
+def reclaim_expired_jobs(max_attempts: int | None = None) -> int:
+    """
+    Stuck-job recovery: a claimed job whose lease has expired belonged to a
+    worker that died (crash, restart, lost host). Put it back in the queue, or
+    fail it (and its Execution) once it has exhausted its attempts.
+    Safe to call from every node; returns the number of jobs re-queued.
+    """
+    max_attempts = max_attempts or _env_int("PIPELINE_JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+    now = datetime.utcnow()
+    session = get_session()
+    requeued = 0
+    try:
+        stale = (
+            session.query(PipelineJob)
+            .filter(
+                PipelineJob.status == JOB_CLAIMED,
+                (PipelineJob.lease_expires_at == None) | (PipelineJob.lease_expires_at < now),  # noqa: E711
+            )
+            .all()
+        )
+        for job in stale:
+            execution = session.get(Execution, job.execution_id)
+            if job.attempts >= max_attempts:
+                job.status = JOB_FAILED
+                job.error_message = f"Abandoned after {job.attempts} attempts (worker lease expired)"
+                job.finished_at = now
+                job.lease_expires_at = None
+                if execution:
+                    execution.status = "failed"
+                    execution.error_message = job.error_message
+                    project = session.get(Project, execution.project_id)
+                    if project:
+                        project.status = "failed"
+                continue
+            job.status = JOB_QUEUED
+            job.claimed_by = None
+            job.claimed_at = None
+            job.lease_expires_at = None
+            if execution:
+                execution.status = "pending"
+            requeued += 1
+        session.commit()
+    finally:
+        session.close()
+    if requeued:
+        print(f"[JobQueue] Re-queued {requeued} pipeline job(s) with expired leases")
+    return requeued
+
+
+class PipelineWorkerPool:
+    """
+    Fixed-size pool of daemon threads that drain the pipeline_jobs queue.
+
+    `handler(job)` runs one job; it may raise, in which case the job is
+    marked failed. Workers sleep on a condition between polls and are woken
+    early by notify() when a new job is enqueued. A separate heartbeat thread
+    renews the leases of running jobs every lease/3 seconds and reclaims
+    expired leases left behind by dead workers on any node. A job whose lease
+    was reclaimed anyway is flagged (lease_lost()) so its handler stops.
+
+    stop() stops claiming, keeps heartbeating while running jobs finish, and
+    after `timeout` hands any job still running back to the queue.
+
+    size=None reads PIPELINE_WORKERS; 0 means "don't run workers here"
+    (e.g. a web tier that only enqueues, with worker.py on other hosts).
+    """
+
+    def __init__(self, handler: Callable[[PipelineJob], None], size: int | None = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, lease: int | None = None):
+        self.handler = handler
+        self.size = max(0, _env_int("PIPELINE_WORKERS", DEFAULT_WORKERS) if size is None else size)
+        self.poll_interval = poll_interval
+        self.lease = lease or lease_seconds()
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Condition()
+        self._draining = threading.Event()  # stop claiming new jobs
+        self._stopping = threading.Event()  # stop heartbeating: nothing of ours is running any more
+        self._threads: list[threading.Thread] = []
+        self._heartbeat: threading.Thread | None = None
+        self._running: dict[int, str] = {}  # job_id -> worker_id
+        self._lock = threading.Lock()
+
+    @property
+    def active_jobs(self) -> int:
+        with self._lock:
+            return len(self._running)
+
+    def start(self) -> None:
+        if self._threads or self.size == 0:
+            return
+        self._draining.clear()
+        self._stopping.clear()
+        reclaim_expired_jobs()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="pipeline-heartbeat", daemon=True)
+        self._heartbeat.start()
+        for i in range(self.size):
+            t = threading.Thread(
+                target=self._worker_loop,
+                args=(f"{self.node_id}:w{i}",),
+                name=f"pipeline-worker-{i}",
+                daemon=True,
+            )
+            t.start()
+            self._threads.append(t)
+        print(f"[JobQueue] Started {self.size} pipeline worker(s) on {self.node_id}")
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Drain: no new claims, running jobs keep their lease until they finish.
+        Jobs still running after `timeout` seconds (None: wait for them) are
+        released to the queue and flagged lost so their handlers stop.
+        """
+        self._draining.set()
+        self.notify()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            leftover = dict(self._running)
+        if leftover:
+            for job_id in leftover:
+                _mark_lease_lost(job_id)
+            released = release_jobs(leftover)
+            print(f"[JobQueue] Released {released} running job(s) back to the queue on shutdown")
+        self._stopping.set()
+        if self._heartbeat:
+            self._heartbeat.join(timeout)
+        self._threads = []
+        self._heartbeat = None
+
+    def notify(self) -> None:
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _heartbeat_loop(self) -> None:
+        interval = max(1.0, self.lease / 3)
+        while not self._stopping.wait(interval):
+            with self._lock:
+                owned = dict(self._running)
+            try:
+                for job_id in heartbeat_jobs(owned, self.lease):
+                    _mark_lease_lost(job_id)
+                    print(f"[JobQueue] Lost lease on job {job_id}; another worker reclaimed it, aborting ours")
+                if not self._draining.is_set() and reclaim_expired_jobs():
+                    self.notify()
+            except Exception as e:
+                print(f"[JobQueue] Heartbeat failed: {e}")
+
+    def _worker_loop(self, worker_id: str) -> None:
+        while not self._draining.is_set():
+            try:
+                job = claim_next_job(worker_id, self.lease)
+            except Exception as e:
+                print(f"[JobQueue] {worker_id}: claim failed: {e}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run(job, worker_id)
+
+    def _run(self, job: PipelineJob, worker_id: str) -> None:
+        with self._lock:
+            self._running[job.id] = worker_id
+        error = None
+        try:
+            self.handler(job)
+        except LeaseLost:
+            print(f"[JobQueue] Job {job.id} (execution {job.execution_id}) stopped: its lease was reclaimed")
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            print(f"[JobQueue] Job {job.id} (execution {job.execution_id}) failed: {error}")
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+            with _lost_leases_lock:
+                _lost_leases.discard(job.id)
+            try:
+                if not finish_job(job.id, worker_id, error):
+                    print(f"[JobQueue] Job {job.id} finished after its lease was reclaimed; outcome not recorded")
+            except Exception as e:
+                print(f"[JobQueue] Could not record outcome of job {job.id}: {e}")
@@ -0,0 +1,325 @@
+"""
+Versioned schema migrations for Archon.
+
+The schema_version table records the last migration applied. Migrations run
+in order, once, from an explicit command -- never on import -- and each one
+is idempotent, so a migration interrupted half way can simply be re-run.
+Servers and workers only call verify_schema() at startup.
+
+Usage:
+    cd backend
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # print current and latest version
+
+Adding a migration: append a function to MIGRATIONS. Never reorder or
+remove entries; a database's version is an index into this list.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, text
+
+from models import (
+    CODE_SUFFIXES, DATABASE_URL, REPO_ROOT, Base, ChatMessage, Execution, UsageRollup, _chat_fields, engine,
+)
+
+sys.path.insert(0, str(REPO_ROOT))
+
+
+class SchemaOutOfDate(RuntimeError):
+    """The database is behind this code's migrations (run `python migrations.py`)."""
+
+
+def _columns(conn, table: str) -> list:
+    return [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})")).fetchall()]
+
+
+def _add_columns(conn, table: str, columns: list) -> bool:
+    """ALTER TABLE ADD COLUMN for each (name, type) not yet present; True if any was added."""
+    existing = _columns(conn, table)
+    added = False
+    for col_name, col_type in columns:
+        if col_name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type}"))
+            added = True
+    return added
+
+
+def create_tables(conn):
+    """Create missing tables (a new database gets the whole current schema here)."""
+    Base.metadata.create_all(conn)
+
+
+def add_version_columns(conn):
+    """Phase 7A: version, prompt history and active head per execution."""
+    _add_columns(conn, "executions", [
+        ("version", "INTEGER NOT NULL DEFAULT 1"),
+        ("prompt_history", "TEXT"),
+        ("is_active_head", "INTEGER NOT NULL DEFAULT 1"),
+        ("parent_execution_id", "INTEGER REFERENCES executions(id)"),
+    ])
+
+
+def add_locked_ui_archetype(conn):
+    _add_columns(conn, "projects", [("locked_ui_archetype", "VARCHAR(50)")])
+
+
+def add_build_metrics(conn):
+    _add_columns(conn, "executions", [
+        ("tokens_used", "INTEGER"),
+        ("estimated_cost", "REAL"),
+        ("credits_used", "INTEGER"),
+        ("duration_seconds", "REAL"),
+        ("model_used", "VARCHAR(100)"),
+        ("governance_log", "TEXT"),
+        ("readiness_score", "REAL"),
+        ("quality_tier", "VARCHAR(10)"),
+    ])
+
+
+def add_auth_columns(conn):
+    _add_columns(conn, "users", [
+        ("password_hash", "VARCHAR(255)"),
+        ("reset_token", "VARCHAR(255)"),
+        ("reset_token_expires", "DATETIME"),
+    ])
+
+
+def add_job_lease_columns(conn):
+    """Lease + scheduling columns of pipeline_jobs."""
+    _add_columns(conn, "pipeline_jobs", [
+        ("lease_expires_at", "DATETIME"),
+        ("heartbeat_at", "DATETIME"),
+        ("priority", "INTEGER NOT NULL DEFAULT 0"),
+        ("owner_id", "INTEGER"),
+    ])
+
+
+def add_project_summary(conn):
+    """Project summary columns (see Project), computed from executions."""
+    _add_columns(conn, "projects", [
+        ("execution_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("version_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("latest_execution_id", "INTEGER"),
+        ("active_head_version", "INTEGER"),
+    ])
+    conn.execute(text(
+        "UPDATE projects SET "
+        "execution_count = (SELECT COUNT(*) FROM executions e WHERE e.project_id = projects.id), "
+        "version_count = COALESCE((SELECT MAX(version) FROM executions e WHERE e.project_id = projects.id), 0), "
+        "latest_execution_id = (SELECT MAX(id) FROM executions e WHERE e.project_id = projects.id), "
+        "active_head_version = (SELECT MAX(version) FROM executions e "
+        "WHERE e.project_id = projects.id AND e.is_active_head = 1)"
+    ))
+
+
+def add_factsheet_scores(conn):
+    """Factsheet score columns, backfilled from governance_log."""
+    _add_columns(conn, "executions", [
+        ("prompt_quality_score", "REAL"),
+        ("build_confidence_score", "REAL"),
+        ("human_review_required", "BOOLEAN"),
+    ])
+    conn.execute(text(
+        "UPDATE executions SET "
+        "prompt_quality_score = json_extract(governance_log, '$.scoring.prompt_quality.score'), "
+        "build_confidence_score = json_extract(governance_log, '$.scoring.build_confidence.score'), "
+        "human_review_required = json_extract(governance_log, '$.compliance.human_review_required') "
+        "WHERE governance_log IS NOT NULL AND json_valid(governance_log)"
+    ))
+
+
+def add_usage_rollups(conn):
+    """
+    Generated code size per execution -- measured once from the code dirs of
+    past builds -- and usage_rollups rebuilt from executions and model_usage.
+    """
+    from utils.usage_ledger import IMAGE_CREDITS, TOKENS_PER_CREDIT
+
+    _add_columns(conn, "executions", [("lines_generated", "INTEGER"), ("bytes_generated", "INTEGER")])
+    builds = conn.execute(text(
+        "SELECT id, project_id, version FROM executions WHERE status = 'success' AND lines_generated IS NULL"
+    )).fetchall()
+    for execution_id, project_id, version in builds:
+        code_dir = REPO_ROOT / "generated" / str(project_id) / f"v{version}" / "code"
+        lines = size = 0
+        if code_dir.exists():
+            for f in code_dir.rglob("*"):
+                if not f.is_file():
+                    continue
+                data = f.read_bytes()
+                size += len(data)
+                if f.suffix in CODE_SUFFIXES:
+                    lines += data.count(b"\n") + 1
+        conn.execute(
+            text("UPDATE executions SET lines_generated = :lines, bytes_generated = :size WHERE id = :id"),
+            {"lines": lines, "size": size, "id": execution_id},
+        )
+    conn.execute(text("DELETE FROM usage_rollups"))
+    conn.execute(text(
+        "INSERT INTO usage_rollups (owner_id, day, pipelines, builds, build_seconds, "
+        "lines_generated, bytes_generated, credits_used) "
+        "SELECT COALESCE(p.owner_id, 0), date(e.created_at), COUNT(*), "
+        "SUM(CASE WHEN e.status = 'success' AND e.duration_seconds IS NOT NULL THEN 1 ELSE 0 END), "
+        "COALESCE(SUM(CASE WHEN e.status = 'success' THEN e.duration_seconds END), 0), "
+        "COALESCE(SUM(e.lines_generated), 0), COALESCE(SUM(e.bytes_generated), 0), "
+        "COALESCE(SUM(e.credits_used), 0) "
+        "FROM executions e LEFT JOIN projects p ON p.id = e.project_id "
+        "GROUP BY COALESCE(p.owner_id, 0), date(e.created_at)"
+    ))
+    # Model calls outside a build (intent classification) are billed by the ledger
+    loose = conn.execute(text(
+        "SELECT COALESCE(p.owner_id, 0), date(u.created_at), "
+        "SUM(COALESCE(u.input_tokens, 0) + COALESCE(u.output_tokens, 0)), SUM(COALESCE(u.images, 0)) "
+        "FROM model_usage u LEFT JOIN projects p ON p.id = u.project_id "
+        "WHERE u.execution_id IS NULL GROUP BY 1, 2"
+    )).fetchall()
+    for owner_id, day, tokens, images in loose:
+        credits = round(tokens / TOKENS_PER_CREDIT) + images * IMAGE_CREDITS
+        updated = conn.execute(
+            text("UPDATE usage_rollups SET credits_used = credits_used + :credits WHERE owner_id = :owner AND day = :day"),
+            {"credits": credits, "owner": owner_id, "day": day},
+        ).rowcount
+        if not updated:
+            conn.execute(UsageRollup.__table__.insert(), {"owner_id": owner_id, "day": day, "credits_used": credits})
+
+
+def create_execution_indexes(conn):
+    """
+    Indexes of Execution.__table_args__. The unique index fails if a project
+    already has two executions with the same version; that is reported and
+    skipped rather than blocking the upgrade.
+    """
+    for index in Execution.__table__.indexes:
+        try:
+            index.create(conn, checkfirst=True)
+        except Exception as e:
+            print(f"Warning: could not create index {index.name}: {e}")
+
+
+def move_chat_blobs(conn):
+    """Move JSON chat arrays (Execution.chat_messages) into chat_messages rows."""
+    blobs = conn.execute(text(
+        "SELECT id, chat_messages FROM executions WHERE chat_messages IS NOT NULL"
+    )).fetchall()
+    for execution_id, blob in blobs:
+        try:
+            messages = json.loads(blob)
+        except ValueError:
+            messages = []
+        exists = conn.execute(
+            text("SELECT 1 FROM chat_messages WHERE execution_id = :id LIMIT 1"), {"id": execution_id}
+        ).first()
+        rows = [
+            {"execution_id": execution_id, "seq": seq, **_chat_fields(m)}
+            for seq, m in enumerate((m for m in messages if isinstance(m, dict)), 1)
+        ] if isinstance(messages, list) and not exists else []
+        if rows:
+            conn.execute(ChatMessage.__table__.insert(), rows)
+        conn.execute(text("UPDATE executions SET chat_messages = NULL WHERE id = :id"), {"id": execution_id})
+
+
+def fail_legacy_running(conn):
+    """
+    Mark RUNNING executions started before the job queue existed (no job row
+    can ever reclaim them) as FAILED. Queued builds are owned by
+    pipeline_jobs leases -- workers on any node reclaim them when they expire.
+    """
+    conn.execute(text(
+        "UPDATE executions SET status = 'failed' WHERE status = 'running' "
+        "AND id NOT IN (SELECT execution_id FROM pipeline_jobs)"
+    ))
+    conn.execute(text(
+        "UPDATE projects SET status = 'failed' "
+        "WHERE status IN ('running', 'in_progress') "
+        "AND id IN (SELECT DISTINCT project_id FROM executions WHERE status = 'failed') "
+        "AND id NOT IN (SELECT project_id FROM pipeline_jobs WHERE status IN ('queued', 'claimed'))"
+    ))
+
+
+# Append only: schema_version N means MIGRATIONS[:N] have been applied
+MIGRATIONS = [
+    create_tables,
+    add_version_columns,
+    add_locked_ui_archetype,
+    add_build_metrics,
+    add_auth_columns,
+    add_job_lease_columns,
+    add_project_summary,
+    add_factsheet_scores,
+    add_usage_rollups,
+    create_execution_indexes,
+    move_chat_blobs,
+    fail_legacy_running,
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def _ensure_version_table(conn) -> None:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    if conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == 0:
+        conn.execute(text("INSERT INTO schema_version (version, applied_at) VALUES (0, :now)"),
+                     {"now": datetime.now(timezone.utc)})
+
+
+def current_version(bind=None) -> int:
+    """The database's schema version (0 for a database that predates schema_version)."""
+    with (bind or engine).connect() as conn:
+        return _read_version(conn)
+
+
+def _read_version(conn) -> int:
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def migrate(bind=None, verbose: bool = False) -> int:
+    """Apply pending migrations in order, each in its own transaction. Returns the new version."""
+    with (bind or engine).connect() as conn:
+        _ensure_version_table(conn)
+        conn.commit()
+        version = _read_version(conn)
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            migration(conn)
+            conn.execute(text("UPDATE schema_version SET version = :v, applied_at = :now"),
+                         {"v": number, "now": datetime.now(timezone.utc)})
+            conn.commit()
+            if verbose:
+                print(f"  {number:3d} {migration.__name__}")
+        return max(version, LATEST_VERSION)
+
+
+def verify_schema(bind=None) -> None:
+    """Startup check: raise SchemaOutOfDate unless every migration has been applied."""
+    version = current_version(bind)
+    if version < LATEST_VERSION:
+        raise SchemaOutOfDate(
+            f"Database schema is at version {version}, this code needs {LATEST_VERSION}. "
+            f"Run `python migrations.py` in backend/ first."
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply Archon database migrations")
+    parser.add_argument("--status", action="store_true", help="Print the schema version and exit")
+    args = parser.parse_args()
+
+    version = current_version()
+    if args.status:
+        print(f"Schema version {version} of {LATEST_VERSION} ({DATABASE_URL})")
+        return
+    if version >= LATEST_VERSION:
+        print(f"Schema is up to date (version {version}).")
+        return
+    print(f"Migrating schema from version {version} to {LATEST_VERSION}...")
+    migrate(verbose=True)
+    print("Migration complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,16 @@ Tables:
 - User: Account model (Phase 13 foundation)
 - Project: Named projects that group related executions
 - Execution: Individual task executions linked to projects
+- PipelineJob: Durable queue entry for a pipeline run
+- ModelUsage: One row per model call (tokens, images, latency, cost)
+- ChatMessage: One row per chat message of an execution's conversation
+- UsageRollup: Per-owner daily counters behind /api/stats and /api/credits/balance
 """
+import json
+import os
 from datetime import datetime, timezone
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Text, Boolean, ForeignKey, text
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine, event, case, func, select, Column, Index, Integer, Float, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy.orm import declarative_base, relationship, scoped_session, sessionmaker
 from pathlib import Path
 
 Base = declarative_base()
@@ -55,11 +61,19 @@ class Project(Base):
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     owner = relationship("User", back_populates="projects")
 
+    # Summary of the project's executions, kept up to date by add_execution()
+    # and set_active_head() in the same transaction, so listings never load
+    # the executions themselves. latest_execution_id has no FK: projects and
+    # executions would reference each other.
+    execution_count = Column(Integer, nullable=False, default=0, server_default="0")
+    version_count = Column(Integer, nullable=False, default=0, server_default="0")  # highest version number
+    latest_execution_id = Column(Integer, nullable=True)
+    active_head_version = Column(Integer, nullable=True)
+
     # Relationship: one project has many executions
     executions = relationship("Execution", back_populates="project", cascade="all, delete-orphan")
 
     def to_dict(self):
-        max_version = max((e.version for e in self.executions), default=0) if self.executions else 0
         return {
             "id": self.id,
             "name": self.name,
@@ -67,8 +81,10 @@ class Project(Base):
             "status": self.status,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "execution_count": len(self.executions) if self.executions else 0,
-            "version_count": max_version,
+            "execution_count": self.execution_count or 0,
+            "version_count": self.version_count or 0,
+            "latest_execution_id": self.latest_execution_id,
+            "active_head_version": self.active_head_version,
         }
 
 
@@ -79,6 +95,19 @@ class Execution(Base):
     Version numbers auto-increment per project (not globally).
     """
     __tablename__ = "executions"
+    # Created for existing databases by migrations.py. The unique index also
+    # serves per-project lookups, max(version) and version listings.
+    __table_args__ = (
+        Index("uq_executions_project_version", "project_id", "version", unique=True),
+        Index("ix_executions_project_head", "project_id", "is_active_head"),
+        Index("ix_executions_status_created", "status", "created_at"),
+        Index("ix_executions_created_at", "created_at"),
+        # Covers the dashboard's per-owner AVG/COUNT without reading rows
+        Index(
+            "ix_executions_project_scores",
+            "project_id", "prompt_quality_score", "build_confidence_score", "human_review_required",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
@@ -109,7 +138,8 @@ class Execution(Base):
     # Publish slug (Phase 8.1)
     published_slug = Column(String(100), nullable=True)
 
-    # Chat messages (Phase 13) -- JSON array of {role, content, timestamp}
+    # Legacy chat history (Phase 13) -- JSON array of {role, content, timestamp}.
+    # Migrated into ChatMessage rows (migrations.py); nothing writes it any more.
     chat_messages = Column(Text, nullable=True)
 
     # Build metrics
@@ -121,10 +151,18 @@ class Execution(Base):
     governance_log = Column(Text, nullable=True)  # JSON Factsheet
     readiness_score = Column(Float, nullable=True)
     quality_tier = Column(String(10), nullable=True)
+    # Factsheet scores, copied out of governance_log by record_factsheet()
+    prompt_quality_score = Column(Float, nullable=True)
+    build_confidence_score = Column(Float, nullable=True)
+    human_review_required = Column(Boolean, nullable=True)
+    # Size of the generated code, set by record_build_output() (None until a build succeeds)
+    lines_generated = Column(Integer, nullable=True)
+    bytes_generated = Column(Integer, nullable=True)
 
     # Relationships
     project = relationship("Project", back_populates="executions")
     parent = relationship("Execution", remote_side=[id], foreign_keys=[parent_execution_id])
+    chat_history = relationship("ChatMessage", cascade="all, delete-orphan", order_by="ChatMessage.seq")
 
     def to_dict(self):
         import json
@@ -157,9 +195,144 @@ class Execution(Base):
             "governance_log": json.loads(self.governance_log) if self.governance_log else None,
             "readiness_score": self.readiness_score,
             "quality_tier": self.quality_tier,
+            "prompt_quality_score": self.prompt_quality_score,
+            "build_confidence_score": self.build_confidence_score,
+            "human_review_required": self.human_review_required,
+            "lines_generated": self.lines_generated,
+            "bytes_generated": self.bytes_generated,
         }
 
 
+class PipelineJob(Base):
+    """
+    Durable queue entry for one pipeline run (one job per Execution).
+    Endpoints enqueue jobs; workers (embedded or on other hosts) claim them
+    under a lease that they keep alive with heartbeats, picking lanes by
+    priority weight and tenants by fair share (see job_queue.py).
+    Jobs whose lease expires are reclaimed and re-queued.
+    """
+    __tablename__ = "pipeline_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    execution_id = Column(Integer, ForeignKey("executions.id"), nullable=False, unique=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    # queued -> claimed -> done | failed
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    # JSON: {task_description, prompt_history, reference_images}
+    payload = Column(Text, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Scheduling lane: 0 = interactive, 1 = batch (eval harness)
+    priority = Column(Integer, nullable=False, default=0, index=True)
+    # Tenant for fair share / per-user caps (Project.owner_id at enqueue time)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    claimed_by = Column(String(100), nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    # Lease (multi-node workers): owner must heartbeat before lease_expires_at
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    error_message = Column(Text, nullable=True)
+
+
+class ModelUsage(Base):
+    """
+    Usage ledger: one row per model call that reached a provider, priced
+    from the table in utils/usage_ledger.py. Execution.tokens_used,
+    estimated_cost and credits_used are derived from these rows.
+    execution_id is NULL for calls outside a build (intent classification).
+    """
+    __tablename__ = "model_usage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    execution_id = Column(Integer, ForeignKey("executions.id"), nullable=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    stage = Column(String(50), nullable=True)
+    agent = Column(String(50), nullable=True)
+    provider = Column(String(50), nullable=False)
+    model = Column(String(100), nullable=False)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    images = Column(Integer, nullable=False, default=0)
+    latency_seconds = Column(Float, nullable=True)
+    # 0 = first attempt; n = nth retry (rate limit, bad output, schema parse)
+    retry = Column(Integer, nullable=False, default=0)
+    outcome = Column(String(20), nullable=False, default="ok")
+    cost_usd = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ChatMessage(Base):
+    """
+    One message of an execution's chat conversation, ordered by seq (1..n).
+    Appending is a single insert instead of rewriting the whole conversation.
+    Keys other than role/content/timestamp (client ids, imageUrls) are kept
+    as JSON in extra so messages round-trip unchanged.
+    """
+    __tablename__ = "chat_messages"
+    __table_args__ = (Index("uq_chat_messages_execution_seq", "execution_id", "seq", unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    execution_id = Column(Integer, ForeignKey("executions.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String(20), nullable=False)
+    content = Column(Text, nullable=False, default="")
+    timestamp = Column(String(40), nullable=True)  # ISO 8601
+    extra = Column(Text, nullable=True)
+
+    def to_dict(self):
+        message = json.loads(self.extra) if self.extra else {}
+        message.update({
+            "seq": self.seq,
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.timestamp,
+        })
+        return message
+
+
+class UsageRollup(Base):
+    """
+    Per-owner, per-day (UTC) usage counters, bumped by bump_usage() as
+    executions are created, builds finish and model calls are billed, so the
+    dashboard stats and credit balance never scan history or generated files.
+    owner_id 0 collects projects without an owner.
+    """
+    __tablename__ = "usage_rollups"
+    __table_args__ = (Index("uq_usage_rollups_owner_day", "owner_id", "day", unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    owner_id = Column(Integer, nullable=False, default=0)
+    day = Column(String(10), nullable=False)  # YYYY-MM-DD
+    pipelines = Column(Integer, nullable=False, default=0)  # executions created
+    builds = Column(Integer, nullable=False, default=0)  # successful builds
+    build_seconds = Column(Float, nullable=False, default=0.0)
+    lines_generated = Column(Integer, nullable=False, default=0)
+    bytes_generated = Column(Integer, nullable=False, default=0)
+    credits_used = Column(Integer, nullable=False, default=0)
+
+
+# File types counted towards lines_generated
+CODE_SUFFIXES = (".html", ".css", ".js", ".ts", ".tsx", ".jsx", ".py", ".json")
+
+
+def _chat_fields(message: dict) -> dict:
+    """ChatMessage column values for a client message dict."""
+    timestamp = message.get("timestamp")
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        timestamp = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).isoformat()  # JS epoch ms
+    content = message.get("content")
+    if not isinstance(content, str):
+        content = "" if content is None else json.dumps(content)
+    extra = {k: v for k, v in message.items() if k not in ("seq", "role", "content", "timestamp")}
+    return {
+        "role": str(message.get("role") or "user")[:20],
+        "content": content,
+        "timestamp": str(timestamp) if timestamp else None,
+        "extra": json.dumps(extra) if extra else None,
+    }
+
+
 def get_next_version(session, project_id: int) -> int:
     from sqlalchemy import func
     result = session.query(func.max(Execution.version)).filter(
@@ -168,79 +341,202 @@ def get_next_version(session, project_id: int) -> int:
     return (result or 0) + 1
 
 
+def add_execution(session, project: "Project", execution: "Execution") -> "Execution":
+    """
+    Add a new execution of `project` and update the project's summary columns.
+    The counters are SQL expressions, so concurrent requests can't lose an
+    increment; they take effect when the caller commits.
+    """
+    session.add(execution)
+    session.flush()  # assigns execution.id
+    project.execution_count = func.coalesce(Project.execution_count, 0) + 1
+    project.version_count = case(
+        (func.coalesce(Project.version_count, 0) < execution.version, execution.version),
+        else_=Project.version_count,
+    )
+    project.latest_execution_id = execution.id
+    if execution.is_active_head:
+        project.active_head_version = execution.version
+    bump_usage(session, project.owner_id, pipelines=1)
+    return execution
+
+
+def set_active_head(session, execution: "Execution") -> None:
+    """Make `execution` its project's only active head (restore)."""
+    session.query(Execution).filter(
+        Execution.project_id == execution.project_id
+    ).update({"is_active_head": False})
+    execution.is_active_head = True
+    session.query(Project).filter(Project.id == execution.project_id).update(
+        {"active_head_version": execution.version}
+    )
+
+
+def bump_usage(session, owner_id, **deltas) -> None:
+    """
+    Add `deltas` (UsageRollup counter -> amount) to today's row for owner_id.
+    A single upsert, so concurrent builds can't lose an increment; it takes
+    effect when the caller commits.
+    """
+    deltas = {name: amount for name, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(UsageRollup).values(
+        owner_id=owner_id or 0, day=datetime.now(timezone.utc).strftime("%Y-%m-%d"), **deltas,
+    )
+    columns = UsageRollup.__table__.c
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["owner_id", "day"],
+        set_={name: columns[name] + stmt.excluded[name] for name in deltas},
+    ))
+
+
+def record_build_output(session, execution: "Execution", duration_seconds: float, writes) -> None:
+    """
+    Store a successful build's duration and generated code size (from its
+    safe_write WriteRecords) and roll them into the owner's usage. A re-run of
+    an already counted build only adds the difference.
+    """
+    lines = sum(w.lines for w in writes if Path(w.path).suffix in CODE_SUFFIXES)
+    size = sum(w.bytes for w in writes)
+    counted = execution.lines_generated is not None
+    bump_usage(
+        session, execution.project.owner_id if execution.project else None,
+        builds=0 if counted else 1,
+        build_seconds=duration_seconds - ((execution.duration_seconds or 0) if counted else 0),
+        lines_generated=lines - (execution.lines_generated or 0),
+        bytes_generated=size - (execution.bytes_generated or 0),
+    )
+    execution.duration_seconds = duration_seconds
+    execution.lines_generated = lines
+    execution.bytes_generated = size
+
+
+def record_factsheet(execution: "Execution", factsheet: dict) -> None:
+    """Store a governance factsheet on its execution, with its scores as columns."""
+    scoring = factsheet.get("scoring", {})
+    readiness = factsheet.get("readiness", {})
+    execution.governance_log = json.dumps(factsheet)
+    execution.readiness_score = readiness.get("combined_score")
+    execution.quality_tier = readiness.get("quality_tier")
+    execution.prompt_quality_score = (scoring.get("prompt_quality") or {}).get("score")
+    execution.build_confidence_score = (scoring.get("build_confidence") or {}).get("score")
+    execution.human_review_required = factsheet.get("compliance", {}).get("human_review_required")
+
+
+def append_chat_message(session, execution_id: int, message: dict) -> "ChatMessage":
+    """
+    Append one message to an execution's conversation (takes effect on commit).
+    The next seq is computed inside the INSERT itself, so concurrent appends
+    can't both read the same MAX(seq) and collide on the unique index.
+    """
+    next_seq = (
+        select(func.coalesce(func.max(ChatMessage.seq), 0) + 1)
+        .where(ChatMessage.execution_id == execution_id)
+        .scalar_subquery()
+    )
+    row = ChatMessage(execution_id=execution_id, seq=next_seq, **_chat_fields(message))
+    session.add(row)
+    return row
+
+
+def save_chat_history(session, execution_id: int, messages: list) -> int:
+    """
+    Make an execution's stored conversation equal to `messages` (clients post
+    the whole conversation). If the stored messages are a prefix of it --
+    checked on the last one -- only the new tail is inserted; otherwise the
+    conversation is replaced. Returns the number of rows written.
+    """
+    messages = [m for m in messages if isinstance(m, dict)]
+    last = (
+        session.query(ChatMessage)
+        .filter(ChatMessage.execution_id == execution_id)
+        .order_by(ChatMessage.seq.desc())
+        .first()
+    )
+    start = 0
+    if last is not None:
+        if len(messages) >= last.seq and _chat_fields(messages[last.seq - 1])["content"] == last.content:
+            start = last.seq
+        else:
+            session.query(ChatMessage).filter(ChatMessage.execution_id == execution_id).delete()
+    session.add_all(
+        ChatMessage(execution_id=execution_id, seq=seq, **_chat_fields(m))
+        for seq, m in enumerate(messages[start:], start + 1)
+    )
+    return len(messages) - start
+
+
 # Database setup
 REPO_ROOT = Path(__file__).resolve().parent.parent
 DB_PATH = REPO_ROOT / "ai-dev-team.db"
-DATABASE_URL = f"sqlite:///{DB_PATH}"
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
+
+# Web threads + PIPELINE_WORKERS pipelines (each holding a session for its
+# whole run) + the job-queue poller draw from this pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# How long a SQLite writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "15000"))
+# WAL by default; DELETE (SQLite's default) is only useful for comparison benchmarks
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+
+
+def _is_file_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url and url.rstrip("/") not in ("sqlite:", "sqlite:/")
+
+
+def _engine_options(url: str) -> dict:
+    options = {"echo": False, "pool_pre_ping": not url.startswith("sqlite")}
+    if not url.startswith("sqlite") or _is_file_sqlite(url):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=30)
+    if url.startswith("sqlite"):
+        # Pooled connections are shared between request and worker threads
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    return options
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    """
+    WAL lets status polling read while a pipeline writes; synchronous=NORMAL
+    is durable under WAL except for the last commits on power loss.
+    """
+    if not DATABASE_URL.startswith("sqlite"):
+        return
+    cursor = dbapi_conn.cursor()
+    if _is_file_sqlite(DATABASE_URL):
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
 
-engine = create_engine(DATABASE_URL, echo=False)
 SessionLocal = sessionmaker(bind=engine)
+# Flask endpoints: one session per request thread, removed by app.py's teardown hook
+request_session = scoped_session(SessionLocal)
 
 
 def init_db():
-    """Initialize database tables. Safe to call multiple times."""
-    Base.metadata.create_all(engine)
-    # Lightweight migration: add locked_ui_archetype column if missing
-    try:
-        with engine.connect() as conn:
-            cols = [row[1] for row in conn.execute(text("PRAGMA table_info(projects)")).fetchall()]
-            if "locked_ui_archetype" not in cols:
-                conn.execute(text("ALTER TABLE projects ADD COLUMN locked_ui_archetype VARCHAR(50)"))
-                conn.commit()
-    except Exception as e:
-        print(f"Warning: could not ensure locked_ui_archetype column: {e}")
-    # Lightweight migration: add build metrics columns if missing
-    try:
-        with engine.connect() as conn:
-            cols = [row[1] for row in conn.execute(text("PRAGMA table_info(executions)")).fetchall()]
-            for col_name, col_type in [
-                ("tokens_used", "INTEGER"),
-                ("estimated_cost", "REAL"),
-                ("credits_used", "INTEGER"),
-                ("duration_seconds", "REAL"),
-                ("model_used", "VARCHAR(100)"),
-                ("governance_log", "TEXT"),
-                ("readiness_score", "REAL"),
-                ("quality_tier", "VARCHAR(10)"),
-            ]:
-                if col_name not in cols:
-                    conn.execute(text(f"ALTER TABLE executions ADD COLUMN {col_name} {col_type}"))
-            conn.commit()
-    except Exception as e:
-        print(f"Warning: could not ensure build metrics columns: {e}")
-    # Migration: add auth columns to users table if missing
-    try:
-        with engine.connect() as conn:
-            cols = [row[1] for row in conn.execute(text("PRAGMA table_info(users)")).fetchall()]
-            for col_name, col_type in [
-                ("password_hash", "VARCHAR(255)"),
-                ("reset_token", "VARCHAR(255)"),
-                ("reset_token_expires", "DATETIME"),
-            ]:
-                if col_name not in cols:
-                    conn.execute(text(f"ALTER TABLE users ADD COLUMN {col_name} {col_type}"))
-            conn.commit()
-    except Exception as e:
-        print(f"Warning: could not ensure auth columns: {e}")
-    # Mark any stuck RUNNING executions as FAILED (handles Flask crash mid-build)
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("UPDATE executions SET status = 'failed' WHERE status = 'running'"))
-            conn.execute(text(
-                "UPDATE projects SET status = 'failed' "
-                "WHERE status IN ('running', 'in_progress') "
-                "AND id IN (SELECT DISTINCT project_id FROM executions WHERE status = 'failed')"
-            ))
-            conn.commit()
-    except Exception as e:
-        print(f"Warning: could not clean up stuck executions: {e}")
+    """Create or upgrade the schema by applying pending migrations (see migrations.py)."""
+    from migrations import migrate
+    migrate()
     print(f"Database initialized at: {DB_PATH}")
 
 
-init_db()
-
 
 def get_session():
-    """Get a new database session. Remember to close it after use!"""
+    """
+    Get a new database session. Remember to close it after use!
+    Flask endpoints use request_session() instead, which the app's teardown
+    hook closes.
+    """
     return SessionLocal()
 
@@ -0,0 +1,71 @@
+"""
+Standalone pipeline worker for Archon.
+
+Runs the same worker pool the Flask app embeds, but in its own process so
+builds can scale out across hosts and the web tier can restart without
+killing in-flight builds. Every worker shares the pipeline_jobs table:
+jobs are claimed under a lease, kept alive with heartbeats, and reclaimed
+by any surviving worker once the lease of a dead worker expires.
+
+Usage:
+    cd backend
+    python worker.py --workers 4
+
+Set PIPELINE_WORKERS=0 on the web tier to make it enqueue-only. On SIGTERM
+the worker stops claiming jobs and lets running builds finish; with
+--drain-timeout, builds still running after that long go back to the queue.
+"""
+import argparse
+import signal
+import threading
+
+from app import run_pipeline_job
+from job_queue import PipelineWorkerPool, lease_seconds
+from migrations import verify_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Archon pipeline workers")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Concurrent pipelines on this host (default: PIPELINE_WORKERS or 2)")
+    parser.add_argument("--lease", type=int, default=None,
+                        help="Lease length in seconds (default: PIPELINE_LEASE_SECONDS or 30)")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="Seconds between queue polls when idle")
+    parser.add_argument("--drain-timeout", type=float, default=None,
+                        help="On SIGTERM, seconds to let running builds finish before handing them back "
+                             "to the queue (default: wait for them)")
+    args = parser.parse_args()
+    verify_schema()
+
+    size = args.workers
+    if size is not None and size < 1:
+        parser.error("--workers must be at least 1")
+
+    pool = PipelineWorkerPool(
+        run_pipeline_job,
+        size=size,
+        poll_interval=args.poll_interval,
+        lease=args.lease or lease_seconds(),
+    )
+    if pool.size == 0:
+        pool.size = 1
+
+    stop = threading.Event()
+
+    def _shutdown(signum, frame):
+        # Leases stay renewed while the builds drain, so no other worker re-runs them meanwhile
+        print(f"Worker received signal {signum}, finishing running jobs...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+
+    pool.start()
+    stop.wait()
+    pool.stop(timeout=args.drain_timeout)
+    print("Worker stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,13 @@ class BuildError(Exception):
 
 
 class BuilderAPI:
-    def __init__(self, base_url: str = "http://localhost:5000"):
+    def __init__(self, base_url: str = "http://localhost:5000", priority: str = "batch",
+                 max_admission_wait: float = 600.0):
         self.base_url = base_url.rstrip("/")
         self.session = requests.Session()
+        # Eval builds queue behind interactive users in the backend scheduler
+        self.session.headers["X-Build-Priority"] = priority
+        self.max_admission_wait = max_admission_wait
 
     def _url(self, path: str) -> str:
         return f"{self.base_url}{path}"
@@ -57,7 +61,20 @@ class BuilderAPI:
         Returns dict with keys: execution_id, version, project_id.
         """
         payload = {"project_id": project_id}
-        resp = self.session.post(self._url("/api/execute-task"), json=payload, timeout=30)
+        waited = 0.0
+        while True:
+            resp = self.session.post(self._url("/api/execute-task"), json=payload, timeout=30)
+            if resp.status_code != 429 or waited >= self.max_admission_wait:
+                break
+            # Build queue is full: back off for as long as the server asks
+            try:
+                retry_after = float(resp.headers.get("Retry-After", 10))
+            except ValueError:
+                retry_after = 10.0
+            retry_after = min(max(retry_after, 1.0), self.max_admission_wait - waited)
+            logger.info(f"Build queue full, retrying in {retry_after:.0f}s")
+            time.sleep(retry_after)
+            waited += retry_after
         resp.raise_for_status()
         data = resp.json()
 
@@ -106,6 +106,10 @@ async def run_eval_loop(config: dict = None):
     max_iterations = config.get("max_iterations", 5)
     target_score = config.get("target_score", 80)
     score_only = config.get("score_only", False)
+    if score_only:
+        # Prompts don't change between runs, so identical screenshots can reuse their scores
+        import os
+        os.environ.setdefault("LLM_CACHE", "scorer")
     convergence_threshold = config.get("convergence_threshold", 2)
     build_timeout = config.get("build_timeout_seconds", 300)
     wait_seconds = config.get("screenshot_wait_seconds", 3.0)
@@ -315,6 +319,11 @@ async def run_eval_loop(config: dict = None):
     logger.info(f"{'='*60}")
     logger.info(f"\n{final_report}")
 
+    from utils.llm_cache import get_llm_cache
+    cache_stats = get_llm_cache().stats()
+    if cache_stats["hits"] or cache_stats["misses"]:
+        logger.info(f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
     return all_iterations
 
 
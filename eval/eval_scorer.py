@@ -64,6 +64,17 @@ SCORING CALIBRATION:
 Output ONLY the JSON object. No markdown fences. No explanation outside the JSON."""
 
 
+def _strip_fences(text: str) -> str:
+    """Strip markdown fences if present."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1]
+        if text.endswith("```"):
+            text = text[:-3]
+        text = text.strip()
+    return text
+
+
 class DesignScorer:
     def __init__(self, genai_client, model: str = "gemini-2.5-flash"):
         self.client = genai_client
@@ -127,6 +138,7 @@ class DesignScorer:
         archetype: str,
         good_references: list[tuple[str, Path]] = None,
         bad_references: list[tuple[str, Path]] = None,
+        sample: int = 0,
     ) -> ScoringResult:
         """Score a screenshot using Gemini vision.
 
@@ -135,6 +147,8 @@ class DesignScorer:
             archetype: Archetype name (e.g., "dashboard", "game").
             good_references: List of (label, path) tuples for good example images.
             bad_references: List of (label, path) tuples for bad example images.
+            sample: Index of this scoring run. Repeated runs over the same
+                screenshot are cached separately so averaging still works.
 
         Returns:
             ScoringResult with per-dimension scores and feedback.
@@ -170,7 +184,10 @@ class DesignScorer:
 
         logger.info(f"Scoring {screenshot_path} as '{archetype}' with {len(good_references or [])} good refs, {len(bad_references or [])} bad refs")
 
-        response = self.client.models.generate_content(
+        from utils.llm_cache import cached_generate_content
+
+        response = cached_generate_content(
+            self.client, "scorer",
             model=self.model,
             contents=contents,
             config={
@@ -179,15 +196,11 @@ class DesignScorer:
                 "temperature": 0.3,
                 "max_output_tokens": 8000,
             },
+            sample=sample,
+            validate=lambda text: json.loads(_strip_fences(text)),
         )
 
-        raw_text = (getattr(response, "text", "") or "").strip()
-        # Strip markdown fences if present
-        if raw_text.startswith("```"):
-            raw_text = raw_text.split("\n", 1)[1]
-            if raw_text.endswith("```"):
-                raw_text = raw_text[:-3]
-            raw_text = raw_text.strip()
+        raw_text = _strip_fences(getattr(response, "text", "") or "")
 
         try:
             data = json.loads(raw_text)
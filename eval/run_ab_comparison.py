@@ -121,7 +121,7 @@ def score_one(client, screenshot_path: Path, archetype: str, num_runs: int = 3)
     for i in range(num_runs):
         for attempt in range(3):
             try:
-                result = scorer.score(screenshot_path, score_archetype)
+                result = scorer.score(screenshot_path, score_archetype, sample=i)
                 results.append(result)
                 break
             except Exception as e:
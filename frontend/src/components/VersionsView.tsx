@@ -14,6 +14,7 @@ interface Version {
   prompt?: string;
   buildSummary?: string;
   filesGenerated?: number;
+  previewEtag?: string | null;
   qualityTier?: string | null;
   readinessScore?: number | null;
 }
@@ -84,6 +85,7 @@ export const VersionsView = ({ projectId, selectedVersion, onVersionSelect, onAr
           filesChanged: fileCount,
           prompt: lastUserMsg,
           filesGenerated: fileCount,
+          previewEtag: v.preview_etag ?? null,
           qualityTier: v.quality_tier ?? null,
           readinessScore: v.readiness_score ?? null,
           buildSummary: isSuccess
@@ -117,6 +119,10 @@ export const VersionsView = ({ projectId, selectedVersion, onVersionSelect, onAr
   const version = versions.find((v) => v.id === selected);
   const latestVersionId = versions.length > 0 ? versions[0].id : null; // versions sorted descending
   const isBuildingSelected = isProjectBuilding && selected === latestVersionId;
+  // A finished version's preview is immutable: its ETag in the URL lets the browser cache it outright
+  const previewSrc = version?.previewEtag
+    ? `http://localhost:5000/api/preview/${projectId}/${selected}?h=${version.previewEtag}`
+    : `http://localhost:5000/api/preview/${projectId}/${selected}?k=${iframeKey}`;
 
   if (!projectId) {
     return (
@@ -317,7 +323,7 @@ export const VersionsView = ({ projectId, selectedVersion, onVersionSelect, onAr
                     <div className="ml-3 h-4 w-48 bg-secondary rounded-sm" />
                   </div>
                   <iframe
-                    src={`http://localhost:5000/api/preview/${projectId}/${selected}?k=${iframeKey}`}
+                    src={previewSrc}
                     className="w-full flex-1 border-0"
                   />
                 </div>
@@ -329,7 +335,7 @@ export const VersionsView = ({ projectId, selectedVersion, onVersionSelect, onAr
                     </div>
                     <div className="mx-2 mb-2 rounded-xl overflow-hidden border border-border flex-1">
                       <iframe
-                        src={`http://localhost:5000/api/preview/${projectId}/${selected}?k=${iframeKey}`}
+                        src={previewSrc}
                         className="w-full h-full border-0"
                       />
                     </div>
@@ -138,6 +138,7 @@ export interface PlatformStats {
   versions_shipped: number;
   avg_build_time_seconds: number;
   lines_generated: number;
+  bytes_generated: number;
   pipelines_today: number;
 }
 
@@ -173,6 +174,7 @@ export interface DashboardStats {
   avg_prompt_score: number | null;
   avg_build_score: number | null;
   scored_builds: number;
+  human_review_builds: number;
 }
 
 export async function fetchDashboardStats(): Promise<DashboardStats | null> {
@@ -257,6 +259,7 @@ export interface Version {
   model_used?: string | null;
   files_generated?: number;
   images_generated?: number;
+  preview_etag?: string | null;
   quality_tier?: string | null;
   readiness_score?: number | null;
 }
@@ -469,6 +472,8 @@ export interface PipelineState {
   executionId: number | null;
 }
 
+const PIPELINE_STAGES: PipelineStage[] = ["pm", "planner", "engineer"];
+
 export function usePipelineStatus(projectId: number | null, enabled: boolean) {
   const [state, setState] = useState<PipelineState>({
     running: false,
@@ -479,26 +484,33 @@ export function usePipelineStatus(projectId: number | null, enabled: boolean) {
     executionId: null,
   });
   const intervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  const eventSourceRef = useRef<EventSource | null>(null);
+
+  const applyStatus = useCallback((data: ExecutionStatus) => {
+    // Only update if this status belongs to our project
+    if (data.project_id !== projectId) return false;
+    setState({
+      running: data.status === "RUNNING",
+      stage: data.currentStage as PipelineStage,
+      status: data.status,
+      logs: data.logs || [],
+      projectId: data.project_id,
+      executionId: data.execution_id,
+    });
+    return data.status === "RUNNING";
+  }, [projectId]);
 
   const startPolling = useCallback(() => {
-    // Clear any existing interval
+    // Clear any existing stream / interval
+    if (eventSourceRef.current) eventSourceRef.current.close();
+    eventSourceRef.current = null;
     if (intervalRef.current) clearInterval(intervalRef.current);
+    intervalRef.current = null;
 
     const poll = async () => {
       try {
         const data = await fetchExecutionStatus(projectId);
-        // Only update if this status belongs to our project
-        if (data.project_id !== projectId) return;
-        const isRunning = data.status === "RUNNING";
-        setState({
-          running: isRunning,
-          stage: data.currentStage as PipelineStage,
-          status: data.status,
-          logs: data.logs || [],
-          projectId: data.project_id,
-          executionId: data.execution_id,
-        });
-        if (!isRunning && intervalRef.current) {
+        if (!applyStatus(data) && data.project_id === projectId && intervalRef.current) {
           clearInterval(intervalRef.current);
           intervalRef.current = null;
         }
@@ -506,12 +518,49 @@ export function usePipelineStatus(projectId: number | null, enabled: boolean) {
         // ignore poll errors
       }
     };
+    const fallBackToPolling = () => {
+      poll(); // immediate first poll
+      intervalRef.current = setInterval(poll, 2000);
+    };
 
-    poll(); // immediate first poll
-    intervalRef.current = setInterval(poll, 2000);
-  }, [projectId]);
+    if (!projectId || typeof EventSource === "undefined") {
+      fallBackToPolling();
+      return;
+    }
+
+    // Server pushes logs, stage transitions and status; the browser resumes with Last-Event-ID
+    const es = new EventSource(`${API_BASE}/projects/${projectId}/events`);
+    eventSourceRef.current = es;
+    es.addEventListener("status", (e) => {
+      if (!applyStatus(JSON.parse((e as MessageEvent).data)) && eventSourceRef.current === es) {
+        es.close();
+        eventSourceRef.current = null;
+      }
+    });
+    es.addEventListener("log", (e) => {
+      const entry = JSON.parse((e as MessageEvent).data);
+      setState((prev) => ({ ...prev, logs: [...prev.logs, entry] }));
+    });
+    es.addEventListener("stage", (e) => {
+      const { stage, status } = JSON.parse((e as MessageEvent).data);
+      if (status === "running" && PIPELINE_STAGES.includes(stage)) {
+        setState((prev) => ({ ...prev, stage }));
+      }
+    });
+    es.onerror = () => {
+      // Closed for good (e.g. older backend without /events) -- poll instead
+      if (es.readyState === EventSource.CLOSED && eventSourceRef.current === es) {
+        eventSourceRef.current = null;
+        fallBackToPolling();
+      }
+    };
+  }, [projectId, applyStatus]);
 
   const stopPolling = useCallback(() => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+      eventSourceRef.current = null;
+    }
     if (intervalRef.current) {
       clearInterval(intervalRef.current);
       intervalRef.current = null;
@@ -0,0 +1,140 @@
+"""
+Read throughput of the status endpoints while pipelines write to the DB.
+
+Writer threads replay what a running pipeline does to the database (status
+updates, job heartbeats, usage rows, commits) while reader threads poll
+/api/projects, /api/execution-status and /api/projects/<id> through the
+Flask app. Reports reads/s, read latency p50/p95/p99, writes/s and
+"database is locked" errors. Runs on a scratch SQLite DB; compare journal
+modes with --journal-mode DELETE.
+
+    python -m scripts.bench_db --seconds 10 --writers 4 --readers 8
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+PROJECTS = 20
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="DB read throughput under concurrent pipeline writes")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent simulated pipelines")
+    parser.add_argument("--readers", type=int, default=8, help="Concurrent polling clients")
+    parser.add_argument("--journal-mode", default="WAL", help="SQLite journal mode (WAL or DELETE)")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}"
+    os.environ["SQLITE_JOURNAL_MODE"] = args.journal_mode
+    os.environ["PIPELINE_WORKERS"] = "0"
+    sys.path.insert(0, str(REPO_ROOT / "backend"))
+
+    import app as backend
+    from migrations import migrate
+    from models import Execution, ModelUsage, PipelineJob, Project, get_session
+
+    migrate()
+
+    session = get_session()
+    executions = []
+    for n in range(PROJECTS):
+        project = Project(name=f"bench-{n}", status="in_progress")
+        session.add(project)
+        session.flush()
+        execution = Execution(project_id=project.id, version=1, status="running", is_active_head=True)
+        session.add(execution)
+        session.flush()
+        session.add(PipelineJob(execution_id=execution.id, project_id=project.id, status="claimed", payload="{}"))
+        executions.append((project.id, execution.id))
+    session.commit()
+    session.close()
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    read_latencies: list[float] = []
+    counts = {"writes": 0, "read_errors": 0, "write_errors": 0, "locked": 0}
+
+    def count(key: str) -> None:
+        with lock:
+            counts[key] += 1
+
+    def writer(i: int) -> None:
+        project_id, execution_id = executions[i % len(executions)]
+        while not stop.is_set():
+            s = get_session()
+            try:
+                execution = s.get(Execution, execution_id)
+                execution.status = "running"
+                s.query(PipelineJob).filter(PipelineJob.execution_id == execution_id).update(
+                    {"heartbeat_at": backend.datetime.utcnow()})
+                s.add(ModelUsage(execution_id=execution_id, project_id=project_id, stage="engineer",
+                                 provider="gemini", model="gemini-2.5-flash", input_tokens=1000, output_tokens=500))
+                s.commit()
+                count("writes")
+            except Exception as e:
+                s.rollback()
+                count("locked" if "locked" in str(e) else "write_errors")
+            finally:
+                s.close()
+            time.sleep(0.01)
+
+    def reader(i: int) -> None:
+        client = backend.app.test_client()
+        n = i
+        while not stop.is_set():
+            project_id, _ = executions[n % len(executions)]
+            url = [
+                "/api/projects",
+                f"/api/execution-status?project_id={project_id}",
+                f"/api/projects/{project_id}",
+            ][n % 3]
+            n += 1
+            start = time.perf_counter()
+            resp = client.get(url)
+            elapsed = time.perf_counter() - start
+            if resp.status_code >= 500:
+                count("locked" if b"locked" in resp.data else "read_errors")
+                continue
+            with lock:
+                read_latencies.append(elapsed)
+
+    threads = [threading.Thread(target=writer, args=(i,), daemon=True) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(args.readers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+    elapsed = time.perf_counter() - started
+
+    print(f"\njournal_mode={args.journal_mode} writers={args.writers} readers={args.readers} {elapsed:.1f}s")
+    print(f"reads:  {len(read_latencies) / elapsed:8.1f}/s   "
+          + "   ".join(f"p{p} {percentile(read_latencies, p) * 1000:.1f}ms" for p in (50, 95, 99) if read_latencies))
+    print(f"writes: {counts['writes'] / elapsed:8.1f}/s")
+    print(f"errors: locked={counts['locked']} read={counts['read_errors']} write={counts['write_errors']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Load-test the build pipeline with simulated models (utils/fake_models.py).
+
+Drives N builds, `--concurrency` at a time, through the Flask API
+(create project -> POST /api/execute-task -> poll /api/execution-status),
+then reads each execution's trace and reports throughput, end-to-end
+latency and p50/p95/p99 per stage.
+
+By default the backend runs in this process on a scratch SQLite DB with
+MODEL_BACKEND=fake. Generated files still go to the usual generated/ tree.
+With --url the builds go to a running backend instead; start that one with
+MODEL_BACKEND=fake (and the FAKE_MODEL_* settings) yourself.
+
+    python -m scripts.bench_pipeline --builds 20 --concurrency 4 --profile instant
+    python -m scripts.bench_pipeline --url http://localhost:5000 --builds 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from eval.api_client import BuilderAPI  # noqa: E402
+
+PROMPTS = [
+    "A landing page for a neighbourhood bakery with opening hours and a menu",
+    "A portfolio site for a wedding photographer",
+    "A dashboard for tracking team OKRs",
+    "A recipe blog with categories and search",
+]
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def start_local_backend(workers: int) -> str:
+    """Serve backend/app.py from a thread of this process; returns its base URL."""
+    os.environ["MODEL_BACKEND"] = "fake"
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}")
+    os.environ["PIPELINE_WORKERS"] = str(workers)
+    os.environ.setdefault("PIPELINE_MAX_RUNNING_PER_USER", str(workers))
+    sys.path.insert(0, str(REPO_ROOT / "backend"))
+
+    from werkzeug.serving import make_server
+    import app as backend
+    from migrations import migrate
+
+    migrate()
+
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend.ensure_pipeline_workers()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def run_build(api: BuilderAPI, n: int, timeout: float, poll_interval: float) -> dict:
+    started = time.perf_counter()
+    record = {"build": n, "ok": False}
+    try:
+        project_id = api.create_project(f"bench-{n}", PROMPTS[n % len(PROMPTS)])
+        record.update(api.trigger_build(project_id))
+        api.poll_until_done(project_id=project_id, timeout=timeout, poll_interval=poll_interval)
+        record["ok"] = True
+    except Exception as e:
+        record["error"] = str(e)[:200]
+    record["seconds"] = time.perf_counter() - started
+    if record.get("execution_id"):
+        resp = api.session.get(api._url(f"/api/executions/{record['execution_id']}/trace"), timeout=10)
+        if resp.status_code == 200:
+            record["stages"] = {
+                s["name"][len("stage."):]: s["duration"]
+                for s in resp.json().get("spans", [])
+                if s["name"].startswith("stage.")
+            }
+    return record
+
+
+def summarize(records: list[dict], wall_seconds: float) -> dict:
+    ok = [r for r in records if r["ok"]]
+    stage_names = sorted({name for r in ok for name in r.get("stages", {})})
+
+    def dist(values):
+        return {f"p{p}": percentile(values, p) for p in (50, 95, 99)} | {"n": len(values)}
+
+    return {
+        "builds": len(records),
+        "succeeded": len(ok),
+        "wall_seconds": round(wall_seconds, 2),
+        "builds_per_minute": round(len(ok) / wall_seconds * 60, 2) if wall_seconds else None,
+        "end_to_end": dist([r["seconds"] for r in ok]),
+        "stages": {name: dist([r["stages"][name] for r in ok if name in r.get("stages", {})])
+                   for name in stage_names},
+        "errors": [r["error"] for r in records if not r["ok"]],
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['succeeded']}/{report['builds']} builds succeeded in {report['wall_seconds']}s "
+          f"({report['builds_per_minute']} builds/min)")
+    print(f"{'':<14}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = [("end-to-end", report["end_to_end"])] + list(report["stages"].items())
+    for name, d in rows:
+        cells = "".join(f"{d[p]:>10.2f}" if d[p] is not None else f"{'-':>10}" for p in ("p50", "p95", "p99"))
+        print(f"{name:<14}{d['n']:>5}{cells}")
+    for err in report["errors"][:10]:
+        print(f"  error: {err}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test the pipeline with simulated models")
+    parser.add_argument("--builds", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--url", help="Benchmark a running backend instead of an in-process one")
+    parser.add_argument("--profile", help="FAKE_MODEL_PROFILE for the in-process backend (default realistic)")
+    parser.add_argument("--workers", type=int, help="Pipeline workers of the in-process backend (default --concurrency)")
+    parser.add_argument("--priority", default="interactive", choices=["interactive", "batch"])
+    parser.add_argument("--timeout", type=float, default=900, help="Per-build timeout in seconds")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--out", help="Also write the report (and per-build records) as JSON here")
+    args = parser.parse_args()
+
+    if args.url:
+        base_url = args.url
+    else:
+        if args.profile:
+            os.environ["FAKE_MODEL_PROFILE"] = args.profile
+        base_url = start_local_backend(args.workers or args.concurrency)
+
+    api = BuilderAPI(base_url, priority=args.priority)
+    if not api.health_check():
+        print(f"Backend not reachable at {base_url}")
+        return 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        records = list(pool.map(
+            lambda n: run_build(api, n, args.timeout, args.poll_interval), range(args.builds)
+        ))
+    report = summarize(records, time.perf_counter() - started)
+    print_report(report)
+    if args.out:
+        Path(args.out).write_text(json.dumps({**report, "records": records}, indent=2), encoding="utf-8")
+    return 0 if report["succeeded"] == report["builds"] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,6 +26,7 @@ class WriteRecord:
     path: str
     sha256: str
     bytes: int
+    lines: int = 0
 
 
 def _sha256_bytes(data: bytes) -> str:
@@ -50,6 +51,7 @@ def safe_write_text(
     relative_path: str,
     content: str,
     allowed_extensions: Optional[Iterable[str]] = None,
+    store=None,
 ) -> WriteRecord:
     """
     Deterministic, allow-listed file write.
@@ -57,6 +59,8 @@ def safe_write_text(
     - Rejects path traversal / escaping
     - Restricts file extensions
     - Atomic write
+    - With a BlobStore (utils/blob_store.py), content is stored once by hash
+      and the target becomes a link to it
     """
     allowlist_dir = allowlist_dir.resolve()
     allowlist_dir.mkdir(parents=True, exist_ok=True)
@@ -90,12 +94,16 @@ def safe_write_text(
     digest = _sha256_bytes(data)
 
     # Atomic write
-    target.parent.mkdir(parents=True, exist_ok=True)
-    tmp = target.with_suffix(target.suffix + ".tmp")
-    tmp.write_bytes(data)
-    tmp.replace(target)
-
-    return WriteRecord(path=str(target), sha256=digest, bytes=len(data))
+    if store is not None:
+        store.put_bytes(data, digest)
+        store.link(digest, target)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(target)
+
+    return WriteRecord(path=str(target), sha256=digest, bytes=len(data), lines=content.count("\n") + 1)
 
 
 def _tail_after_code(path: str) -> str:
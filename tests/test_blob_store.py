@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from agents import design_agent  # noqa: E402
+from scripts.safe_write import safe_write_text  # noqa: E402
+from utils.blob_store import BlobStore, link_or_copy  # noqa: E402
+
+
+class BlobStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.store = BlobStore(self.root / "objects")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _objects(self) -> list[Path]:
+        return [p for p in self.store.root.glob("??/*")]
+
+    def test_identical_writes_share_one_object(self):
+        for version in (1, 2, 3):
+            rec = safe_write_text(
+                allowlist_dir=self.root / f"v{version}" / "code",
+                relative_path="src/base.css",
+                content=":root { --accent: #0af; }\n",
+                store=self.store,
+            )
+        self.assertEqual(len(self._objects()), 1)
+        obj = self.store.path(rec.sha256)
+        self.assertEqual(obj.read_text(), ":root { --accent: #0af; }\n")
+        if obj.stat().st_nlink > 1:  # hard links available on this filesystem
+            self.assertEqual(obj.stat().st_nlink, 4)
+
+    def test_rewriting_a_linked_file_leaves_the_object_alone(self):
+        code = self.root / "v1" / "code"
+        first = safe_write_text(allowlist_dir=code, relative_path="index.html", content="<p>one</p>", store=self.store)
+        link_or_copy(code / "index.html", self.root / "published.html")
+        safe_write_text(allowlist_dir=code, relative_path="index.html", content="<p>two</p>", store=self.store)
+        self.assertEqual((code / "index.html").read_text(), "<p>two</p>")
+        self.assertEqual(self.store.path(first.sha256).read_text(), "<p>one</p>")
+        self.assertEqual((self.root / "published.html").read_text(), "<p>one</p>")
+
+    def test_adopt_moves_a_file_into_the_store(self):
+        asset = self.root / "v1" / "assets" / "hero.png"
+        asset.parent.mkdir(parents=True)
+        asset.write_bytes(b"\x89PNG fake")
+        copy = self.root / "v2" / "assets" / "hero.png"
+        copy.parent.mkdir(parents=True)
+        copy.write_bytes(b"\x89PNG fake")
+        self.assertEqual(self.store.adopt(asset), self.store.adopt(copy))
+        self.assertEqual(len(self._objects()), 1)
+        self.assertEqual(copy.read_bytes(), b"\x89PNG fake")
+
+    def test_regenerating_an_adopted_asset_leaves_other_links_alone(self):
+        assets = self.root / "v2" / "assets"
+        assets.mkdir(parents=True)
+        (assets / "hero.png").write_bytes(b"\x89PNG old")
+        sha256 = self.store.adopt(assets / "hero.png")
+        self.store.link(sha256, self.root / "v1" / "assets" / "hero.png")
+
+        req = {"key": "hero", "prompt": "a hero image"}
+        with mock.patch.object(design_agent, "cached_image_bytes", return_value=b"\x89PNG new"):
+            self.assertIsNotNone(design_agent._generate_one(req, client=None, save_dir=assets))
+        self.assertEqual((assets / "hero.png").read_bytes(), b"\x89PNG new")
+        self.assertEqual(self.store.path(sha256).read_bytes(), b"\x89PNG old")
+        self.assertEqual((self.root / "v1" / "assets" / "hero.png").read_bytes(), b"\x89PNG old")
+
+    def test_prune_removes_only_unlinked_objects(self):
+        code = self.root / "v1" / "code"
+        safe_write_text(allowlist_dir=code, relative_path="a.css", content="a{}", store=self.store)
+        gone = safe_write_text(allowlist_dir=code, relative_path="b.css", content="b{}", store=self.store)
+        if self.store.path(gone.sha256).stat().st_nlink == 1:
+            self.skipTest("filesystem without hard links")
+        (code / "b.css").unlink()
+        self.assertEqual(self.store.prune(grace_seconds=-1), 1)
+        self.assertFalse(self.store.path(gone.sha256).exists())
+        self.assertEqual((code / "a.css").read_text(), "a{}")
+
+
+if __name__ == "__main__":
+    unittest.main()
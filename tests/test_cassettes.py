@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import anthropic  # noqa: E402
+from google.genai.errors import ClientError  # noqa: E402
+
+from schemas.prd_schema import PRD  # noqa: E402
+from utils.cassettes import CassetteAnthropic, CassetteGenaiClient, CassetteMiss, CassetteStore  # noqa: E402
+from utils.fake_models import FakeAnthropic, FakeGenaiClient, FakeProfile, _Simulator  # noqa: E402
+
+
+def _fake(**kwargs):
+    return _Simulator(FakeProfile(**kwargs), seed=1)
+
+
+class CassetteTests(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+
+    def test_record_then_replay_generate_content(self):
+        config = {"response_schema": PRD}
+        recorder = CassetteGenaiClient(FakeGenaiClient(_fake()), CassetteStore(self.root))
+        recorded = recorder.models.generate_content(model="gemini-2.5-flash", contents="Client requirements: a", config=config)
+
+        player = CassetteGenaiClient(store=CassetteStore(self.root))
+        replayed = player.models.generate_content(model="gemini-2.5-flash", contents="Client requirements: a", config=config)
+        self.assertEqual(replayed.text, recorded.text)
+        self.assertEqual(replayed.parsed, recorded.parsed)
+        self.assertEqual(replayed.usage_metadata.prompt_token_count, recorded.usage_metadata.prompt_token_count)
+
+        with self.assertRaises(CassetteMiss):
+            player.models.generate_content(model="gemini-2.5-flash", contents="something else", config=config)
+
+    def test_interactions_replay_in_order_including_errors(self):
+        store = CassetteStore(self.root)
+        failing = CassetteGenaiClient(FakeGenaiClient(_fake(rate_limit_rate=1.0)), store)
+        with self.assertRaises(ClientError):
+            failing.models.generate_images(model="imagen", prompt="hero 1")
+        CassetteGenaiClient(FakeGenaiClient(_fake()), store).models.generate_images(model="imagen", prompt="hero 1")
+
+        player = CassetteGenaiClient(store=CassetteStore(self.root))
+        with self.assertRaises(ClientError) as ctx:
+            player.models.generate_images(model="imagen", prompt="hero 1")
+        self.assertIn("RESOURCE_EXHAUSTED", str(ctx.exception))
+        for _ in range(2):  # the last interaction repeats once the recording runs out
+            images = player.models.generate_images(model="imagen", prompt="hero 1").generated_images
+            self.assertTrue(images[0].image.image_bytes.startswith(b"\x89PNG"))
+
+    def test_claude_stream_round_trip(self):
+        messages = [{"role": "user", "content": "build it"}]
+        recorder = CassetteAnthropic(FakeAnthropic(simulator=_fake()), CassetteStore(self.root))
+        with recorder.messages.stream(model="claude-opus-4-6", max_tokens=10, messages=messages) as s:
+            recorded = "".join(s.text_stream)
+            usage = s.get_final_message().usage
+
+        player = CassetteAnthropic(store=CassetteStore(self.root))
+        with player.messages.stream(model="claude-opus-4-6", max_tokens=10, messages=messages) as s:
+            self.assertEqual("".join(s.text_stream), recorded)
+            self.assertEqual(s.get_final_message().usage.output_tokens, usage.output_tokens)
+
+        recorder = CassetteAnthropic(FakeAnthropic(simulator=_fake(rate_limit_rate=1.0)), CassetteStore(self.root))
+        with self.assertRaises(anthropic.RateLimitError):
+            with recorder.messages.stream(model="claude-opus-4-6", max_tokens=5, messages=messages) as s:
+                "".join(s.text_stream)
+        with self.assertRaises(anthropic.RateLimitError):
+            CassetteAnthropic(store=CassetteStore(self.root)).messages.stream(
+                model="claude-opus-4-6", max_tokens=5, messages=messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
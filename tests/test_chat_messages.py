@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from models import (  # noqa: E402
+    ChatMessage,
+    Execution,
+    Project,
+    add_execution,
+    append_chat_message,
+    get_session,
+    save_chat_history,
+)
+from migrations import migrate  # noqa: E402
+
+migrate()
+
+
+class ChatMessageTests(unittest.TestCase):
+    def setUp(self):
+        self.session = get_session()
+        project = Project(name="Chat Test", status="in_progress")
+        self.session.add(project)
+        self.session.commit()
+        self.execution = add_execution(self.session, project, Execution(project_id=project.id, version=1))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def _stored(self) -> list[dict]:
+        rows = (
+            self.session.query(ChatMessage)
+            .filter(ChatMessage.execution_id == self.execution.id)
+            .order_by(ChatMessage.seq)
+            .all()
+        )
+        return [m.to_dict() for m in rows]
+
+    def test_append_assigns_sequence_numbers(self):
+        for text in ("one", "two", "three"):
+            append_chat_message(self.session, self.execution.id, {"role": "user", "content": text})
+        self.session.commit()
+        self.assertEqual([(m["seq"], m["content"]) for m in self._stored()], [(1, "one"), (2, "two"), (3, "three")])
+
+    def test_concurrent_appends_get_distinct_sequence_numbers(self):
+        execution_id = self.execution.id
+        errors = []
+        start = threading.Barrier(4)
+
+        def chat(worker: int):
+            session = get_session()
+            try:
+                start.wait()
+                for i in range(5):
+                    append_chat_message(session, execution_id, {"role": "user", "content": f"{worker}-{i}"})
+                    session.commit()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=chat, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([m["seq"] for m in self._stored()], list(range(1, 21)))
+
+    def test_messages_round_trip_client_fields(self):
+        message = {"id": "m-1", "role": "archon", "content": "hi", "timestamp": 0, "imageUrls": ["/a.png"]}
+        save_chat_history(self.session, self.execution.id, [message])
+        self.session.commit()
+        stored = self._stored()[0]
+        self.assertEqual(stored["id"], "m-1")
+        self.assertEqual(stored["imageUrls"], ["/a.png"])
+        self.assertEqual(stored["timestamp"], "1970-01-01T00:00:00+00:00")  # JS epoch ms -> ISO
+
+    def test_save_appends_only_the_new_tail(self):
+        append_chat_message(self.session, self.execution.id, {"role": "user", "content": "build a todo app"})
+        self.session.commit()
+        first_id = self.session.query(ChatMessage.id).filter(ChatMessage.execution_id == self.execution.id).scalar()
+
+        posted = [{"role": "user", "content": "build a todo app"}, {"role": "archon", "content": "On it"}]
+        self.assertEqual(save_chat_history(self.session, self.execution.id, posted), 1)
+        self.session.commit()
+        ids = self.session.query(ChatMessage.id).filter(ChatMessage.execution_id == self.execution.id).all()
+        self.assertIn((first_id,), ids)  # the stored message was not rewritten
+        self.assertEqual([m["content"] for m in self._stored()], ["build a todo app", "On it"])
+
+        # Resaving the same conversation writes nothing
+        self.assertEqual(save_chat_history(self.session, self.execution.id, posted), 0)
+
+    def test_save_replaces_a_diverged_conversation(self):
+        save_chat_history(self.session, self.execution.id, [{"role": "user", "content": "a"}, {"role": "user", "content": "b"}])
+        self.session.commit()
+        self.assertEqual(save_chat_history(self.session, self.execution.id, [{"role": "user", "content": "c"}]), 1)
+        self.session.commit()
+        self.assertEqual([(m["seq"], m["content"]) for m in self._stored()], [(1, "c")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import checkpoints  # noqa: E402
+
+
+class CheckpointTests(unittest.TestCase):
+    def setUp(self):
+        self.version_dir = Path(tempfile.mkdtemp()) / "v1"
+        self.version_dir.mkdir()
+
+    def _complete(self, *stages):
+        for stage in stages:
+            for artifact in checkpoints.STAGE_ARTIFACTS[stage]:
+                (self.version_dir / artifact).write_text("{}", encoding="utf-8")
+            checkpoints.record_checkpoint(self.version_dir, stage, "done", checkpoints.STAGE_ARTIFACTS[stage])
+
+    def test_resume_starts_at_first_incomplete_stage(self):
+        self._complete("pm", "planner", "design")
+        checkpoints.record_checkpoint(self.version_dir, "engineer", "failed", error="timeout")
+
+        self.assertEqual(checkpoints.resumable_stages(self.version_dir), ["pm", "planner", "design"])
+
+    def test_done_stage_after_incomplete_one_is_not_skipped(self):
+        # governance "done" is stale if engineer has to run again
+        self._complete("pm", "planner", "design", "governance")
+        self.assertEqual(checkpoints.resumable_stages(self.version_dir), ["pm", "planner", "design"])
+
+    def test_missing_artifact_invalidates_checkpoint(self):
+        self._complete("pm", "planner")
+        (self.version_dir / "last_plan.json").unlink()
+        self.assertEqual(checkpoints.resumable_stages(self.version_dir), ["pm"])
+
+    def test_rerun_invalidates_stage_and_downstream(self):
+        self._complete("pm", "planner", "design", "engineer", "governance")
+
+        self.assertEqual(checkpoints.downstream_stages("planner"), ["planner", "engineer", "governance"])
+        checkpoints.invalidate_checkpoints(self.version_dir, checkpoints.downstream_stages("engineer"))
+        self.assertEqual(checkpoints.resumable_stages(self.version_dir), ["pm", "planner", "design"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from sqlalchemy import text  # noqa: E402
+
+import models  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+migrate()
+
+
+class DatabaseEngineTests(unittest.TestCase):
+    def test_sqlite_pragmas(self):
+        if not models._is_file_sqlite(models.DATABASE_URL):
+            self.skipTest("pragmas apply to file-backed SQLite only")
+        with models.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar().lower(), "wal")
+            self.assertEqual(conn.execute(text("PRAGMA synchronous")).scalar(), 1)  # NORMAL
+            self.assertEqual(conn.execute(text("PRAGMA busy_timeout")).scalar(), models.SQLITE_BUSY_TIMEOUT_MS)
+
+    def test_engine_options(self):
+        options = models._engine_options("sqlite:////tmp/app.db")
+        self.assertEqual(options["pool_size"], models.DB_POOL_SIZE)
+        self.assertFalse(options["connect_args"]["check_same_thread"])
+        # In-memory SQLite keeps SQLAlchemy's single-connection pool
+        self.assertNotIn("pool_size", models._engine_options("sqlite://"))
+        self.assertTrue(models._engine_options("postgresql://db/app")["pool_pre_ping"])
+
+    def test_request_session_is_per_thread(self):
+        main = models.request_session()
+        self.assertIs(models.request_session(), main)
+        other = []
+        t = threading.Thread(target=lambda: (other.append(models.request_session()), models.request_session.remove()))
+        t.start()
+        t.join()
+        self.assertIsNot(other[0], main)
+        models.request_session.remove()
+        self.assertIsNot(models.request_session(), main)
+        models.request_session.remove()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from event_stream import EventBroker, format_sse  # noqa: E402
+
+
+class EventBrokerTests(unittest.TestCase):
+    def test_replay_after_last_event_id(self):
+        broker = EventBroker()
+        for i in range(3):
+            broker.publish(7, "log", {"message": f"line {i}"})
+        broker.publish(8, "log", {"message": "other project"})
+
+        cursor = broker.parse_event_id(broker.event_id(1))
+        self.assertEqual([data["message"] for _, _, data in broker.replay(7, cursor)], ["line 1", "line 2"])
+        self.assertEqual(broker.replay(7, 3), [])
+
+    def test_stale_or_overflowed_cursor_needs_snapshot(self):
+        broker = EventBroker(max_buffered=2)
+        for i in range(5):
+            broker.publish(1, "log", {"i": i})
+
+        self.assertIsNone(broker.replay(1, 1))  # events 2 and 3 are gone
+        self.assertEqual(len(broker.replay(1, 3)), 2)
+        # Ids from a previous process (different epoch) are not trusted
+        self.assertIsNone(broker.parse_event_id("0-3"))
+        self.assertIsNone(broker.parse_event_id("garbage"))
+
+    def test_wait_wakes_on_publish(self):
+        broker = EventBroker()
+        threading.Timer(0.05, lambda: broker.publish(3, "stage", {"stage": "pm", "status": "running"})).start()
+
+        events = broker.wait(3, 0, timeout=5)
+        self.assertEqual(events, [(1, "stage", {"stage": "pm", "status": "running"})])
+        self.assertEqual(broker.wait(3, 1, timeout=0.01), [])
+
+    def test_discarded_channel_resyncs_old_cursors(self):
+        broker = EventBroker()
+        broker.publish(5, "log", {"i": 1})
+        cursor = broker.last_seq(5)
+        self.assertTrue(broker.discard(5))
+
+        self.assertIsNone(broker.replay(5, cursor - 1))
+        seq = broker.publish(5, "log", {"i": 2})
+        self.assertGreater(seq, cursor)  # ids are never reused
+        self.assertEqual(broker.replay(5, cursor), [(seq, "log", {"i": 2})])
+
+    def test_format_sse(self):
+        self.assertEqual(format_sse("a-1", "log", {"m": "hi"}), 'id: a-1\nevent: log\ndata: {"m": "hi"}\n\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
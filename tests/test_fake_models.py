@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import sys
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from google.genai.errors import ClientError  # noqa: E402
+
+from agents.pm_agent import ClassifyResult  # noqa: E402
+from schemas.engineering_schema import EngineeringResult  # noqa: E402
+from schemas.plan_schema import Plan  # noqa: E402
+from schemas.prd_schema import PRD  # noqa: E402
+from utils.fake_models import (  # noqa: E402
+    FakeAnthropic,
+    FakeGenaiClient,
+    FakeProfile,
+    _Simulator,
+)
+
+
+def _sim(**kwargs) -> _Simulator:
+    return _Simulator(FakeProfile(**kwargs), seed=1)
+
+
+class FakeModelTests(unittest.TestCase):
+    def test_structured_responses_are_schema_valid(self):
+        client = FakeGenaiClient(_sim())
+        for schema in (ClassifyResult, PRD, Plan, EngineeringResult):
+            response = client.models.generate_content(
+                model="gemini-2.5-flash",
+                contents="Client requirements:\n\nA bakery site",
+                config={"response_schema": schema},
+            )
+            self.assertIsInstance(response.parsed, schema)
+            self.assertGreater(response.usage_metadata.candidates_token_count, 0)
+
+    def test_design_requests_and_images(self):
+        client = FakeGenaiClient(_sim())
+        requests = json.loads(client.models.generate_content(model="m", contents="PRD", config={}).text)
+        self.assertTrue(all({"key", "prompt"} <= set(r) for r in requests))
+        images = client.models.generate_images(model="imagen", prompt="hero 1").generated_images
+        self.assertTrue(images[0].image.image_bytes.startswith(b"\x89PNG"))
+
+    def test_injected_rate_limit_is_a_retryable_429(self):
+        client = FakeGenaiClient(_sim(rate_limit_rate=1.0))
+        with self.assertRaises(ClientError) as ctx:
+            client.models.generate_content(model="m", contents="x", config={})
+        self.assertIn("RESOURCE_EXHAUSTED", str(ctx.exception))
+        self.assertIn("retry in", str(ctx.exception))
+
+    def test_latency_follows_profile(self):
+        sim = _sim(latency={"text": (2.0, 4.0)})
+        draws = sorted(sim.latency("text") for _ in range(2000))
+        self.assertAlmostEqual(draws[1000], 2.0, delta=0.2)
+        self.assertAlmostEqual(draws[1900], 4.0, delta=0.5)
+        self.assertEqual(sim.latency("image"), 0.0)
+
+    def test_claude_stream(self):
+        client = FakeAnthropic(simulator=_sim())
+        with client.messages.stream(model="claude", max_tokens=10, messages=[{"role": "user", "content": "x"}]) as s:
+            raw = "".join(s.text_stream)
+            usage = s.get_final_message().usage
+        self.assertTrue(EngineeringResult.model_validate_json(raw).files)
+        self.assertGreater(usage.output_tokens, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
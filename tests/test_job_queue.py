@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from models import Execution, PipelineJob, Project, User, get_session  # noqa: E402
+import job_queue  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+migrate()
+
+
+def _make_execution(session, owner_id=None) -> Execution:
+    project = Project(name="Queue Test", status="in_progress", owner_id=owner_id)
+    session.add(project)
+    session.commit()
+    execution = Execution(project_id=project.id, status="pending", version=1)
+    session.add(execution)
+    session.commit()
+    return execution
+
+
+def _clear_queue() -> None:
+    session = get_session()
+    try:
+        session.query(PipelineJob).filter(
+            PipelineJob.status.in_(job_queue.ACTIVE_JOB_STATUSES)
+        ).update({"status": job_queue.JOB_DONE}, synchronize_session=False)
+        # Start every test with an empty fair-share window
+        session.query(PipelineJob).update({"claimed_at": None}, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+
+class JobQueueTests(unittest.TestCase):
+    def setUp(self):
+        _clear_queue()
+
+    def _enqueue(self, payload=None, priority=job_queue.PRIORITY_INTERACTIVE, owner_id=None) -> tuple[int, int]:
+        session = get_session()
+        try:
+            execution = _make_execution(session, owner_id)
+            job = job_queue.enqueue_job(
+                session, execution, payload or {"task_description": "x"}, priority=priority, owner_id=owner_id
+            )
+            session.commit()
+            return job.id, execution.id
+        finally:
+            session.close()
+
+    def test_claims_in_fifo_order_and_only_once(self):
+        first, _ = self._enqueue()
+        second, _ = self._enqueue()
+
+        a = job_queue.claim_next_job("w-a")
+        b = job_queue.claim_next_job("w-b")
+        self.assertEqual((a.id, b.id), (first, second))
+        self.assertEqual(a.attempts, 1)
+        self.assertIsNone(job_queue.claim_next_job("w-c"))
+
+    def _make_user(self) -> int:
+        session = get_session()
+        try:
+            user = User(email=f"{uuid.uuid4().hex}@example.com")
+            session.add(user)
+            session.commit()
+            return user.id
+        finally:
+            session.close()
+
+    def test_batch_lane_gets_its_weighted_share(self):
+        batch = {self._enqueue(priority=job_queue.PRIORITY_BATCH)[0] for _ in range(3)}
+        for _ in range(6):
+            self._enqueue()
+
+        claimed = [job_queue.claim_next_job("w").id for _ in range(5)]
+        # 4 interactive claims per batch claim, and batch is never starved
+        self.assertEqual([job_id in batch for job_id in claimed], [False] * 4 + [True])
+
+    def test_tenant_fair_share_and_running_cap(self):
+        alice, bob = self._make_user(), self._make_user()
+        a1, _ = self._enqueue(owner_id=alice)
+        a2, _ = self._enqueue(owner_id=alice)
+        a3, _ = self._enqueue(owner_id=alice)
+        b1, _ = self._enqueue(owner_id=bob)
+
+        with mock.patch.dict(os.environ, {"PIPELINE_MAX_RUNNING_PER_USER": "2"}):
+            claimed = [job_queue.claim_next_job("w") for _ in range(4)]
+
+        # Bob's job jumps ahead of Alice's backlog; Alice's third waits for a free slot
+        self.assertEqual([job.id for job in claimed[:3]], [a1, b1, a2])
+        self.assertIsNone(claimed[3])
+
+    def test_admission_and_queue_position(self):
+        first, _ = self._enqueue(priority=job_queue.PRIORITY_BATCH)
+        urgent, _ = self._enqueue()
+
+        session = get_session()
+        try:
+            self.assertEqual(job_queue.queue_position(session, session.get(PipelineJob, urgent)), 1)
+            self.assertEqual(job_queue.queue_position(session, session.get(PipelineJob, first)), 2)
+            with mock.patch.dict(os.environ, {"PIPELINE_MAX_QUEUED_BATCH": "1"}):
+                retry_after = job_queue.admission_retry_after(session, None, -1, job_queue.PRIORITY_BATCH)
+                self.assertGreaterEqual(retry_after, 1)
+                self.assertIsNone(job_queue.admission_retry_after(session, None, -1, job_queue.PRIORITY_INTERACTIVE))
+        finally:
+            session.close()
+
+    def _expire_lease(self, job_id: int) -> None:
+        session = get_session()
+        try:
+            job = session.get(PipelineJob, job_id)
+            job.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+            session.commit()
+        finally:
+            session.close()
+
+    def test_live_lease_is_not_reclaimed(self):
+        job_id, _ = self._enqueue()
+        job_queue.claim_next_job("healthy-node", lease=60)
+
+        self.assertEqual(job_queue.reclaim_expired_jobs(max_attempts=3), 0)
+        self.assertEqual(job_queue.heartbeat_jobs({job_id: "healthy-node"}), [])
+
+    def test_expired_lease_is_requeued(self):
+        job_id, execution_id = self._enqueue()
+        job_queue.claim_next_job("dead-worker", lease=60)
+        self._expire_lease(job_id)
+
+        self.assertEqual(job_queue.reclaim_expired_jobs(max_attempts=3), 1)
+
+        session = get_session()
+        try:
+            self.assertEqual(session.get(PipelineJob, job_id).status, job_queue.JOB_QUEUED)
+            self.assertEqual(session.get(Execution, execution_id).status, "pending")
+        finally:
+            session.close()
+
+        # The dead worker's late heartbeat and result are rejected
+        self.assertEqual(job_queue.heartbeat_jobs({job_id: "dead-worker"}), [job_id])
+        self.assertFalse(job_queue.finish_job(job_id, "dead-worker"))
+
+    def test_reclaim_gives_up_after_max_attempts(self):
+        job_id, execution_id = self._enqueue()
+        job_queue.claim_next_job("dead-worker", lease=60)
+        self._expire_lease(job_id)
+
+        self.assertEqual(job_queue.reclaim_expired_jobs(max_attempts=1), 0)
+
+        session = get_session()
+        try:
+            self.assertEqual(session.get(PipelineJob, job_id).status, job_queue.JOB_FAILED)
+            self.assertEqual(session.get(Execution, execution_id).status, "failed")
+        finally:
+            session.close()
+
+    def test_pool_runs_jobs_with_bounded_concurrency(self):
+        job_ids = [self._enqueue()[0] for _ in range(4)]
+        lock = threading.Lock()
+        running = {"now": 0, "peak": 0}
+        done = threading.Semaphore(0)
+
+        def handler(job):
+            with lock:
+                running["now"] += 1
+                running["peak"] = max(running["peak"], running["now"])
+            threading.Event().wait(0.05)
+            with lock:
+                running["now"] -= 1
+            if job.id == job_ids[-1]:
+                raise RuntimeError("boom")
+
+        def tracked(job):
+            try:
+                handler(job)
+            finally:
+                done.release()
+
+        pool = job_queue.PipelineWorkerPool(tracked, size=2, poll_interval=0.05)
+        pool.start()
+        try:
+            for _ in job_ids:
+                self.assertTrue(done.acquire(timeout=5))
+        finally:
+            pool.stop(timeout=5)
+
+        self.assertLessEqual(running["peak"], 2)
+        session = get_session()
+        try:
+            statuses = [session.get(PipelineJob, i).status for i in job_ids]
+        finally:
+            session.close()
+        self.assertEqual(statuses, [job_queue.JOB_DONE] * 3 + [job_queue.JOB_FAILED])
+
+    def _job(self, job_id: int) -> PipelineJob:
+        session = get_session()
+        try:
+            job = session.get(PipelineJob, job_id)
+            session.expunge(job)
+            return job
+        finally:
+            session.close()
+
+    def test_stop_keeps_leases_alive_while_builds_drain(self):
+        job_id, _ = self._enqueue()
+        started = threading.Event()
+        seen = {}
+
+        def handler(job):
+            started.set()
+            threading.Event().wait(2.5)  # outlives the 2s lease: only heartbeats keep it
+            seen["requeued_by_other_node"] = job_queue.reclaim_expired_jobs()
+
+        pool = job_queue.PipelineWorkerPool(handler, size=1, poll_interval=0.05, lease=2)
+        pool.start()
+        self.assertTrue(started.wait(5))
+        pool.stop(timeout=10)
+
+        self.assertEqual(seen["requeued_by_other_node"], 0)
+        self.assertEqual(self._job(job_id).status, job_queue.JOB_DONE)
+
+    def test_stop_releases_builds_still_running_after_timeout(self):
+        job_id, execution_id = self._enqueue()
+        started, release = threading.Event(), threading.Event()
+
+        def handler(job):
+            started.set()
+            release.wait(5)
+            if job_queue.lease_lost(job.id):
+                raise job_queue.LeaseLost()
+
+        pool = job_queue.PipelineWorkerPool(handler, size=1, poll_interval=0.05)
+        pool.start()
+        self.assertTrue(started.wait(5))
+        pool.stop(timeout=0.2)
+
+        job = self._job(job_id)
+        self.assertEqual((job.status, job.attempts), (job_queue.JOB_QUEUED, 0))
+        self.assertTrue(job_queue.lease_lost(job_id))
+        release.set()
+
+    def test_lost_lease_is_flagged_to_the_running_handler(self):
+        job_id, _ = self._enqueue()
+        started = threading.Event()
+        seen = {}
+
+        def handler(job):
+            started.set()
+            for _ in range(50):
+                if job_queue.lease_lost(job.id):
+                    seen["lost"] = True
+                    raise job_queue.LeaseLost()
+                threading.Event().wait(0.1)
+
+        pool = job_queue.PipelineWorkerPool(handler, size=1, poll_interval=0.05, lease=2)
+        pool.start()
+        try:
+            self.assertTrue(started.wait(5))
+            # Another node reclaimed the job after missed heartbeats and now runs it
+            session = get_session()
+            session.query(PipelineJob).filter(PipelineJob.id == job_id).update({"claimed_by": "other-node"})
+            session.commit()
+            session.close()
+        finally:
+            pool.stop(timeout=10)
+
+        self.assertTrue(seen.get("lost"))
+        job = self._job(job_id)
+        # The new owner's claim is left alone
+        self.assertEqual((job.status, job.claimed_by), (job_queue.JOB_CLAIMED, "other-node"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from google.genai import types  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+
+from utils import llm_cache  # noqa: E402
+from utils.llm_cache import LLMCache, cached_generate_content  # noqa: E402
+
+
+class _Answer(BaseModel):
+    answer: str
+
+
+class _OtherAnswer(BaseModel):
+    answer: int
+
+
+class _Response:
+    def __init__(self, text, parsed=None):
+        self.text = text
+        self.parsed = parsed
+
+
+class _Models:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, model, contents, config):
+        self.calls += 1
+        return _Response(self.text, _Answer.model_validate_json(self.text))
+
+
+class _Client:
+    def __init__(self, text='{"answer": "42"}'):
+        self.models = _Models(text)
+
+
+class LLMCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.cache = LLMCache(root=self.root, ttl_seconds=3600, max_bytes=10_000_000)
+        patcher = mock.patch.object(llm_cache, "_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_key_covers_image_bytes_schema_and_sample(self):
+        def parts(data):
+            return [types.Part.from_text(text="score this"), types.Part.from_bytes(data=data, mime_type="image/png")]
+
+        base = LLMCache.key("scorer", "m", parts(b"a"), {"temperature": 0.3})
+        self.assertEqual(base, LLMCache.key("scorer", "m", parts(b"a"), {"temperature": 0.3}))
+        self.assertNotEqual(base, LLMCache.key("scorer", "m", parts(b"b"), {"temperature": 0.3}))
+        self.assertNotEqual(base, LLMCache.key("scorer", "m", parts(b"a"), {"temperature": 0.3}, sample=1))
+        self.assertNotEqual(
+            LLMCache.key("pm", "m", "x", {"response_schema": _Answer}),
+            LLMCache.key("pm", "m", "x", {"response_schema": _OtherAnswer}),
+        )
+
+    def test_hit_replays_parsed_response_and_counts(self):
+        client = _Client()
+        config = {"response_schema": _Answer, "temperature": 0.2}
+        with mock.patch.dict(os.environ, {"LLM_CACHE": "pm"}):
+            first = cached_generate_content(client, "pm", model="m", contents="q", config=config)
+            second = cached_generate_content(client, "pm", model="m", contents="q", config=config)
+
+        self.assertEqual(client.models.calls, 1)
+        self.assertEqual(second.parsed, first.parsed)
+        self.assertEqual(self.cache.stats()["agents"]["pm"], {"hits": 1, "misses": 1})
+
+    def test_per_agent_opt_in_and_opt_out(self):
+        with mock.patch.dict(os.environ, {"LLM_CACHE": "pm,planner", "LLM_CACHE_EXCLUDE": ""}):
+            self.assertTrue(self.cache.enabled_for("pm"))
+            self.assertFalse(self.cache.enabled_for("engineer"))
+        with mock.patch.dict(os.environ, {"LLM_CACHE": "1", "LLM_CACHE_EXCLUDE": "engineer"}):
+            self.assertTrue(self.cache.enabled_for("design"))
+            self.assertFalse(self.cache.enabled_for("engineer"))
+        with mock.patch.dict(os.environ, {"LLM_CACHE": ""}):
+            client = _Client()
+            cached_generate_content(client, "pm", model="m", contents="q", config={})
+            cached_generate_content(client, "pm", model="m", contents="q", config={})
+            self.assertEqual(client.models.calls, 2)
+
+    def test_rejected_response_is_not_stored(self):
+        with mock.patch.dict(os.environ, {"LLM_CACHE": "1"}):
+            client = _Client('{"answer": "not json for the validator"}')
+
+            def reject(text):
+                raise ValueError("bad")
+
+            cached_generate_content(client, "design", model="m", contents="q", config={}, validate=reject)
+            cached_generate_content(client, "design", model="m", contents="q", config={}, validate=reject)
+        self.assertEqual(client.models.calls, 2)
+
+    def test_ttl_expiry(self):
+        key = LLMCache.key("pm", "m", "q")
+        self.cache.put(key, {"text": "old"})
+        self.cache.ttl_seconds = 0.01
+        time.sleep(0.05)
+        self.assertIsNone(self.cache.get(key, "pm"))
+
+    def test_lru_eviction_keeps_recently_used_entries(self):
+        keys = [LLMCache.key("pm", "m", str(i)) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, {"text": "x" * 1000})
+            os.utime(self.cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+        self.cache.get(keys[0], "pm")  # touch the oldest
+
+        self.cache.max_bytes = 2500
+        self.cache.evict()
+
+        self.assertIsNotNone(self.cache.get(keys[0], "pm"))
+        self.assertIsNone(self.cache.get(keys[1], "pm"))
+        self.assertIsNotNone(self.cache.get(keys[2], "pm"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from sqlalchemy import create_engine, inspect, text  # noqa: E402
+
+from migrations import LATEST_VERSION, MIGRATIONS, SchemaOutOfDate, current_version, migrate, verify_schema  # noqa: E402
+
+# A database as the first releases created it, before any column migrations
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR(255) NOT NULL UNIQUE, "
+    "name VARCHAR(255), created_at DATETIME NOT NULL)",
+    "CREATE TABLE projects (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, description TEXT, "
+    "status VARCHAR(50) NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL, owner_id INTEGER)",
+    "CREATE TABLE executions (id INTEGER PRIMARY KEY, project_id INTEGER NOT NULL, status VARCHAR(50) NOT NULL, "
+    "created_at DATETIME NOT NULL, prd_path VARCHAR(500), plan_path VARCHAR(500), request_path VARCHAR(500), "
+    "result_path VARCHAR(500), error_message TEXT, published_slug VARCHAR(100), chat_messages TEXT)",
+]
+
+
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(f"sqlite:///{tempfile.mkdtemp()}/legacy.db")
+        with self.engine.connect() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.execute(text(statement))
+            conn.execute(text(
+                "INSERT INTO projects (id, name, status, created_at, updated_at) "
+                "VALUES (1, 'Legacy', 'running', '2025-01-01', '2025-01-01')"
+            ))
+            conn.execute(
+                text("INSERT INTO executions (id, project_id, status, created_at, chat_messages) "
+                     "VALUES (1, 1, 'running', '2025-01-01 10:00:00', :chat)"),
+                {"chat": json.dumps([{"role": "user", "content": "hello"}, {"role": "archon", "content": "hi"}])},
+            )
+            conn.commit()
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_legacy_database_is_upgraded_to_latest(self):
+        with self.assertRaises(SchemaOutOfDate):
+            verify_schema(self.engine)
+        self.assertEqual(migrate(self.engine), LATEST_VERSION)
+        verify_schema(self.engine)
+
+        columns = {c["name"] for c in inspect(self.engine).get_columns("executions")}
+        self.assertTrue({"version", "is_active_head", "governance_log", "lines_generated"} <= columns)
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT execution_count FROM projects")).scalar(), 1)
+            chat = conn.execute(text("SELECT content FROM chat_messages ORDER BY seq")).scalars().all()
+            self.assertEqual(chat, ["hello", "hi"])
+            # A running execution without a job row can never finish
+            self.assertEqual(conn.execute(text("SELECT status FROM executions")).scalar(), "failed")
+
+    def test_migrations_run_once_and_are_idempotent(self):
+        migrate(self.engine)
+        self.assertEqual(migrate(self.engine), LATEST_VERSION)
+        self.assertEqual(current_version(self.engine), LATEST_VERSION)
+
+        # An interrupted upgrade re-runs its current step: every step must tolerate that
+        with self.engine.connect() as conn:
+            for migration in MIGRATIONS:
+                with self.subTest(migration.__name__):
+                    migration(conn)
+            conn.commit()
+            self.assertEqual(conn.execute(text("SELECT COUNT(*) FROM chat_messages")).scalar(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp())
+
+import app as backend  # noqa: E402
+from checkpoints import completed_stages  # noqa: E402
+from migrations import migrate  # noqa: E402
+from models import Execution, Project, add_execution, get_session  # noqa: E402
+
+migrate()
+
+FAKE_MODELS = {
+    "MODEL_BACKEND": "fake",
+    "FAKE_MODEL_PROFILE": "instant",
+    "FAKE_MODEL_FAILURE_RATE": "0",
+    "FAKE_MODEL_429_RATE": "0",
+}
+
+
+class PipelineRerunTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for patcher in (
+            mock.patch.dict(os.environ, {**FAKE_MODELS, "LLM_CACHE_DIR": self.tmp.name}),
+            mock.patch.object(backend, "PUBLIC_DIR", Path(self.tmp.name) / "generated"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        session = get_session()
+        project = Project(name="Rerun Test", status="in_progress")
+        session.add(project)
+        session.commit()
+        execution = add_execution(session, project, Execution(
+            project_id=project.id, version=1, status="pending",
+            prompt_history=json.dumps([{"role": "user", "content": "A bakery site"}]),
+        ))
+        session.commit()
+        self.project_id, self.execution_id = project.id, execution.id
+        session.close()
+
+    def _statuses(self) -> tuple[str, str]:
+        session = get_session()
+        try:
+            execution = session.get(Execution, self.execution_id)
+            return execution.status, execution.project.status
+        finally:
+            session.close()
+
+    def test_governance_rerun_marks_the_execution_successful(self):
+        backend.run_full_pipeline_async("A bakery site", project_id=self.project_id, execution_id=self.execution_id)
+        self.assertEqual(self._statuses(), ("success", "completed"))
+
+        with mock.patch.object(backend, "submit_pipeline_job") as submit:
+            response = backend.app.test_client().post(
+                f"/api/executions/{self.execution_id}/rerun", json={"stage": "governance"},
+            )
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertEqual(response.get_json()["rerun_stages"], ["governance"])
+
+        # What the worker runs for the queued job: pm through engineer are skipped
+        backend.run_full_pipeline_async(
+            submit.call_args.args[2], project_id=self.project_id, execution_id=self.execution_id, resume=True,
+        )
+        self.assertEqual(self._statuses(), ("success", "completed"))
+        self.assertTrue(backend.get_project_state(self.project_id)["result_ready"])
+
+    def test_refused_rerun_keeps_the_checkpoints(self):
+        backend.run_full_pipeline_async("A bakery site", project_id=self.project_id, execution_id=self.execution_id)
+        version_dir = backend.get_version_dir(self.project_id, 1)
+        done = completed_stages(version_dir)
+        self.assertIn("engineer", done)
+
+        session = get_session()
+        session.get(Execution, self.execution_id).prompt_history = "[]"
+        session.commit()
+        session.close()
+        client = backend.app.test_client()
+        response = client.post(f"/api/executions/{self.execution_id}/rerun", json={"stage": "engineer"})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(completed_stages(version_dir), done)
+
+        session = get_session()
+        session.get(Execution, self.execution_id).prompt_history = json.dumps([{"role": "user", "content": "A bakery site"}])
+        session.commit()
+        session.close()
+        with mock.patch.object(backend, "submit_pipeline_job", side_effect=RuntimeError("queue unavailable")):
+            response = client.post(f"/api/executions/{self.execution_id}/rerun", json={"stage": "engineer"})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(completed_stages(version_dir), done)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from sqlalchemy import event  # noqa: E402
+
+from models import Execution, Project, add_execution, engine, get_session, set_active_head  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+migrate()
+
+
+class ProjectSummaryTests(unittest.TestCase):
+    def setUp(self):
+        self.session = get_session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def _project_with_versions(self, n: int) -> Project:
+        project = Project(name="Summary Test", status="in_progress")
+        self.session.add(project)
+        self.session.commit()
+        for version in range(1, n + 1):
+            self.session.query(Execution).filter(Execution.project_id == project.id).update({"is_active_head": False})
+            add_execution(self.session, project, Execution(project_id=project.id, version=version, status="success"))
+            self.session.commit()
+        return project
+
+    def test_summary_follows_new_executions_and_restore(self):
+        project = self._project_with_versions(3)
+        latest = self.session.query(Execution).filter(Execution.project_id == project.id, Execution.version == 3).one()
+        summary = project.to_dict()
+        self.assertEqual(summary["execution_count"], 3)
+        self.assertEqual(summary["version_count"], 3)
+        self.assertEqual(summary["latest_execution_id"], latest.id)
+        self.assertEqual(summary["active_head_version"], 3)
+
+        v1 = self.session.query(Execution).filter(Execution.project_id == project.id, Execution.version == 1).one()
+        set_active_head(self.session, v1)
+        self.session.commit()
+        self.assertEqual(project.to_dict()["active_head_version"], 1)
+        heads = self.session.query(Execution).filter(Execution.project_id == project.id, Execution.is_active_head == True).all()  # noqa: E712
+        self.assertEqual([e.version for e in heads], [1])
+
+    def test_listing_is_one_query(self):
+        for _ in range(3):
+            self._project_with_versions(2)
+        self.session.expire_all()
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            listing = [p.to_dict() for p in self.session.query(Project).order_by(Project.updated_at.desc()).all()]
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(all(p["execution_count"] == 2 for p in listing if p["name"] == "Summary Test"))
+
+
+if __name__ == "__main__":
+    unittest.main()
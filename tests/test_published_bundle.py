@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "backend"))
+sys.path.insert(0, str(REPO_ROOT))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp())
+
+import app as backend  # noqa: E402
+from bundles import minify_css, minify_html  # noqa: E402
+from migrations import migrate  # noqa: E402
+from models import Execution, Project, add_execution, get_session  # noqa: E402
+
+migrate()
+
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+  <head>
+    <!-- generated -->
+    <link rel="stylesheet" href="./style.css">
+  </head>
+  <body>
+    <img src="http://localhost:5000/api/assets/{pid}/1/hero.png" alt="Hero">
+    <pre>  keep   me  </pre>
+    <script src="./app.js"></script>
+  </body>
+</html>
+"""
+
+
+class MinifierTests(unittest.TestCase):
+    def test_css_keeps_strings_and_drops_comments(self):
+        css = '/* theme */\nbody {\n  font-family: "Open  Sans", serif;\n  color: red;\n}\n'
+        self.assertEqual(minify_css(css), 'body{font-family:"Open  Sans",serif;color:red}')
+
+    def test_html_keeps_pre_and_word_spacing(self):
+        html = "<p>\n  Hello <b>big</b>\n  world\n</p>\n<!-- note -->\n<pre>  a\n    b</pre>"
+        self.assertEqual(minify_html(html), "<p>\nHello <b>big</b>\nworld\n</p>\n<pre>  a\n    b</pre>")
+
+
+class PublishedBundleTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        root = Path(self.tmp.name)
+        for name, value in (("PUBLIC_DIR", root / "generated"), ("REPO_ROOT", root)):
+            patcher = mock.patch.object(backend, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        session = get_session()
+        project = Project(name="Bundle Test", status="completed")
+        session.add(project)
+        session.commit()
+        add_execution(session, project, Execution(project_id=project.id, version=1, status="completed"))
+        session.commit()
+        self.project_id = project.id
+        session.close()
+
+        version_dir = backend.get_version_dir(self.project_id, 1)
+        (version_dir / "code" / "src").mkdir(parents=True)
+        (version_dir / "code" / "src" / "index.html").write_text(INDEX_HTML.format(pid=self.project_id))
+        (version_dir / "code" / "src" / "style.css").write_text(
+            f".hero {{\n  background: url(/api/assets/{self.project_id}/1/hero.png);\n}}\n"
+        )
+        (version_dir / "code" / "src" / "app.js").write_text("function go() {\n    return 1;\n}\n")
+        (version_dir / "assets").mkdir()
+        (version_dir / "assets" / "hero.png").write_bytes(b"\x89PNG fake")
+        (version_dir / "last_execution_result.json").write_text(json.dumps({"outputs": {"files_generated": 3}}))
+        self.client = backend.app.test_client()
+
+    def test_publish_builds_a_fingerprinted_precompressed_bundle(self):
+        slug = self.client.post(f"/api/projects/{self.project_id}/versions/1/publish").get_json()["slug"]
+        bundle = json.loads((backend.REPO_ROOT / "published" / slug / backend.PUBLISHED_MANIFEST).read_text())
+        paths = sorted(bundle["files"])
+        self.assertEqual(paths[0].split(".")[0], "assets/hero")
+        self.assertEqual(paths[1], "index.html")
+        self.assertRegex(paths[2], r"^static/app\.[0-9a-f]{12}\.js$")
+        self.assertRegex(paths[3], r"^static/style\.[0-9a-f]{12}\.css$")
+
+        page = self.client.get(f"/published/{slug}", headers={"Accept-Encoding": "identity"})
+        html = page.get_data(as_text=True)
+        self.assertEqual(page.headers["Cache-Control"], backend.PUBLISHED_PAGE_CACHE)
+        self.assertNotIn("/api/assets/", html)
+        self.assertNotIn("generated", html)
+        self.assertIn(f'href="/published/{slug}/{paths[3]}"', html)
+        self.assertIn(f'src="/published/{slug}/{paths[0]}"', html)
+        self.assertIn("<pre>  keep   me  </pre>", html)
+
+        css = self.client.get(f"/published/{slug}/{paths[3]}", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(css.headers["Content-Encoding"], "gzip")
+        self.assertIn("immutable", css.headers["Cache-Control"])
+        etag = bundle["files"][paths[3]]["etag"]
+        self.assertEqual(
+            self.client.get(f"/published/{slug}/{paths[3]}", headers={"If-None-Match": f'"{etag}"'}).status_code,
+            304,
+        )
+        self.assertEqual(self.client.get(f"/published/{slug}/src/style.css").status_code, 404)
+
+    def test_site_published_before_bundles_is_rebuilt_on_first_visit(self):
+        session = get_session()
+        execution = session.query(Execution).filter(Execution.project_id == self.project_id).one()
+        execution.published_slug = "legacy-v1-abcd"
+        session.commit()
+        session.close()
+        legacy_dir = backend.REPO_ROOT / "published" / "legacy-v1-abcd" / "src"
+        legacy_dir.mkdir(parents=True)
+        (legacy_dir / "index.html").write_text("<p>raw copy</p>")
+
+        page = self.client.get("/published/legacy-v1-abcd", headers={"Accept-Encoding": "identity"})
+        self.assertEqual(page.status_code, 200)
+        self.assertIn("/published/legacy-v1-abcd/static/style.", page.get_data(as_text=True))
+        self.assertFalse(legacy_dir.exists())
+
+    def test_concurrent_first_visits_rebuild_a_legacy_site_once(self):
+        session = get_session()
+        execution = session.query(Execution).filter(Execution.project_id == self.project_id).one()
+        execution.published_slug = "legacy-v1-race"
+        session.commit()
+        session.close()
+        legacy_dir = backend.REPO_ROOT / "published" / "legacy-v1-race" / "src"
+        legacy_dir.mkdir(parents=True)
+        (legacy_dir / "index.html").write_text("<p>raw copy</p>")
+
+        builds = []
+        build = backend.build_published_bundle
+
+        def slow_build(*args):
+            builds.append(args)
+            time.sleep(0.2)  # keep every visitor inside the rebuild window
+            return build(*args)
+
+        statuses = []
+        start = threading.Barrier(4)
+
+        def visit():
+            start.wait()
+            response = backend.app.test_client().get("/published/legacy-v1-race")
+            statuses.append(response.status_code)
+
+        with mock.patch.object(backend, "build_published_bundle", slow_build):
+            threads = [threading.Thread(target=visit) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(statuses, [200] * 4)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual([p.name for p in (backend.REPO_ROOT / "published").iterdir()], ["legacy-v1-race"])
+
+
+if __name__ == "__main__":
+    unittest.main()
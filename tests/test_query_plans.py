@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+from sqlalchemy import func  # noqa: E402
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+
+from models import DATABASE_URL, Execution, Project, get_session  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+migrate()
+
+
+class ExecutionQueryPlanTests(unittest.TestCase):
+    """The hot executions queries must use an index, never a full table scan."""
+
+    def setUp(self):
+        if not DATABASE_URL.startswith("sqlite"):
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite syntax")
+        self.session = get_session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def _plan(self, query) -> list[str]:
+        compiled = query.statement.compile(dialect=self.session.bind.dialect)
+        conn = self.session.connection()
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        return [row[-1] for row in rows]
+
+    def assertNoScan(self, query):
+        plan = self._plan(query)
+        scans = [step for step in plan if step.startswith("SCAN executions") and "USING" not in step]
+        self.assertFalse(scans, f"full scan of executions: {plan}")
+
+    def test_hot_queries_use_indexes(self):
+        s = self.session
+        queries = {
+            "active head": s.query(Execution).filter(Execution.project_id == 1, Execution.is_active_head == True),  # noqa: E712
+            "by version": s.query(Execution).filter(Execution.project_id == 1, Execution.version == 2),
+            "next version": s.query(func.max(Execution.version)).filter(Execution.project_id == 1),
+            "version list": s.query(Execution).filter(Execution.project_id == 1).order_by(Execution.version.desc()),
+            "running": s.query(Execution).filter(Execution.project_id == 1, Execution.status == "running"),
+            "avg duration": s.query(func.avg(Execution.duration_seconds)).filter(Execution.status == "success"),
+            "today": s.query(func.count(Execution.id)).filter(Execution.created_at >= datetime(2026, 1, 1)),
+            "dashboard scores": s.query(func.avg(Execution.prompt_quality_score), func.count(Execution.build_confidence_score))
+            .join(Project).filter(Project.owner_id == 1),
+            "activity": s.query(Execution, Project.name)
+            .outerjoin(Project, Project.id == Execution.project_id)
+            .order_by(Execution.created_at.desc()).limit(6),
+        }
+        for name, query in queries.items():
+            with self.subTest(name):
+                self.assertNoScan(query)
+
+    def test_version_is_unique_per_project(self):
+        project = Project(name="Unique Versions", status="in_progress")
+        self.session.add(project)
+        self.session.commit()
+        self.session.add(Execution(project_id=project.id, version=1, status="success"))
+        self.session.commit()
+        self.session.add(Execution(project_id=project.id, version=1, status="pending"))
+        with self.assertRaises(IntegrityError):
+            self.session.commit()
+        self.session.rollback()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from google.genai.errors import ClientError  # noqa: E402
+
+from utils import genai_retry, rate_limiter  # noqa: E402
+from utils.rate_limiter import (  # noqa: E402
+    MemoryBucketStore,
+    RateLimit,
+    RateLimiter,
+    SQLiteBucketStore,
+    estimate_tokens,
+    rate_limited,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_requests_per_minute_budget(self):
+        store = MemoryBucketStore()
+        limit = RateLimit(rpm=3)
+        self.assertEqual([store.take("gemini:m", limit, 0) for _ in range(3)], [0.0, 0.0, 0.0])
+        wait = store.take("gemini:m", limit, 0)
+        # one request refills every 20s
+        self.assertGreater(wait, 19)
+        self.assertLessEqual(wait, 20)
+
+    def test_tokens_per_minute_budget_and_settle(self):
+        limiter = RateLimiter(MemoryBucketStore(), {"gemini:*": RateLimit(tpm=1000)})
+        reservation = limiter.acquire("gemini", "gemini-2.5-flash", tokens=900)
+        self.assertGreater(limiter.store.take("gemini:gemini-2.5-flash", RateLimit(tpm=1000), 500), 0)
+
+        # The call used far fewer tokens than estimated: the difference is refunded
+        reservation.settle(100)
+        self.assertEqual(limiter.store.take("gemini:gemini-2.5-flash", RateLimit(tpm=1000), 500), 0.0)
+
+    def test_backoff_holds_every_caller(self):
+        limiter = RateLimiter(MemoryBucketStore(), {"imagen:*": RateLimit(rpm=100)})
+        limiter.backoff("imagen", "imagen-4", 30)
+        wait = limiter.store.take("imagen:imagen-4", RateLimit(rpm=100), 0)
+        self.assertGreater(wait, 29)
+
+    def test_unconfigured_model_is_not_limited(self):
+        limiter = RateLimiter(MemoryBucketStore(), {})
+        for _ in range(100):
+            limiter.acquire("other", "m")
+        self.assertEqual(limiter.seconds_waited, 0.0)
+
+    def test_sqlite_store_is_shared_between_limiters(self):
+        path = str(Path(tempfile.mkdtemp()) / "buckets.db")
+        limit = RateLimit(rpm=2)
+        a = SQLiteBucketStore(path)
+        b = SQLiteBucketStore(path)
+        self.assertEqual(a.take("anthropic:m", limit, 0), 0.0)
+        self.assertEqual(b.take("anthropic:m", limit, 0), 0.0)
+        self.assertGreater(a.take("anthropic:m", limit, 0), 0)
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("x" * 400), 100)
+        self.assertEqual(estimate_tokens([{"type": "image", "source": {}}, "x" * 40]), 258 + 10)
+
+    def test_retry_after_429_waits_for_the_bucket_not_a_fixed_sleep(self):
+        clock = FakeClock()
+        limiter = RateLimiter(MemoryBucketStore(), {"gemini:*": RateLimit(rpm=1000)})
+        attempts = []
+
+        def call():
+            attempts.append(clock.now)
+            if len(attempts) == 1:
+                raise ClientError(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}})
+            return "ok"
+
+        with mock.patch.object(rate_limiter, "time", clock), \
+                mock.patch.object(rate_limiter, "_limiter", limiter), \
+                mock.patch("time.sleep", side_effect=AssertionError("call_with_retry slept")), \
+                mock.patch.object(rate_limiter, "record_call"):
+            result = genai_retry.call_with_retry(lambda: rate_limited("gemini", "gemini-2.5-flash", call))
+
+        self.assertEqual(result, "ok")
+        # No retryDelay in the error: the bucket's default block, then straight on
+        self.assertAlmostEqual(attempts[1] - attempts[0], 10.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
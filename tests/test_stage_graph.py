@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from utils.stage_graph import Stage, StageGraph  # noqa: E402
+
+
+class StageGraphTests(unittest.TestCase):
+    def test_independent_stages_overlap(self):
+        # planner and design both wait for each other; only passes if they run concurrently
+        barrier = threading.Barrier(2, timeout=5)
+        order = []
+
+        def record(name):
+            def fn():
+                if name in ("planner", "design"):
+                    barrier.wait()
+                order.append(name)
+                return name
+            return fn
+
+        graph = StageGraph([
+            Stage("pm", record("pm")),
+            Stage("planner", record("planner"), depends_on=("pm",)),
+            Stage("design", record("design"), depends_on=("pm",)),
+            Stage("engineer", record("engineer"), depends_on=("planner", "design")),
+        ])
+        results = graph.run()
+
+        self.assertEqual(order[0], "pm")
+        self.assertEqual(order[-1], "engineer")
+        self.assertEqual(results["engineer"], "engineer")
+
+    def test_required_failure_stops_dependents(self):
+        ran = []
+
+        def boom():
+            raise RuntimeError("planner broke")
+
+        graph = StageGraph([
+            Stage("planner", boom),
+            Stage("engineer", lambda: ran.append("engineer"), depends_on=("planner",)),
+        ])
+        with self.assertRaisesRegex(RuntimeError, "planner broke"):
+            graph.run()
+        self.assertEqual(ran, [])
+
+    def test_optional_failure_lets_dependents_run(self):
+        def boom():
+            raise RuntimeError("no images")
+
+        finished = {}
+        graph = StageGraph([
+            Stage("design", boom, required=False),
+            Stage("engineer", lambda: "built", depends_on=("design",)),
+        ])
+        results = graph.run(on_finish=lambda name, err: finished.__setitem__(name, err is None))
+
+        self.assertIsNone(results["design"])
+        self.assertEqual(results["engineer"], "built")
+        self.assertEqual(finished, {"design": False, "engineer": True})
+
+    def test_skipped_stages_count_as_finished(self):
+        ran = []
+        graph = StageGraph([
+            Stage("pm", lambda: ran.append("pm")),
+            Stage("planner", lambda: ran.append("planner"), depends_on=("pm",)),
+        ])
+        graph.run(skip=("pm",))
+        self.assertEqual(ran, ["planner"])
+
+    def test_rejects_invalid_graphs(self):
+        with self.assertRaises(ValueError):
+            StageGraph([Stage("a", lambda: None, depends_on=("missing",))])
+        with self.assertRaises(ValueError):
+            StageGraph([
+                Stage("a", lambda: None, depends_on=("b",)),
+                Stage("b", lambda: None, depends_on=("a",)),
+            ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import sys
+import unittest
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from utils.metrics import Counter, Histogram, Registry  # noqa: E402
+from utils.stage_graph import Stage, StageGraph  # noqa: E402
+from utils.tracing import begin_trace, end_trace, span  # noqa: E402
+
+
+class TracingTests(unittest.TestCase):
+    def test_spans_nest_across_stage_threads(self):
+        calls = Histogram("calls_seconds", "test", ["stage", "model", "outcome"])
+
+        def stage(name):
+            def fn():
+                with span(f"stage.{name}", stage=name):
+                    with span("model_call", metric=calls, model="m"):
+                        pass
+            return fn
+
+        trace = begin_trace(execution_id=1)
+        StageGraph([Stage("pm", stage("pm")), Stage("planner", stage("planner"), depends_on=("pm",))]).run()
+        data = end_trace(trace)
+
+        by_name = {}
+        for s in data["spans"]:
+            by_name.setdefault(s["name"], []).append(s)
+        self.assertEqual(data["execution_id"], 1)
+        self.assertEqual(len(by_name["model_call"]), 2)
+        stage_ids = {s["id"]: s["stage"] for s in by_name["stage.pm"] + by_name["stage.planner"]}
+        for call in by_name["model_call"]:
+            # Parent and stage label carry over into the StageGraph worker thread
+            self.assertEqual(stage_ids[call["parent"]], call["stage"])
+        rendered = "\n".join(calls.render())
+        self.assertIn('calls_seconds_count{stage="planner",model="m",outcome="ok"} 1', rendered)
+
+    def test_error_outcome_and_no_trace_outside_pipeline(self):
+        h = Histogram("x_seconds", "test", ["outcome"])
+        with self.assertRaises(ValueError):
+            with span("boom", metric=h):
+                raise ValueError("x")
+        with span("annotated", metric=h) as attrs:
+            attrs["outcome"] = "rate_limited"
+        rendered = "\n".join(h.render())
+        self.assertIn('x_seconds_count{outcome="error"} 1', rendered)
+        self.assertIn('x_seconds_count{outcome="rate_limited"} 1', rendered)
+
+    def test_prometheus_rendering(self):
+        registry = Registry()
+        builds = registry.register(Counter("builds_total", "Builds.", ["outcome"]))
+        latency = registry.register(Histogram("lat_seconds", "Latency.", buckets=(1, 5)))
+        builds.inc(outcome='a"b')
+        latency.observe(0.5)
+        latency.observe(3)
+
+        text = registry.render()
+        self.assertIn("# TYPE builds_total counter", text)
+        self.assertIn('builds_total{outcome="a\\"b"} 1', text)
+        self.assertIn('lat_seconds_bucket{le="1"} 1', text)
+        self.assertIn('lat_seconds_bucket{le="5"} 2', text)
+        self.assertIn('lat_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("lat_seconds_sum 3.5", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
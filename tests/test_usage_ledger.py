@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import contextvars
+import os
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from utils.tracing import span  # noqa: E402
+from utils.usage_ledger import (  # noqa: E402
+    TokenUsage,
+    begin_ledger,
+    cost_usd,
+    credits_for,
+    end_ledger,
+    record_call,
+    retry_scope,
+)
+
+
+class UsageLedgerTests(unittest.TestCase):
+    def test_cost_uses_model_then_family_prices(self):
+        self.assertAlmostEqual(cost_usd("gemini-2.5-flash", TokenUsage(1_000_000, 1_000_000)), 2.80)
+        self.assertAlmostEqual(cost_usd("claude-opus-4-6", TokenUsage(1_000_000, 0)), 5.00)
+        self.assertAlmostEqual(cost_usd("imagen-4.0-ultra-generate-001", TokenUsage(images=2)), 0.12)
+        self.assertAlmostEqual(cost_usd("gemini-3-preview", TokenUsage(0, 1_000_000)), 2.50)
+
+    def test_price_table_override(self):
+        with mock.patch.dict(os.environ, {"MODEL_PRICES": '{"gemini-2.5-flash": {"input": 1, "output": 1}}'}):
+            self.assertAlmostEqual(cost_usd("gemini-2.5-flash", TokenUsage(500_000, 500_000)), 1.0)
+
+    def test_calls_outside_a_ledger_are_not_recorded(self):
+        self.assertIsNone(record_call("gemini", "gemini-2.5-flash", TokenUsage(10, 10), 0.1))
+
+    def test_records_stage_retry_and_threads(self):
+        ledger = begin_ledger()
+        try:
+            with span("stage.pm", stage="pm"):
+                record_call("gemini", "gemini-2.5-flash", TokenUsage(100, 50), 0.2, agent="pm")
+                with retry_scope(1):
+                    record_call("gemini", "gemini-2.5-flash", None, 0.1, outcome="error", agent="pm")
+            with span("stage.design", stage="design"):
+                ctx = contextvars.copy_context()
+                t = threading.Thread(target=ctx.run, args=(
+                    record_call, "imagen", "imagen-4.0-generate-001", TokenUsage(images=3), 1.0,
+                ))
+                t.start()
+                t.join()
+        finally:
+            records = end_ledger(ledger)
+
+        self.assertEqual([r.stage for r in records], ["pm", "pm", "design"])
+        self.assertEqual([r.retry for r in records], [0, 1, 0])
+        self.assertEqual(records[1].outcome, "error")
+        summary = ledger.summary()
+        self.assertEqual(summary["tokens"], 150)
+        self.assertEqual(summary["images"], 3)
+        self.assertEqual(summary["retries"], 1)
+        self.assertEqual(summary["by_stage"]["pm"]["calls"], 2)
+        self.assertAlmostEqual(summary["by_model"]["imagen-4.0-generate-001"]["cost_usd"], 0.12)
+
+    def test_default_stage_applies_outside_pipeline_stages(self):
+        ledger = begin_ledger(stage="classify_intent")
+        record_call("gemini", "gemini-2.5-flash", TokenUsage(10, 5), 0.1)
+        self.assertEqual(end_ledger(ledger)[0].stage, "classify_intent")
+
+    def test_credits(self):
+        self.assertEqual(credits_for(0, 0), 1)
+        self.assertEqual(credits_for(10_000, 0), 4)
+        self.assertEqual(credits_for(10_000, 2), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
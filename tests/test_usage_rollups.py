@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp())
+
+import app as backend  # noqa: E402
+from models import (  # noqa: E402
+    Execution,
+    Project,
+    UsageRollup,
+    User,
+    add_execution,
+    bump_usage,
+    get_session,
+    record_build_output,
+)
+from migrations import migrate  # noqa: E402
+from scripts.safe_write import WriteRecord  # noqa: E402
+from utils.usage_ledger import UsageRecord  # noqa: E402
+
+migrate()
+
+
+class UsageRollupTests(unittest.TestCase):
+    def setUp(self):
+        self.session = get_session()
+        user = User(email=f"{uuid.uuid4().hex}@example.com")
+        self.session.add(user)
+        self.session.commit()
+        self.owner_id = user.id
+        self.project = Project(name="Rollup Test", status="in_progress", owner_id=user.id)
+        self.session.add(self.project)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def _rollup(self) -> UsageRollup:
+        self.session.expire_all()
+        return self.session.query(UsageRollup).filter(UsageRollup.owner_id == self.owner_id).one()
+
+    def test_counters_accumulate_in_one_row_per_day(self):
+        add_execution(self.session, self.project, Execution(project_id=self.project.id, version=1))
+        bump_usage(self.session, self.owner_id, credits_used=3)
+        bump_usage(self.session, self.owner_id, credits_used=2, pipelines=0)
+        self.session.commit()
+        rollup = self._rollup()
+        self.assertEqual((rollup.pipelines, rollup.credits_used), (1, 5))
+
+    def test_build_output_counts_code_lines_and_rerun_deltas(self):
+        execution = add_execution(self.session, self.project, Execution(project_id=self.project.id, version=1))
+        writes = [
+            WriteRecord(path="/g/1/v1/code/index.html", sha256="a", bytes=100, lines=10),
+            WriteRecord(path="/g/1/v1/code/README.md", sha256="b", bytes=50, lines=5),
+        ]
+        record_build_output(self.session, execution, 12.0, writes)
+        self.session.commit()
+        rollup = self._rollup()
+        self.assertEqual((rollup.builds, rollup.build_seconds), (1, 12.0))
+        self.assertEqual((rollup.lines_generated, rollup.bytes_generated), (10, 150))
+
+        # Re-running the build replaces its numbers instead of adding a second build
+        record_build_output(self.session, execution, 8.0, writes[:1])
+        self.session.commit()
+        rollup = self._rollup()
+        self.assertEqual((rollup.builds, rollup.build_seconds), (1, 8.0))
+        self.assertEqual((rollup.lines_generated, rollup.bytes_generated), (10, 100))
+
+    def test_non_build_calls_are_billed_like_builds(self):
+        # e.g. one small intent classification: under a credit's worth of tokens, still one credit
+        record = UsageRecord(
+            provider="gemini", model="gemini-2.5-flash", stage="classify", agent="pm",
+            input_tokens=120, output_tokens=30, images=0, latency_seconds=0.4, retry=0, outcome="ok", cost_usd=0.0001,
+        )
+        backend.persist_usage(self.session, [record], project_id=self.project.id)
+        self.assertEqual(self._rollup().credits_used, 1)
+        self.assertGreaterEqual(backend.app.test_client().get("/api/credits/balance").get_json()["credits_used"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp())
+
+import app as backend  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+migrate()
+
+
+class VersionManifestTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(backend, "PUBLIC_DIR", Path(self.tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+        version_dir = backend.get_version_dir(7, 1)
+        for rel, content in {
+            "src/index.html": '<html><head><link rel="stylesheet" href="./style.css"></head><body></body></html>',
+            "src/style.css": "body { color: red; }",
+            "src/app.js": "console.log(1);",
+            "src/components/nav.html": "<nav></nav>",
+            "README.md": "# Site",
+        }.items():
+            (version_dir / "code" / rel).parent.mkdir(parents=True, exist_ok=True)
+            (version_dir / "code" / rel).write_text(content)
+        (version_dir / "assets").mkdir()
+        (version_dir / "assets" / "hero.png").write_bytes(b"\x89PNG fake")
+        (version_dir / "last_design_assets.json").write_text(json.dumps({"assets": [{"id": "hero"}]}))
+        (version_dir / "last_execution_result.json").write_text(json.dumps({"outputs": {"files_generated": 5}}))
+
+    def test_legacy_version_gets_a_manifest_from_one_scan(self):
+        manifest = backend.load_version_manifest(7, 1)
+        self.assertEqual(manifest["entry_html"], "src/index.html")
+        self.assertEqual(manifest["stylesheets"], ["src/style.css"])
+        self.assertEqual(manifest["scripts"], ["src/app.js"])
+        self.assertEqual((manifest["files_generated"], manifest["images_generated"]), (5, 1))
+        self.assertEqual([a["path"] for a in manifest["assets"]], ["hero.png"])
+        self.assertTrue((backend.get_version_dir(7, 1) / "manifest.json").exists())
+        cached = backend.load_version_manifest(7, 1)
+        self.assertEqual(cached, manifest)
+        self.assertIs(backend.load_version_manifest(7, 1), cached)  # parsed once per mtime
+
+    def test_unfinished_version_has_no_manifest(self):
+        (backend.get_version_dir(7, 1) / "last_execution_result.json").unlink()
+        self.assertIsNone(backend.load_version_manifest(7, 1))
+
+    def test_manifest_tree_matches_directory_tree(self):
+        code_dir = backend.get_version_dir(7, 1) / "code"
+        manifest = backend.load_version_manifest(7, 1)
+        self.assertEqual(
+            backend.manifest_tree(f["path"] for f in manifest["files"]),
+            backend.build_file_tree(code_dir, code_dir),
+        )
+
+    def test_preview_inlines_stylesheets_from_the_manifest(self):
+        response = backend.app.test_client().get("/api/preview/7/1")
+        html = response.get_data(as_text=True)
+        self.assertIn("<style>body { color: red; }</style>", html)
+        self.assertIn("<script>console.log(1);</script>", html)
+
+    def test_preview_is_precompressed_and_revalidates_with_its_etag(self):
+        client = backend.app.test_client()
+        etag = backend.load_version_manifest(7, 1)["preview"]["etag"]
+
+        response = client.get("/api/preview/7/1", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["ETag"], f'"{etag}"')
+        self.assertIn("<style>", gzip.decompress(response.get_data()).decode())
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+
+        response = client.get(f"/api/preview/7/1?h={etag}", headers={"If-None-Match": f'"{etag}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+
+    def test_download_streams_once_then_sends_the_cached_zip(self):
+        client = backend.app.test_client()
+        first = client.get("/api/projects/7/versions/1/download")
+        self.assertIsNone(first.headers.get("Content-Length"))  # streamed
+        archive = zipfile.ZipFile(io.BytesIO(first.get_data()))
+        infos = {info.filename: info for info in archive.infolist()}
+        self.assertEqual(infos["assets/hero.png"].compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(infos["src/style.css"].compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.read("src/app.js"), b"console.log(1);")
+
+        cached = list((backend.get_version_dir(7, 1) / "download").glob("*.zip"))
+        self.assertEqual(len(cached), 1)
+        second = client.get("/api/projects/7/versions/1/download")
+        self.assertEqual(second.headers["Content-Length"], str(cached[0].stat().st_size))
+        self.assertEqual(second.get_data(), first.get_data())
+
+
+if __name__ == "__main__":
+    unittest.main()
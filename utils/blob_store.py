@@ -0,0 +1,151 @@
+"""
+Content-addressed store for generated files (code, kit CSS, design assets).
+
+Every distinct file content is kept once, as BLOB_STORE_DIR/<sha[:2]>/<sha[2:]>.
+Version and published directories hold hard links to those objects (a
+reflink or, failing both, a plain copy where links are unavailable), so a
+base.css written by a hundred builds, or a page an iteration left unchanged,
+costs one object on disk and no write I/O after the first time.
+
+Objects are never modified in place: every writer replaces the link with
+os.replace, which leaves the shared inode alone. prune() removes objects no
+directory links to any more (e.g. after a project is deleted).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_STORE_DIR = Path(__file__).resolve().parent.parent / "generated" / "objects"
+# Objects younger than this are never pruned: a writer may be about to link them
+PRUNE_GRACE_SECONDS = 3600
+
+_CHUNK = 1024 * 1024
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _clone(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone (FICLONE: btrfs, XFS, bcachefs); False where unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    ficlone = 0x40049409
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), ficlone, s.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+
+def link_or_copy(src, dst) -> None:
+    """Materialize src at dst sharing its storage: hard link, else reflink, else copy."""
+    src, dst = Path(src), Path(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        if not _clone(src, dst):
+            shutil.copy2(src, dst)
+
+
+class BlobStore:
+    def __init__(self, root: Path | None = None):
+        self.root = Path(root or os.getenv("BLOB_STORE_DIR") or DEFAULT_STORE_DIR)
+
+    def path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256[2:]
+
+    def _tmp(self, target: Path) -> Path:
+        return target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+    @staticmethod
+    def _touch(obj: Path) -> bool:
+        """True if the object exists; refreshes its mtime to keep it clear of prune()."""
+        try:
+            os.utime(obj)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put_bytes(self, data: bytes, sha256: str | None = None) -> str:
+        """Store data unless an object with its hash exists; returns the hash."""
+        sha256 = sha256 or hashlib.sha256(data).hexdigest()
+        obj = self.path(sha256)
+        if self._touch(obj):
+            return sha256
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._tmp(obj)
+        tmp.write_bytes(data)
+        os.replace(tmp, obj)
+        return sha256
+
+    def adopt(self, path: Path) -> str:
+        """
+        Move an existing file's content into the store and leave a link in its
+        place (a duplicate is just replaced by a link). Returns the hash.
+        """
+        path = Path(path)
+        sha256 = sha256_file(path)
+        obj = self.path(sha256)
+        if not self._touch(obj):
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._tmp(obj)
+            link_or_copy(path, tmp)
+            os.replace(tmp, obj)
+        self.link(sha256, path)
+        return sha256
+
+    def link(self, sha256: str, target: Path) -> None:
+        """Atomically make target a materialization of the object."""
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._tmp(target)
+        link_or_copy(self.path(sha256), tmp)
+        os.replace(tmp, target)
+
+    def prune(self, grace_seconds: float = PRUNE_GRACE_SECONDS) -> int:
+        """
+        Delete objects that nothing links to (link count 1) and that were not
+        written or reused within grace_seconds. Returns the number removed.
+        Where the filesystem fell back to copies every object looks unlinked;
+        pruning then only costs the next writer a re-store.
+        """
+        if not self.root.exists():
+            return 0
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for obj in self.root.glob("??/*"):
+            try:
+                st = obj.stat()
+                if st.st_nlink == 1 and st.st_mtime < cutoff and not obj.name.startswith("."):
+                    obj.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+_store: BlobStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore()
+        return _store
@@ -0,0 +1,331 @@
+"""
+Record/replay cassettes for model calls.
+
+MODEL_BACKEND=record wraps the real genai client (get_genai_client) and the
+Claude client (EngineerAgent) and writes every request/response pair to
+CASSETTE_DIR. MODEL_BACKEND=replay serves those responses back without
+network access or keys, so orchestration, JSON repair, post-processing and
+eval scoring can be benchmarked against real model output for free.
+
+A cassette is keyed by a SHA-256 of the provider, method, model, request
+contents and config (canonicalised like the LLM cache key; image bytes by
+hash). It holds the interactions in the order they were recorded: the n-th
+identical request in a replay gets the n-th recorded response, and the last
+one once the recording runs out. Provider errors (429s, overloads) are
+recorded and re-raised on replay, so retry paths replay too. A request with
+no cassette raises CassetteMiss.
+
+CASSETTE_REPLAY_LATENCY=1 sleeps for each call's recorded latency on replay
+(any other number scales it, e.g. 0.5); by default replay is instant.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from utils.llm_cache import CachedResponse, _canonical, _parse_cached
+
+DEFAULT_CASSETTE_DIR = Path(__file__).resolve().parent.parent / "cassettes"
+CASSETTE_VERSION = 1
+# Replayed Claude streams are split into this many chunks
+STREAM_CHUNKS = 20
+
+
+class CassetteMiss(RuntimeError):
+    pass
+
+
+def cassette_mode() -> str | None:
+    mode = os.getenv("MODEL_BACKEND", "").strip().lower()
+    return mode if mode in ("record", "replay") else None
+
+
+def request_key(provider: str, method: str, model: str, request: Any) -> str:
+    payload = {
+        "v": CASSETTE_VERSION,
+        "provider": provider,
+        "method": method,
+        "model": model,
+        "request": _canonical(request),
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _replay_latency_scale() -> float:
+    try:
+        return float(os.getenv("CASSETTE_REPLAY_LATENCY", "0") or 0)
+    except ValueError:
+        return 0.0
+
+
+class CassetteStore:
+    def __init__(self, root: Path | None = None):
+        self.root = Path(root or os.getenv("CASSETTE_DIR") or DEFAULT_CASSETTE_DIR)
+        self._lock = threading.Lock()
+        self._played: dict[str, int] = {}
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _read(self, key: str) -> dict | None:
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def append(self, key: str, request: dict, interaction: dict) -> None:
+        path = self._path(key)
+        with self._lock:
+            cassette = self._read(key) or {"request": request, "interactions": []}
+            cassette["interactions"].append({"recorded_at": time.time(), **interaction})
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(cassette, ensure_ascii=False, indent=1), encoding="utf-8")
+            tmp.replace(path)
+
+    def next(self, key: str, request: dict) -> dict:
+        """The next recorded interaction for this request (the last one once they run out)."""
+        cassette = self._read(key)
+        if not cassette or not cassette.get("interactions"):
+            raise CassetteMiss(
+                f"No cassette for {request.get('provider')}/{request.get('method')} "
+                f"{request.get('model')} (key {key[:12]}) in {self.root}. Record it with MODEL_BACKEND=record."
+            )
+        with self._lock:
+            n = self._played.get(key, 0)
+            self._played[key] = n + 1
+        interactions = cassette["interactions"]
+        return interactions[min(n, len(interactions) - 1)]
+
+
+_store: CassetteStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_cassette_store() -> CassetteStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CassetteStore()
+    return _store
+
+
+def _play(store: CassetteStore, key: str, request: dict, raise_error: Callable[[dict], Exception]) -> dict:
+    interaction = store.next(key, request)
+    scale = _replay_latency_scale()
+    if scale > 0:
+        time.sleep(interaction.get("latency", 0) * scale)
+    if "error" in interaction:
+        raise raise_error(interaction["error"])
+    return interaction["response"]
+
+
+# ── genai ───────────────────────────────────────────────────────
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def _encode_genai_error(e: Exception) -> dict | None:
+    code = getattr(e, "code", None)
+    if not isinstance(code, int):
+        return None  # connection errors etc. are not replayed
+    return {"code": code, "details": getattr(e, "details", None) or {"error": {"message": str(e)}}}
+
+
+def _decode_genai_error(error: dict) -> Exception:
+    from google.genai import errors
+
+    cls = errors.ClientError if 400 <= error["code"] < 500 else errors.ServerError
+    return cls(error["code"], error["details"])
+
+
+class _CassetteGenaiModels:
+    def __init__(self, store: CassetteStore, inner=None):
+        self._store = store
+        self._inner = inner  # None when replaying
+
+    def _call(self, method: str, model: str, request: dict, call: Callable[[], Any],
+              encode: Callable[[Any], dict], decode: Callable[[dict], Any]):
+        key = request_key("gemini", method, model, request)
+        meta = {"provider": "gemini", "method": method, "model": model}
+        if self._inner is None:
+            return decode(_play(self._store, key, meta, _decode_genai_error))
+        start = time.perf_counter()
+        try:
+            result = call()
+        except Exception as e:
+            error = _encode_genai_error(e)
+            if error is not None:
+                self._store.append(key, meta, {"latency": time.perf_counter() - start, "error": error})
+            raise
+        self._store.append(key, meta, {"latency": time.perf_counter() - start, "response": encode(result)})
+        return result
+
+    def generate_content(self, model: str, contents: Any, config: Any = None):
+        def encode(response) -> dict:
+            usage = getattr(response, "usage_metadata", None)
+            return {
+                "text": getattr(response, "text", None),
+                "usage": {
+                    f: getattr(usage, f, None) or 0
+                    for f in ("prompt_token_count", "candidates_token_count", "thoughts_token_count")
+                } if usage else None,
+            }
+
+        def decode(value: dict):
+            text = value.get("text")
+            response = CachedResponse(text, _parse_cached(text, config) if text else None)
+            if value.get("usage"):
+                response.usage_metadata = _Obj(**value["usage"])
+            return response
+
+        return self._call(
+            "generate_content", model, {"contents": contents, "config": config},
+            lambda: self._inner.generate_content(model=model, contents=contents, config=config),
+            encode, decode,
+        )
+
+    def generate_images(self, model: str, prompt: str, config: Any = None):
+        def encode(result) -> dict:
+            return {"images": [
+                {"b64": base64.b64encode(g.image.image_bytes).decode("ascii"),
+                 "mime_type": getattr(g.image, "mime_type", None)}
+                for g in (result.generated_images or [])
+            ]}
+
+        def decode(value: dict):
+            return _Obj(generated_images=[
+                _Obj(image=_Obj(image_bytes=base64.b64decode(i["b64"]), mime_type=i.get("mime_type")))
+                for i in value["images"]
+            ])
+
+        return self._call(
+            "generate_images", model, {"prompt": prompt, "config": config},
+            lambda: self._inner.generate_images(model=model, prompt=prompt, config=config),
+            encode, decode,
+        )
+
+
+class CassetteGenaiClient:
+    """Records a genai client's calls (inner given) or replays them (inner None)."""
+
+    def __init__(self, inner=None, store: CassetteStore | None = None):
+        self.models = _CassetteGenaiModels(store or get_cassette_store(), inner.models if inner else None)
+
+
+# ── anthropic ───────────────────────────────────────────────────
+
+def _encode_anthropic_error(e: Exception) -> dict | None:
+    status = getattr(e, "status_code", None)
+    if not isinstance(status, int):
+        return None
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    return {"status_code": status, "message": str(e), "retry_after": headers.get("retry-after")}
+
+
+def _decode_anthropic_error(error: dict) -> Exception:
+    import anthropic
+    import httpx
+
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    headers = {"retry-after": error["retry_after"]} if error.get("retry_after") else None
+    response = httpx.Response(error["status_code"], request=request, headers=headers)
+    if error["status_code"] == 429:
+        return anthropic.RateLimitError(error["message"], response=response, body=None)
+    return anthropic.APIStatusError(error["message"], response=response, body=None)
+
+
+class _RecordingStream:
+    def __init__(self, inner_manager, store: CassetteStore, key: str, meta: dict):
+        self._manager = inner_manager
+        self._store = store
+        self._key = key
+        self._meta = meta
+        self._text = ""
+        self._usage = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._stream = self._manager.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        latency = time.perf_counter() - self._start
+        if exc is None:
+            self._store.append(self._key, self._meta, {
+                "latency": latency, "response": {"text": self._text, "usage": self._usage},
+            })
+        else:
+            error = _encode_anthropic_error(exc)
+            if error is not None:
+                self._store.append(self._key, self._meta, {"latency": latency, "error": error})
+        return self._manager.__exit__(exc_type, exc, tb)
+
+    @property
+    def text_stream(self):
+        for text in self._stream.text_stream:
+            self._text += text
+            yield text
+
+    def get_final_message(self):
+        message = self._stream.get_final_message()
+        usage = getattr(message, "usage", None)
+        if usage:
+            self._usage = {"input_tokens": usage.input_tokens, "output_tokens": usage.output_tokens}
+        return message
+
+
+class _ReplayStream:
+    def __init__(self, response: dict):
+        self._response = response
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        text = self._response.get("text") or ""
+        size = max(1, -(-len(text) // STREAM_CHUNKS))
+        for i in range(0, len(text), size):
+            yield text[i:i + size]
+
+    def get_final_message(self):
+        usage = self._response.get("usage")
+        return _Obj(usage=_Obj(**usage) if usage else None)
+
+
+class _CassetteMessages:
+    def __init__(self, store: CassetteStore, inner=None):
+        self._store = store
+        self._inner = inner
+
+    def stream(self, model: str, max_tokens: int, messages: list, **kwargs):
+        key = request_key("anthropic", "messages.stream", model,
+                          {"max_tokens": max_tokens, "messages": messages, **kwargs})
+        meta = {"provider": "anthropic", "method": "messages.stream", "model": model}
+        if self._inner is None:
+            return _ReplayStream(_play(self._store, key, meta, _decode_anthropic_error))
+        return _RecordingStream(
+            self._inner.stream(model=model, max_tokens=max_tokens, messages=messages, **kwargs),
+            self._store, key, meta,
+        )
+
+
+class CassetteAnthropic:
+    """Records an anthropic.Anthropic client's message streams (inner given) or replays them."""
+
+    def __init__(self, inner=None, store: CassetteStore | None = None):
+        self.messages = _CassetteMessages(store or get_cassette_store(), inner.messages if inner else None)
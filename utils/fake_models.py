@@ -0,0 +1,373 @@
+"""
+Fake model clients for load testing the orchestrator without API keys.
+
+MODEL_BACKEND=fake makes get_genai_client() return FakeGenaiClient and the
+Claude engineer use FakeAnthropic. Every agent still runs its real code path
+(caching, rate limiting, retries, JSON repair, the usage ledger); only the
+network call is simulated. Responses are schema-valid: a PRD for the PM, a
+one-task Plan for the planner, image requests for the design agent, PNGs for
+Imagen and the offline Vite scaffold as the EngineeringResult.
+
+Each call sleeps for a latency drawn from the active profile and may fail
+with an injected 429 or 5xx. Configure with:
+    FAKE_MODEL_PROFILE      instant | realistic | degraded (default realistic),
+                            or a JSON object / path to a JSON file in the
+                            same shape as PROFILES
+    FAKE_MODEL_FAILURE_RATE override the profile's 5xx probability
+    FAKE_MODEL_429_RATE     override the profile's 429 probability
+    FAKE_MODEL_SEED         seed the draws for a reproducible run
+
+Latencies are log-normal, given as a median and a p95 in seconds per call
+kind: "text" (Gemini generate_content), "image" (Imagen, per image) and
+"claude" (the whole Claude stream).
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+PROFILES = {
+    "instant": {
+        "latency": {"text": [0.0, 0.0], "image": [0.0, 0.0], "claude": [0.0, 0.0]},
+        "failure_rate": 0.0,
+        "rate_limit_rate": 0.0,
+    },
+    # Roughly what production builds see on a healthy day
+    "realistic": {
+        "latency": {"text": [6.0, 18.0], "image": [9.0, 20.0], "claude": [60.0, 150.0]},
+        "failure_rate": 0.01,
+        "rate_limit_rate": 0.02,
+    },
+    # Provider under load: slow tails and frequent throttling
+    "degraded": {
+        "latency": {"text": [12.0, 60.0], "image": [15.0, 45.0], "claude": [120.0, 300.0]},
+        "failure_rate": 0.05,
+        "rate_limit_rate": 0.15,
+    },
+}
+
+# Retry delay the injected 429s ask for ("Please retry in Ns")
+RETRY_AFTER_SECONDS = 1
+IMAGE_REQUESTS = 2
+
+
+def fake_models_enabled() -> bool:
+    return os.getenv("MODEL_BACKEND", "").strip().lower() == "fake"
+
+
+@dataclass
+class FakeProfile:
+    latency: dict = field(default_factory=dict)  # kind -> (median, p95) seconds
+    failure_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "FakeProfile":
+        setting = os.getenv("FAKE_MODEL_PROFILE", "realistic").strip()
+        if setting in PROFILES:
+            data = PROFILES[setting]
+        elif setting.startswith("{"):
+            data = json.loads(setting)
+        else:
+            data = json.loads(Path(setting).read_text(encoding="utf-8"))
+        profile = cls(
+            latency={k: tuple(v) for k, v in data.get("latency", {}).items()},
+            failure_rate=float(data.get("failure_rate", 0.0)),
+            rate_limit_rate=float(data.get("rate_limit_rate", 0.0)),
+        )
+        if os.getenv("FAKE_MODEL_FAILURE_RATE"):
+            profile.failure_rate = float(os.environ["FAKE_MODEL_FAILURE_RATE"])
+        if os.getenv("FAKE_MODEL_429_RATE"):
+            profile.rate_limit_rate = float(os.environ["FAKE_MODEL_429_RATE"])
+        return profile
+
+
+class _Simulator:
+    """Shared latency/failure draws for the fake clients."""
+
+    def __init__(self, profile: FakeProfile | None = None, seed: int | None = None):
+        self.profile = profile or FakeProfile.from_env()
+        if seed is None and os.getenv("FAKE_MODEL_SEED"):
+            seed = int(os.environ["FAKE_MODEL_SEED"])
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def latency(self, kind: str) -> float:
+        median, p95 = self.profile.latency.get(kind, (0.0, 0.0))
+        if median <= 0:
+            return 0.0
+        sigma = math.log(max(p95, median) / median) / 1.645
+        with self._lock:
+            return self._rng.lognormvariate(math.log(median), sigma)
+
+    def outcome(self) -> str:
+        """"ok", "rate_limited" or "error" for the next call."""
+        with self._lock:
+            draw = self._rng.random()
+        if draw < self.profile.rate_limit_rate:
+            return "rate_limited"
+        if draw < self.profile.rate_limit_rate + self.profile.failure_rate:
+            return "error"
+        return "ok"
+
+
+_simulator: _Simulator | None = None
+_simulator_lock = threading.Lock()
+
+
+def get_simulator() -> _Simulator:
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                _simulator = _Simulator()
+    return _simulator
+
+
+# ── payloads ────────────────────────────────────────────────────
+
+def _prompt_text(contents: Any) -> str:
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_prompt_text(c) for c in contents)
+    return getattr(contents, "text", None) or ""
+
+
+def _idea(prompt: str) -> str:
+    for marker in ("Client requirements:", "User message:"):
+        if marker in prompt:
+            return prompt.rsplit(marker, 1)[1].strip()[:300] or "Untitled app"
+    return "Untitled app"
+
+
+def _prd(prompt: str) -> dict:
+    idea = _idea(prompt)
+    return {
+        "document_title": idea.split("\n", 1)[0][:60],
+        "version": "0.1",
+        "overview": f"Simulated brief for: {idea}",
+        "goals": ["Ship a responsive MVP"],
+        "non_goals": ["Payments", "Authentication"],
+        "target_users": ["Visitors"],
+        "core_features_mvp": ["Landing page", "Contact form"],
+        "nice_to_have_features": ["Dark mode"],
+        "user_stories": ["As a visitor I can read what the product does"],
+        "acceptance_criteria": ["Page renders without errors"],
+        "technical_stack_recommendation": ["Vite", "React", "TypeScript"],
+        "payments_security_compliance": [],
+        "assumptions": ["Simulated model output (MODEL_BACKEND=fake)"],
+        "open_questions": [],
+        "regenerate_images": True,
+    }
+
+
+def _plan() -> dict:
+    from utils.offline_engineer_scaffold import build_vite_react_ts_scaffold
+
+    files = sorted(build_vite_react_ts_scaffold(app_dir="apps/offline-vite-react").files)
+    return {
+        "milestones": [{
+            "name": "Milestone 1: Scaffold MVP",
+            "tasks": [{
+                "id": "FE-1",
+                "description": "Scaffold the landing page",
+                "depends_on": [],
+                "outputs": ["Vite + React scaffold"],
+                "execution_hint": "engineer",
+                "task_type": "scaffold",
+                "output_files": files,
+                "ui_archetype": "landing",
+            }],
+        }],
+        "assumptions": ["Simulated model output (MODEL_BACKEND=fake)"],
+        "risks": [],
+    }
+
+
+def _engineering_result() -> dict:
+    from utils.offline_engineer_scaffold import build_vite_react_ts_scaffold
+
+    scaffold = build_vite_react_ts_scaffold(app_dir="apps/offline-vite-react")
+    return {
+        "task_id": "FE-1",
+        "summary": "Simulated build: Vite + React + TypeScript scaffold",
+        "files": [{"path": p, "content": c} for p, c in sorted(scaffold.files.items())],
+    }
+
+
+def _image_requests() -> list:
+    return [
+        {"key": f"hero_{i + 1}", "purpose": "hero", "style": "photographic",
+         "prompt": f"Simulated hero image {i + 1}"}
+        for i in range(IMAGE_REQUESTS)
+    ]
+
+
+def fake_payload(schema: Any, prompt: str) -> Any:
+    """JSON-able response for a response_schema (or the design agent's array when there is none)."""
+    name = getattr(schema, "__name__", None)
+    if name == "ClassifyResult":
+        return {"type": "build"}
+    if name == "PRD":
+        return _prd(prompt)
+    if name == "Plan":
+        return _plan()
+    if name == "EngineeringResult":
+        return _engineering_result()
+    if schema is None:
+        return _image_requests()
+    return {}
+
+
+def _png(seed: int) -> bytes:
+    """A valid 1x1 PNG (colour varies with `seed`)."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    pixel = bytes([0, seed * 67 % 256, seed * 131 % 256, seed * 199 % 256])
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(pixel))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# ── genai ───────────────────────────────────────────────────────
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def _genai_error(outcome: str) -> Exception:
+    from google.genai import errors
+
+    if outcome == "rate_limited":
+        return errors.ClientError(429, {"error": {
+            "code": 429, "status": "RESOURCE_EXHAUSTED",
+            "message": f"Simulated quota exhausted. Please retry in {RETRY_AFTER_SECONDS}s.",
+        }})
+    return errors.ServerError(503, {"error": {
+        "code": 503, "status": "UNAVAILABLE", "message": "Simulated model overload.",
+    }})
+
+
+class _FakeGenaiModels:
+    def __init__(self, simulator: _Simulator):
+        self._sim = simulator
+
+    def _simulate(self, kind: str, count: int = 1) -> None:
+        time.sleep(sum(self._sim.latency(kind) for _ in range(count)))
+        outcome = self._sim.outcome()
+        if outcome != "ok":
+            raise _genai_error(outcome)
+
+    def generate_content(self, model: str, contents: Any, config: Any = None):
+        self._simulate("text")
+        schema = config.get("response_schema") if isinstance(config, dict) else None
+        prompt = _prompt_text(contents)
+        payload = fake_payload(schema, prompt)
+        text = json.dumps(payload, ensure_ascii=False)
+        parsed = schema.model_validate(payload) if hasattr(schema, "model_validate") and payload else None
+        return _Obj(
+            text=text,
+            parsed=parsed,
+            usage_metadata=_Obj(
+                prompt_token_count=_tokens(prompt),
+                candidates_token_count=_tokens(text),
+                thoughts_token_count=0,
+            ),
+        )
+
+    def generate_images(self, model: str, prompt: str, config: Any = None):
+        count = getattr(config, "number_of_images", None) or 1
+        self._simulate("image", count)
+        seed = int(re.sub(r"\D", "", prompt) or 0)
+        return _Obj(generated_images=[
+            _Obj(image=_Obj(image_bytes=_png(seed + i), mime_type="image/png")) for i in range(count)
+        ])
+
+
+class FakeGenaiClient:
+    """Stands in for google.genai.Client (client.models.generate_content / generate_images)."""
+
+    def __init__(self, simulator: _Simulator | None = None):
+        self.models = _FakeGenaiModels(simulator or get_simulator())
+
+
+# ── anthropic ───────────────────────────────────────────────────
+
+def _anthropic_error(outcome: str) -> Exception:
+    import anthropic
+    import httpx
+
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    if outcome == "rate_limited":
+        response = httpx.Response(429, request=request, headers={"retry-after": str(RETRY_AFTER_SECONDS)})
+        return anthropic.RateLimitError("Simulated rate limit", response=response, body=None)
+    response = httpx.Response(529, request=request)
+    return anthropic.APIStatusError("Simulated overloaded_error", response=response, body=None)
+
+
+class _FakeStream:
+    CHUNKS = 20
+
+    def __init__(self, sim: _Simulator, prompt: str):
+        self._sim = sim
+        self._prompt = prompt
+        self._text = json.dumps(_engineering_result(), ensure_ascii=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        delay = self._sim.latency("claude") / self.CHUNKS
+        outcome = self._sim.outcome()
+        size = math.ceil(len(self._text) / self.CHUNKS)
+        for i in range(self.CHUNKS):
+            time.sleep(delay)
+            if outcome != "ok" and i == self.CHUNKS // 2:
+                raise _anthropic_error(outcome)  # mid-stream, as overloads usually surface
+            yield self._text[i * size:(i + 1) * size]
+
+    def get_final_message(self):
+        return _Obj(usage=_Obj(input_tokens=_tokens(self._prompt), output_tokens=_tokens(self._text)))
+
+
+class _FakeMessages:
+    def __init__(self, sim: _Simulator):
+        self._sim = sim
+
+    def stream(self, model: str, max_tokens: int, messages: list, **kwargs):
+        prompt = "\n".join(
+            c.get("text", "") if isinstance(c, dict) else str(c)
+            for m in messages
+            for c in (m["content"] if isinstance(m["content"], list) else [m["content"]])
+        )
+        return _FakeStream(self._sim, prompt)
+
+
+class FakeAnthropic:
+    """Stands in for anthropic.Anthropic (client.messages.stream)."""
+
+    def __init__(self, api_key: str | None = None, simulator: _Simulator | None = None):
+        self.messages = _FakeMessages(simulator or get_simulator())
@@ -2,8 +2,24 @@
 import os
 from google import genai
 
+from utils.cassettes import CassetteGenaiClient, cassette_mode
+from utils.fake_models import FakeGenaiClient, fake_models_enabled
+
 
 def get_genai_client() -> genai.Client:
+    if fake_models_enabled():
+        # Simulated responses for load tests (utils/fake_models.py)
+        return FakeGenaiClient()
+    mode = cassette_mode()
+    if mode == "replay":
+        # Recorded responses, no keys needed (utils/cassettes.py)
+        return CassetteGenaiClient()
+
+    client = _create_client()
+    return CassetteGenaiClient(client) if mode == "record" else client
+
+
+def _create_client() -> genai.Client:
     project = os.getenv("VERTEX_AI_PROJECT")
     location = os.getenv("VERTEX_AI_LOCATION", "us-central1")
 
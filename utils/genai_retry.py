@@ -1,21 +1,25 @@
 from __future__ import annotations
 
-import re
-import time
 from typing import Callable, TypeVar
 
 from google.genai.errors import ClientError
 
+from utils.usage_ledger import retry_scope
+
 T = TypeVar("T")
 
 
 def call_with_retry(fn: Callable[[], T], max_retries: int = 2) -> T:
     """
-    Retry Gemini calls on 429 RESOURCE_EXHAUSTED using server-provided retryDelay when present.
+    Retry Gemini calls on 429 RESOURCE_EXHAUSTED. There is no sleep here:
+    rate_limited() (utils/rate_limiter.py) has already paused the whole
+    provider:model bucket for the server's retryDelay, and the retry waits
+    that out when it acquires.
     """
     for attempt in range(max_retries + 1):
         try:
-            return fn()
+            with retry_scope(attempt):
+                return fn()
         except ClientError as e:
             msg = str(e)
             is_retryable = (
@@ -23,23 +27,5 @@ def call_with_retry(fn: Callable[[], T], max_retries: int = 2) -> T:
                 or "429" in msg
                 or "INVALID_ARGUMENT" in msg
             )
-            if not is_retryable:
-                raise
-
-            delay = _extract_retry_delay_seconds(msg) or 30
-            if attempt == max_retries:
+            if not is_retryable or attempt == max_retries:
                 raise
-            time.sleep(delay)
-
-
-def _extract_retry_delay_seconds(text: str) -> int | None:
-    # Examples in errors:
-    # - "retryDelay': '26s'"
-    # - "Please retry in 26.0397s."
-    m = re.search(r"retryDelay'\s*:\s*'(\d+)s'", text)
-    if m:
-        return int(m.group(1))
-    m = re.search(r"retry in\s+(\d+)", text, flags=re.IGNORECASE)
-    if m:
-        return int(m.group(1))
-    return None
@@ -0,0 +1,309 @@
+"""
+Content-addressed on-disk cache for model calls.
+
+The key is a SHA-256 over the agent name, model, full request contents
+(image bytes included, by hash), generation config (response schemas by their
+JSON schema) and CACHE_VERSION. Prompt files are read into the contents, so
+editing a prompt changes the key. Entries live in LLM_CACHE_DIR as
+<key[:2]>/<key>.json and are evicted when older than LLM_CACHE_TTL_SECONDS or,
+least recently used first, once the store exceeds LLM_CACHE_MAX_MB.
+
+Off by default -- a cached build returns the same output for the same prompt.
+Enable with:
+    LLM_CACHE=1                     every agent
+    LLM_CACHE=pm,planner,scorer     only these agents
+    LLM_CACHE_EXCLUDE=engineer      opt agents out of the above
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+from pydantic import BaseModel
+
+from utils.rate_limiter import estimate_tokens, gemini_usage, rate_limited
+from utils.tracing import span
+
+T = TypeVar("T")
+
+# Bump when the shape of cached values changes
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "cache" / "llm"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_MB = 512
+
+
+def _canonical(value: Any) -> Any:
+    """JSON-able, order-stable view of a request: bytes -> sha256, schemas -> JSON schema."""
+    if isinstance(value, bytes):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        return {"schema": value.model_json_schema()}
+    if isinstance(value, BaseModel):
+        return _canonical(value.model_dump(exclude_none=True))
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def _env_list(name: str) -> set[str]:
+    return {a.strip().lower() for a in os.getenv(name, "").split(",") if a.strip()}
+
+
+class LLMCache:
+    def __init__(self, root: Path | None = None, ttl_seconds: float | None = None, max_bytes: int | None = None):
+        self.root = Path(root or os.getenv("LLM_CACHE_DIR") or DEFAULT_CACHE_DIR)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._size: int | None = None  # bytes on disk, computed on first put
+        self._stats: dict[str, dict[str, int]] = {}
+
+    # ── configuration ───────────────────────────────────────────
+
+    def enabled_for(self, agent: str) -> bool:
+        setting = os.getenv("LLM_CACHE", "").strip().lower()
+        if setting in ("", "0", "false", "no", "off"):
+            return False
+        if agent.lower() in _env_list("LLM_CACHE_EXCLUDE"):
+            return False
+        if setting in ("1", "true", "yes", "on", "all"):
+            return True
+        return agent.lower() in _env_list("LLM_CACHE")
+
+    # ── keys and entries ────────────────────────────────────────
+
+    @staticmethod
+    def key(agent: str, model: str, contents: Any, config: Any = None, sample: int = 0) -> str:
+        """`sample` keeps repeated draws of the same request apart (e.g. averaged scoring runs)."""
+        payload = {
+            "v": CACHE_VERSION,
+            "agent": agent,
+            "model": model,
+            "contents": _canonical(contents),
+            "config": _canonical(config),
+            "sample": sample,
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _count(self, agent: str, field: str) -> None:
+        with self._lock:
+            self._stats.setdefault(agent, {"hits": 0, "misses": 0})[field] += 1
+
+    def get(self, key: str, agent: str = "default") -> dict | None:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._count(agent, "misses")
+            return None
+        if self.ttl_seconds and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            self._remove(path)
+            self._count(agent, "misses")
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-access time for LRU eviction
+        except OSError:
+            pass
+        self._count(agent, "hits")
+        return entry.get("value")
+
+    def put(self, key: str, value: dict) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"created_at": time.time(), "value": value}, ensure_ascii=False)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(data, encoding="utf-8")
+        tmp.replace(path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(p.stat().st_size for p in self.root.glob("*/*.json"))
+            else:
+                self._size += len(data.encode("utf-8"))
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _remove(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until under 90% of max size."""
+        entries = []
+        for p in self.root.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds else None
+        removed = 0
+        for mtime, size, p in entries:
+            if total <= target and (cutoff is None or mtime >= cutoff):
+                continue
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._size = total
+        if removed:
+            print(f"[LLMCache] Evicted {removed} entries ({total // 1024} KB left)")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_agent = {a: dict(s) for a, s in self._stats.items()}
+        hits = sum(s["hits"] for s in per_agent.values())
+        misses = sum(s["misses"] for s in per_agent.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "agents": per_agent,
+        }
+
+
+_cache: LLMCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+def cached_call(
+    agent: str,
+    key: str,
+    call: Callable[[], T],
+    encode: Callable[[T], dict | None],
+    decode: Callable[[dict], T],
+) -> T:
+    """
+    Return decode(cached value) on a hit; otherwise run `call()` and store
+    encode(result). `encode` returns None for results that must not be
+    cached (empty or unparseable responses).
+    """
+    cache = get_llm_cache()
+    if not cache.enabled_for(agent):
+        return call()
+    value = cache.get(key, agent)
+    if value is not None:
+        with span("llm_cache_hit", agent=agent):
+            return decode(value)
+    result = call()
+    encoded = encode(result)
+    if encoded is not None:
+        cache.put(key, encoded)
+    return result
+
+
+class CachedResponse:
+    """The parts of a GenerateContentResponse the agents read."""
+
+    def __init__(self, text: str, parsed: Any = None):
+        self.text = text
+        self.parsed = parsed
+        self.usage_metadata = None
+
+
+def _parse_cached(text: str, config: Any) -> Any:
+    schema = config.get("response_schema") if isinstance(config, dict) else None
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        try:
+            return schema.model_validate_json(text)
+        except ValueError:
+            return None
+    return None
+
+
+def cached_generate_content(
+    client,
+    agent: str,
+    model: str,
+    contents: Any,
+    config: Any = None,
+    sample: int = 0,
+    validate: Callable[[str], Any] | None = None,
+):
+    """
+    Drop-in for client.models.generate_content(), rate limited on a miss
+    (utils/rate_limiter.py). Only responses with text
+    (and, for a response_schema, a parsed result; for `validate`, one it
+    accepts) are stored, so a bad response is never replayed.
+    """
+    def _encode(response) -> dict | None:
+        text = getattr(response, "text", None)
+        if not text:
+            return None
+        schema = config.get("response_schema") if isinstance(config, dict) else None
+        if schema is not None and getattr(response, "parsed", None) is None:
+            return None
+        if validate is not None:
+            try:
+                validate(text)
+            except Exception:
+                return None
+        return {"text": text}
+
+    return cached_call(
+        agent,
+        LLMCache.key(agent, model, contents, config, sample),
+        lambda: rate_limited(
+            "gemini", model,
+            lambda: client.models.generate_content(model=model, contents=contents, config=config),
+            tokens=estimate_tokens(contents),
+            usage=gemini_usage,
+            agent=agent,
+        ),
+        _encode,
+        lambda value: CachedResponse(value["text"], _parse_cached(value["text"], config)),
+    )
+
+
+def cached_image_bytes(agent: str, model: str, prompt: str, config: Any, call: Callable[[], bytes]) -> bytes:
+    """Cache a generated image (e.g. Imagen) by prompt + config."""
+    return cached_call(
+        agent,
+        LLMCache.key(agent, model, prompt, config),
+        call,
+        lambda data: {"image_b64": base64.b64encode(data).decode("ascii")} if data else None,
+        lambda value: base64.b64decode(value["image_b64"]),
+    )
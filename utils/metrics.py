@@ -0,0 +1,155 @@
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+A tiny registry (counters, gauges, histograms with labels) so the backend
+needs no metrics dependency. backend/app.py serves render() at /api/metrics.
+Each process keeps its own numbers: scrape worker.py hosts separately if
+they run builds.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Iterable
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """For totals kept elsewhere (e.g. cache stats) and copied in at scrape time."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        lines = self._header()
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {values[-1]}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{plain} {_format_value(round(values[-2], 6))}")
+            lines.append(f"{self.name}_count{plain} {values[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "pipeline_stage_duration_seconds", "Wall time of each pipeline stage.", ["stage", "outcome"],
+))
+MODEL_CALL_DURATION = REGISTRY.register(Histogram(
+    "model_call_duration_seconds", "Latency of model API calls (cache misses only).",
+    ["stage", "provider", "model", "outcome"],
+))
+BUILDS_TOTAL = REGISTRY.register(Counter(
+    "pipeline_builds_total", "Finished pipeline runs.", ["outcome"],
+))
+LLM_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "llm_cache_requests_total", "Model-call cache lookups.", ["agent", "result"],
+))
+RATE_LIMIT_WAIT = REGISTRY.register(Counter(
+    "rate_limiter_wait_seconds_total", "Time spent waiting for model rate-limit buckets.",
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "pipeline_queue_depth", "Queued pipeline jobs, by lane.", ["lane"],
+))
+ACTIVE_PIPELINES = REGISTRY.register(Gauge(
+    "pipeline_active", "Pipelines running: claimed jobs cluster-wide, or running in this process.", ["scope"],
+))
@@ -0,0 +1,337 @@
+"""
+Shared rate limiter for model calls.
+
+Every Gemini, Imagen and Anthropic call acquires from a token bucket keyed by
+"<provider>:<model>" before it is sent, so concurrent pipelines (and the
+design agent's Imagen pool) queue up under the quota instead of discovering
+it through 429s. Each bucket has a requests-per-minute and a
+tokens-per-minute budget. Tokens are reserved from an estimate and settled
+against the reported usage once the response arrives.
+
+Buckets live in process memory by default. Set RATE_LIMIT_DB to a SQLite file
+to share them across processes (web tier + worker.py on one host).
+
+Limits default to DEFAULT_LIMITS; override with RATE_LIMITS, a JSON object of
+{"<provider>:<model>" or "<provider>:*": {"rpm": N, "tpm": N}}. A null value
+disables that budget.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, TypeVar
+
+from utils.metrics import MODEL_CALL_DURATION
+from utils.tracing import span
+from utils.usage_ledger import TokenUsage, gemini_token_usage, record_call
+
+T = TypeVar("T")
+
+DEFAULT_LIMITS = {
+    "gemini:*": {"rpm": 1000, "tpm": 1_000_000},
+    "imagen:*": {"rpm": 20, "tpm": None},
+    "anthropic:*": {"rpm": 50, "tpm": 400_000},
+}
+
+# Gemini bills an inline image at a flat token count
+IMAGE_TOKENS = 258
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    rpm: float | None = None
+    tpm: float | None = None
+
+
+def _limits_from_env() -> dict[str, RateLimit]:
+    raw = dict(DEFAULT_LIMITS)
+    override = os.getenv("RATE_LIMITS")
+    if override:
+        try:
+            raw.update(json.loads(override))
+        except ValueError as e:
+            print(f"[RateLimiter] Ignoring invalid RATE_LIMITS: {e}")
+    return {k: RateLimit(v.get("rpm"), v.get("tpm")) for k, v in raw.items() if v is not None}
+
+
+def estimate_tokens(contents: Any) -> int:
+    """Rough prompt size: ~4 characters per token, flat cost per image."""
+    if contents is None:
+        return 0
+    if isinstance(contents, str):
+        return len(contents) // 4
+    if isinstance(contents, (bytes, bytearray)):
+        return IMAGE_TOKENS
+    if isinstance(contents, dict):
+        if contents.get("type") == "image" or "inline_data" in contents:
+            return IMAGE_TOKENS
+        return sum(estimate_tokens(v) for v in contents.values())
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(v) for v in contents)
+    if getattr(contents, "inline_data", None) is not None:
+        return IMAGE_TOKENS
+    text = getattr(contents, "text", None)
+    return len(text) // 4 if isinstance(text, str) else 0
+
+
+def _refill(level: float, cap: float, elapsed: float) -> float:
+    return min(cap, level + elapsed * cap / 60.0)
+
+
+def _take(state: dict, limit: RateLimit, tokens: int, now: float) -> float:
+    """
+    Try to take one request and `tokens` from `state` (mutated in place).
+    Returns 0 on success, otherwise the seconds to wait before retrying.
+    """
+    elapsed = max(0.0, now - state["updated_at"])
+    state["updated_at"] = now
+    if limit.rpm:
+        state["requests"] = _refill(state["requests"], limit.rpm, elapsed)
+    if limit.tpm:
+        state["tokens"] = _refill(state["tokens"], limit.tpm, elapsed)
+    if state["blocked_until"] > now:
+        return state["blocked_until"] - now
+
+    # A request larger than the whole budget waits for a full bucket, then goes
+    tokens = min(tokens, limit.tpm) if limit.tpm else 0
+    waits = []
+    if limit.rpm and state["requests"] < 1:
+        waits.append((1 - state["requests"]) * 60.0 / limit.rpm)
+    if limit.tpm and state["tokens"] < tokens:
+        waits.append((tokens - state["tokens"]) * 60.0 / limit.tpm)
+    if waits:
+        return max(waits)
+    if limit.rpm:
+        state["requests"] -= 1
+    if limit.tpm:
+        state["tokens"] -= tokens
+    return 0.0
+
+
+class MemoryBucketStore:
+    """Buckets shared by every thread of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: dict[str, dict] = {}
+
+    def _state(self, key: str, limit: RateLimit, now: float) -> dict:
+        if key not in self._buckets:
+            self._buckets[key] = {
+                "requests": limit.rpm or 0, "tokens": limit.tpm or 0,
+                "updated_at": now, "blocked_until": 0.0,
+            }
+        return self._buckets[key]
+
+    def take(self, key: str, limit: RateLimit, tokens: int) -> float:
+        now = time.time()
+        with self._lock:
+            return _take(self._state(key, limit, now), limit, tokens, now)
+
+    def adjust(self, key: str, limit: RateLimit, tokens: int) -> None:
+        with self._lock:
+            self._state(key, limit, time.time())["tokens"] -= tokens
+
+    def block(self, key: str, limit: RateLimit, until: float) -> None:
+        with self._lock:
+            state = self._state(key, limit, time.time())
+            state["blocked_until"] = max(state["blocked_until"], until)
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file, shared by every process that points at it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "key TEXT PRIMARY KEY, requests REAL, tokens REAL, "
+                "updated_at REAL, blocked_until REAL)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _update(self, key: str, limit: RateLimit, fn: Callable[[dict, float], Any]) -> Any:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # serialize read-modify-write across processes
+            now = time.time()
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at, blocked_until FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                state = dict(zip(("requests", "tokens", "updated_at", "blocked_until"), row))
+            else:
+                state = {"requests": limit.rpm or 0, "tokens": limit.tpm or 0, "updated_at": now, "blocked_until": 0.0}
+            result = fn(state, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, requests, tokens, updated_at, blocked_until) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, state["requests"], state["tokens"], state["updated_at"], state["blocked_until"]),
+            )
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def take(self, key: str, limit: RateLimit, tokens: int) -> float:
+        return self._update(key, limit, lambda state, now: _take(state, limit, tokens, now))
+
+    def adjust(self, key: str, limit: RateLimit, tokens: int) -> None:
+        def _adjust(state, now):
+            state["tokens"] -= tokens
+        self._update(key, limit, _adjust)
+
+    def block(self, key: str, limit: RateLimit, until: float) -> None:
+        def _block(state, now):
+            state["blocked_until"] = max(state["blocked_until"], until)
+        self._update(key, limit, _block)
+
+
+class Reservation:
+    def __init__(self, limiter: "RateLimiter", key: str, limit: RateLimit | None, tokens: int):
+        self.limiter = limiter
+        self.key = key
+        self.limit = limit
+        self.tokens = tokens
+
+    def settle(self, actual_tokens: int | None) -> None:
+        """Charge (or refund) the difference between the estimate and real usage."""
+        if self.limit is None or not self.limit.tpm or actual_tokens is None:
+            return
+        delta = actual_tokens - self.tokens
+        if delta:
+            self.limiter.store.adjust(self.key, self.limit, delta)
+
+
+class RateLimiter:
+    def __init__(self, store=None, limits: dict[str, RateLimit] | None = None, max_sleep: float = 5.0):
+        self.store = store or MemoryBucketStore()
+        self.limits = limits if limits is not None else _limits_from_env()
+        self.max_sleep = max_sleep
+        self._waited = 0.0
+        self._lock = threading.Lock()
+
+    def limit_for(self, provider: str, model: str) -> RateLimit | None:
+        return self.limits.get(f"{provider}:{model}") or self.limits.get(f"{provider}:*")
+
+    def acquire(self, provider: str, model: str, tokens: int = 0) -> Reservation:
+        """Block until one request and `tokens` fit in the bucket for provider:model."""
+        key = f"{provider}:{model}"
+        limit = self.limit_for(provider, model)
+        if limit is None or not (limit.rpm or limit.tpm):
+            return Reservation(self, key, None, tokens)
+        while True:
+            wait = self.store.take(key, limit, tokens)
+            if wait <= 0:
+                return Reservation(self, key, limit, tokens)
+            with self._lock:
+                self._waited += min(wait, self.max_sleep)
+            time.sleep(min(wait, self.max_sleep))
+
+    def backoff(self, provider: str, model: str, seconds: float) -> None:
+        """After a 429, hold every caller of provider:model, not just the one that hit it."""
+        limit = self.limit_for(provider, model) or RateLimit()
+        self.store.block(f"{provider}:{model}", limit, time.time() + seconds)
+
+    @property
+    def seconds_waited(self) -> float:
+        with self._lock:
+            return self._waited
+
+
+_limiter: RateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                db = os.getenv("RATE_LIMIT_DB")
+                _limiter = RateLimiter(SQLiteBucketStore(db) if db else MemoryBucketStore())
+    return _limiter
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    msg = str(e)
+    return (
+        "429" in msg
+        or "RESOURCE_EXHAUSTED" in msg
+        or getattr(e, "status_code", None) == 429
+        or "rate_limit" in msg.lower()
+    )
+
+
+def _retry_after_seconds(e: Exception, default: float = 10.0) -> float:
+    msg = str(e)
+    m = re.search(r"retryDelay'\s*:\s*'(\d+)s'", msg) or re.search(r"retry in\s+(\d+)", msg, flags=re.IGNORECASE)
+    if m:
+        return float(m.group(1))
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
+
+
+def rate_limited(
+    provider: str,
+    model: str,
+    call: Callable[[], T],
+    tokens: int = 0,
+    usage: Callable[[T], TokenUsage | None] | None = None,
+    agent: str | None = None,
+) -> T:
+    """
+    Acquire, run `call`, then settle the token estimate with `usage(result)`.
+    The wait and the call are recorded as spans (utils/tracing.py), and the
+    call with its usage goes to the usage ledger (utils/usage_ledger.py).
+    A 429 pauses the whole bucket for the server's retry delay and re-raises,
+    leaving the retry itself to the caller's existing retry loop.
+    """
+    limiter = get_rate_limiter()
+    with span("rate_limit_wait", provider=provider, model=model):
+        reservation = limiter.acquire(provider, model, tokens)
+    start = time.perf_counter()
+    with span("model_call", metric=MODEL_CALL_DURATION, provider=provider, model=model) as s:
+        try:
+            result = call()
+        except Exception as e:
+            s["outcome"] = "rate_limited" if _is_rate_limit_error(e) else "error"
+            if s["outcome"] == "rate_limited":
+                limiter.backoff(provider, model, _retry_after_seconds(e))
+            record_call(provider, model, None, time.perf_counter() - start, s["outcome"], agent)
+            raise
+    latency = time.perf_counter() - start
+    call_usage = None
+    if usage is not None:
+        try:
+            call_usage = usage(result)
+        except Exception:
+            call_usage = None
+    if call_usage is not None:
+        reservation.settle(call_usage.total_tokens)
+    record_call(provider, model, call_usage, latency, "ok", agent)
+    return result
+
+
+def gemini_usage(response) -> TokenUsage | None:
+    return gemini_token_usage(response)
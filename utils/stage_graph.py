@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import concurrent.futures
+import contextvars
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One node of a pipeline graph.
+
+    - fn: zero-arg callable; its return value is stored under `name`
+    - depends_on: stages that must finish before this one starts
+    - required: if False, a failure is logged and dependents still run
+      (the stage's result is None)
+    """
+    name: str
+    fn: Callable[[], Any]
+    depends_on: tuple[str, ...] = ()
+    required: bool = True
+
+
+class StageGraph:
+    """
+    Runs stages as soon as their dependencies have finished. Independent
+    stages run concurrently on a thread pool, each in a copy of the caller's
+    context (so contextvars such as the active trace carry over).
+
+    When a required stage raises, no further stages are started; stages
+    already running are allowed to finish and the original exception is
+    re-raised from run().
+    """
+
+    def __init__(self, stages: Iterable[Stage], max_workers: int | None = None):
+        self.stages: dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage: {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+        self._check_acyclic()
+        self.max_workers = max_workers or len(self.stages) or 1
+
+    def _check_acyclic(self) -> None:
+        visiting: set[str] = set()
+        done: set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage graph has a cycle through '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def run(
+        self,
+        skip: Iterable[str] = (),
+        on_start: Callable[[str], None] | None = None,
+        on_finish: Callable[[str, BaseException | None], None] | None = None,
+    ) -> dict[str, Any]:
+        """
+        Execute the graph. Stages named in `skip` are treated as already
+        finished (their result is None). Returns {stage_name: result}.
+        """
+        results: dict[str, Any] = {name: None for name in skip if name in self.stages}
+        finished: set[str] = set(results)
+        pending = [name for name in self.stages if name not in finished]
+        failure: BaseException | None = None
+
+        def ready(name: str) -> bool:
+            return all(dep in finished for dep in self.stages[name].depends_on)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running: dict[concurrent.futures.Future, str] = {}
+            while pending or running:
+                if failure is None:
+                    for name in [n for n in pending if ready(n)]:
+                        pending.remove(name)
+                        if on_start:
+                            on_start(name)
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self.stages[name].fn)] = name
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    err = future.exception()
+                    if on_finish:
+                        on_finish(name, err)
+                    if err is None:
+                        results[name] = future.result()
+                    elif self.stages[name].required:
+                        failure = failure or err
+                        continue
+                    else:
+                        print(f"StageGraph: optional stage '{name}' failed (non-fatal): {err}")
+                        results[name] = None
+                    finished.add(name)
+
+        if failure is not None:
+            raise failure
+        return results
@@ -0,0 +1,118 @@
+"""
+Timing spans for a pipeline run.
+
+begin_trace() starts collecting spans for the current context. span()
+records the name, parent, start offset, duration, outcome and attributes
+of a block into the active trace, and optionally observes a metrics
+histogram with the same outcome. Context propagates through contextvars.
+Thread pools that run pipeline work (StageGraph, the design agent's Imagen
+pool) submit via contextvars.copy_context().run, so their spans nest under
+the stage that started them.
+
+A span with a "stage" attribute passes it down to nested spans, so model
+calls are labelled with the stage that made them. Outside a trace, span()
+still feeds metrics and costs next to nothing.
+"""
+from __future__ import annotations
+
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[int | None] = contextvars.ContextVar("span", default=None)
+_current_stage: contextvars.ContextVar[str | None] = contextvars.ContextVar("stage", default=None)
+
+_span_ids = itertools.count(1)
+
+# A runaway retry loop must not grow a trace without bound
+MAX_SPANS_PER_TRACE = 2000
+
+
+class Trace:
+    def __init__(self, **attrs):
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._token: contextvars.Token | None = None
+        self.spans: list[dict] = []
+        self.dropped = 0
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append(record)
+            else:
+                self.dropped += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        return {
+            **self.attrs,
+            "started_at": self.started_at,
+            "duration_seconds": round(time.perf_counter() - self._t0, 4),
+            "spans": spans,
+            "dropped_spans": self.dropped,
+        }
+
+
+def begin_trace(**attrs) -> Trace:
+    """Collect spans of this context into a new trace; pair with end_trace()."""
+    trace = Trace(**attrs)
+    trace._token = _current_trace.set(trace)
+    return trace
+
+
+def end_trace(trace: Trace) -> dict:
+    if trace._token is not None:
+        _current_trace.reset(trace._token)
+        trace._token = None
+    return trace.to_dict()
+
+
+def current_stage() -> str | None:
+    return _current_stage.get()
+
+
+@contextmanager
+def span(name: str, metric=None, **attrs) -> Iterator[dict]:
+    """
+    Time the block. Yields the attribute dict: the block may add attributes
+    or set "outcome" (default "ok", or "error" if it raises).
+    """
+    trace = _current_trace.get()
+    span_id = next(_span_ids)
+    parent = _current_span.get()
+    span_token = _current_span.set(span_id)
+    stage_token = _current_stage.set(attrs["stage"]) if "stage" in attrs else None
+    if "stage" not in attrs and _current_stage.get() is not None:
+        attrs["stage"] = _current_stage.get()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException:
+        attrs["outcome"] = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(span_token)
+        if stage_token is not None:
+            _current_stage.reset(stage_token)
+        attrs.setdefault("outcome", "ok")
+        if metric is not None:
+            labels = {n: attrs.get(n, "none") for n in metric.labelnames}
+            metric.observe(duration, **labels)
+        if trace is not None:
+            trace.add({
+                "id": span_id,
+                "parent": parent,
+                "name": name,
+                "start": round(start - trace._t0, 4),
+                "duration": round(duration, 4),
+                **attrs,
+            })
@@ -0,0 +1,216 @@
+"""
+Per-call token and cost ledger.
+
+rate_limited() (utils/rate_limiter.py) reports every model call that reaches a
+provider here. Each report carries the provider, model, input/output tokens,
+images, latency, outcome and retry number. A UsageLedger started with
+begin_ledger() collects the calls made in its context, including StageGraph
+and Imagen pool threads, tagged with the current pipeline stage. The backend
+persists the collected rows to the model_usage table and derives the
+execution's tokens, cost and credits from them.
+
+Prices are USD per million tokens and per image. Override or extend
+DEFAULT_PRICES with MODEL_PRICES, a JSON object of
+{"<model>": {"input": N, "output": N, "image": N}}. A model missing from the
+table is charged by its family prefix ("gemini", "claude", "imagen").
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterator, NamedTuple
+
+from utils.tracing import current_stage
+
+DEFAULT_PRICES = {
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.00},
+    "claude-opus-4-6": {"input": 5.00, "output": 25.00},
+    "imagen-4.0-ultra-generate-001": {"image": 0.06},
+    "imagen-4.0-generate-001": {"image": 0.04},
+    # Family fallbacks
+    "gemini": {"input": 0.30, "output": 2.50},
+    "claude": {"input": 5.00, "output": 25.00},
+    "imagen": {"image": 0.04},
+}
+
+# 1 credit = 2500 tokens; each generated image costs IMAGE_CREDITS
+TOKENS_PER_CREDIT = 2500
+IMAGE_CREDITS = 1
+
+
+class TokenUsage(NamedTuple):
+    input_tokens: int = 0
+    output_tokens: int = 0
+    images: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+@dataclass
+class UsageRecord:
+    provider: str
+    model: str
+    stage: str | None
+    agent: str | None
+    input_tokens: int
+    output_tokens: int
+    images: int
+    latency_seconds: float
+    retry: int
+    outcome: str
+    cost_usd: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _prices() -> dict:
+    prices = dict(DEFAULT_PRICES)
+    override = os.getenv("MODEL_PRICES")
+    if override:
+        try:
+            prices.update(json.loads(override))
+        except ValueError as e:
+            print(f"[UsageLedger] Ignoring invalid MODEL_PRICES: {e}")
+    return prices
+
+
+def price_for(model: str) -> dict:
+    prices = _prices()
+    if model in prices:
+        return prices[model]
+    family = next((f for f in ("gemini", "claude", "imagen") if f in (model or "").lower()), None)
+    return prices.get(family, {})
+
+
+def cost_usd(model: str, usage: TokenUsage) -> float:
+    price = price_for(model)
+    cost = (
+        usage.input_tokens * price.get("input", 0) / 1_000_000
+        + usage.output_tokens * price.get("output", 0) / 1_000_000
+        + usage.images * price.get("image", 0)
+    )
+    return round(cost, 6)
+
+
+def credits_for(total_tokens: int, images: int) -> int:
+    return max(1, round(total_tokens / TOKENS_PER_CREDIT) + images * IMAGE_CREDITS)
+
+
+# ── collection ──────────────────────────────────────────────────
+
+_current_ledger: contextvars.ContextVar["UsageLedger | None"] = contextvars.ContextVar("usage_ledger", default=None)
+_retry: contextvars.ContextVar[int] = contextvars.ContextVar("usage_retry", default=0)
+
+
+class UsageLedger:
+    def __init__(self, stage: str | None = None):
+        self.default_stage = stage  # for calls made outside a pipeline stage (e.g. intent classification)
+        self._lock = threading.Lock()
+        self._token: contextvars.Token | None = None
+        self.records: list[UsageRecord] = []
+
+    def add(self, record: UsageRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def snapshot(self) -> list[UsageRecord]:
+        with self._lock:
+            return list(self.records)
+
+    def summary(self) -> dict:
+        return summarize(self.snapshot())
+
+
+def summarize(records: list) -> dict:
+    """Totals over UsageRecords (or rows with the same fields), by stage and by model."""
+    totals = {"input_tokens": 0, "output_tokens": 0, "images": 0, "cost_usd": 0.0, "calls": 0, "retries": 0}
+    by_stage: dict[str, dict] = {}
+    by_model: dict[str, dict] = {}
+    for r in records:
+        for bucket in (totals,
+                       by_stage.setdefault(r.stage or "other", {"calls": 0, "tokens": 0, "images": 0, "cost_usd": 0.0}),
+                       by_model.setdefault(r.model, {"calls": 0, "tokens": 0, "images": 0, "cost_usd": 0.0})):
+            bucket["calls"] += 1
+            bucket["cost_usd"] += r.cost_usd or 0.0
+            bucket["images"] += r.images or 0
+            if "tokens" in bucket:
+                bucket["tokens"] += (r.input_tokens or 0) + (r.output_tokens or 0)
+        totals["input_tokens"] += r.input_tokens or 0
+        totals["output_tokens"] += r.output_tokens or 0
+        totals["retries"] += 1 if r.retry else 0
+    for bucket in [totals, *by_stage.values(), *by_model.values()]:
+        bucket["cost_usd"] = round(bucket["cost_usd"], 6)
+    totals["tokens"] = totals["input_tokens"] + totals["output_tokens"]
+    totals["credits"] = credits_for(totals["tokens"], totals["images"])
+    return {**totals, "by_stage": by_stage, "by_model": by_model}
+
+
+def begin_ledger(stage: str | None = None) -> UsageLedger:
+    """Collect model calls made in this context; pair with end_ledger()."""
+    ledger = UsageLedger(stage)
+    ledger._token = _current_ledger.set(ledger)
+    return ledger
+
+
+def end_ledger(ledger: UsageLedger) -> list[UsageRecord]:
+    if ledger._token is not None:
+        _current_ledger.reset(ledger._token)
+        ledger._token = None
+    return ledger.snapshot()
+
+
+@contextmanager
+def retry_scope(attempt: int) -> Iterator[None]:
+    """Calls inside are retry number `attempt` (added to any enclosing retry loop's)."""
+    token = _retry.set(_retry.get() + attempt)
+    try:
+        yield
+    finally:
+        _retry.reset(token)
+
+
+def record_call(provider: str, model: str, usage: TokenUsage | None, latency_seconds: float,
+                outcome: str = "ok", agent: str | None = None) -> UsageRecord | None:
+    ledger = _current_ledger.get()
+    if ledger is None:
+        return None
+    usage = usage or TokenUsage()
+    record = UsageRecord(
+        provider=provider,
+        model=model,
+        stage=current_stage() or ledger.default_stage,
+        agent=agent,
+        input_tokens=usage.input_tokens,
+        output_tokens=usage.output_tokens,
+        images=usage.images,
+        latency_seconds=round(latency_seconds, 4),
+        retry=_retry.get(),
+        outcome=outcome,
+        cost_usd=cost_usd(model, usage),
+    )
+    ledger.add(record)
+    return record
+
+
+# ── provider response adapters ──────────────────────────────────
+
+def gemini_token_usage(response) -> TokenUsage | None:
+    meta = getattr(response, "usage_metadata", None)
+    if not meta:
+        return None
+    output = (getattr(meta, "candidates_token_count", 0) or 0) + (getattr(meta, "thoughts_token_count", 0) or 0)
+    return TokenUsage(getattr(meta, "prompt_token_count", 0) or 0, output)
+
+
+def anthropic_token_usage(usage) -> TokenUsage | None:
+    if not usage:
+        return None
+    return TokenUsage(getattr(usage, "input_tokens", 0) or 0, getattr(usage, "output_tokens", 0) or 0)